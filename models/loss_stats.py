@@ -1,46 +1,25 @@
 import sys
 import os
 import matplotlib.pyplot as plt
-from collections import defaultdict
-import pprint
 
 import model_constants
+# trial averaging is shared with the analysis scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+import trials
 
 def compute_average_hist(loss_bursts):
-    average_loss_bursts = defaultdict(int)
-    for hist in loss_bursts:
-        for length in hist:
-            average_loss_bursts[length] += hist[length]
-    
-    to_del = []
-    for length in average_loss_bursts:
-        average_loss_bursts[length] = int(average_loss_bursts[length] / len(loss_bursts))
-        if (average_loss_bursts[length] == 0):
-            to_del.append(length)
-    for length in to_del:
-        average_loss_bursts.pop(length, None)
-    
-    return average_loss_bursts
+    """
+    Average of the burst histograms of some runs, see trials.average_hist
+    """
+    return trials.average_hist(loss_bursts)
 
 def compute_average_timescale(loss_timescales):
-    time_buckets = []
-    average_data_buckets = []
-    for buckets in loss_timescales:
-        for i in range(0, len(buckets[1])):
-            if i >= len(average_data_buckets):
-                # first one so can just append
-                average_data_buckets.append(buckets[1][i])
-            else:
-                average_data_buckets[i] += buckets[1][i]
-
-            if i >= len(time_buckets):
-                # first one so can just append
-                time_buckets.append(buckets[0][i])
-
-    for i in range(0, len(average_data_buckets)):
-        average_data_buckets[i] = int(average_data_buckets[i] / len(loss_timescales))
-
-    return (time_buckets, average_data_buckets)
+    """
+    Average losses per bucket over the (time buckets, losses) of some runs
+    """
+    stacked = trials.stack_trials([data_buckets for (_, data_buckets) in loss_timescales])
+    time_buckets = max([buckets for (buckets, _) in loss_timescales], key=len, default=[])
+    return (time_buckets, trials.trial_stats(stacked).mean)
 
 def graph_hist(loss_bursts, endpoint, name_pre, graph_dir):
     """
@@ -65,7 +44,7 @@ def graph_hist(loss_bursts, endpoint, name_pre, graph_dir):
         rect = g.patches[i]
         ax.text(rect.get_x() + rect.get_width()/2,
             rect.get_height() + height_space,
-            loss_bursts[keys[i]],
+            "{:.3g}".format(loss_bursts[keys[i]]),
             ha="center",
             va="bottom").set_fontsize(7)
 
@@ -178,6 +178,18 @@ def streaming_wrapper(ge_args):
                 run_streaming_simulation(ge_arg_set, m_arg_set, 
                     os.path.abspath("models/video_traces"), csv_path)
 
+def measured_ge_args(csv_path):
+    """
+    GEArgs fitted to our own dumps, from the name,p,r,k,h CSV written by
+    scripts/ge_fit.py
+    """
+    ge_args = []
+    with open(csv_path, newline="") as f:
+        for row in csv.reader(f):
+            name, p, r, k, h = row
+            ge_args.append(network_model.GEArgs(float(p), float(r), float(k), float(h), name))
+    return ge_args
+
 def run_simulations(args):
     """
     Runs all simulations
@@ -188,6 +200,8 @@ def run_simulations(args):
         network_model.GEArgs(0.0279, 0.209, 0.9944, 0.177, "Kumar2013_params_10"), 
         network_model.GEArgs(0.0461, 0.168, 0.9884, 0.108, "Kumar2013_params_20")
     ]
+    if args.measured is not None:
+        ge_args += measured_ge_args(args.measured)
     if args.overwrite:
         if args.baseline:
             for ge_arg_set in ge_args:
@@ -246,6 +260,8 @@ model_args.add_argument("-G", "--graph",
 required_args.add_argument("--overwrite",
     action="store_true",
     help="overwrite existing CSVs with new analyses results\n")
+parser.add_argument("--measured",
+    help="also simulate with the loss model parameters in this CSV, fitted by scripts/ge_fit.py\n")
 
 
 if __name__ == "__main__":
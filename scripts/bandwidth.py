@@ -1,83 +1,101 @@
 import argparse
 import csv
 import matplotlib.pyplot as plt
+import numpy as np
 import sys
 
+import executor
+import flows
+import segments
+from timescale import TimescalePyramid
+
 # Default values.
 bucketSize = 0.1
 srcPort = "62388"
 destPort = "5201"
 prefix = "K"
 #prefix = "M"
-
-# Constants on where the data is located.
-TIME_COL = 0
-SRCPORT_COL = 2
-DESTPORT_COL = 3
-LEN_COL = 6
-
-# Determines whether this message was between the given ports.
-# The order of the ports doesn't matter.
-# Note: 2 spaces between characters.
-def isBetweenPorts(row):
-	# See if the message is between src > dest.
-	if row[SRCPORT_COL] == srcPort and row[DESTPORT_COL] == destPort:
-		return True
-	return False
-	# if ("%s  >  %s" % (srcPort, destPort)) in info:
-	# 	return True
-
-	# # See if the message is between dest > src.
-	# if ("%s  >  %s" % (destPort, srcPort)) in info:
-	# 	return True
-
-	# return False
-
-# Determine if data is transferred by checking the info column
-# and looking at the Len of the message sent.
-# Non-zero Len is data transferred.
-def isDataTransferred(row):
-	length = int(row[LEN_COL])
-	if length > 0:
-		return True, length
-	return False, 0
-	# for infoField in info.split(" "):
-	# 	if "Len=" in infoField:
-	# 		lenInfo = infoField.split("=")
-	# 		# The amount of data is after the equals sign.
-	# 		return True, int(lenInfo[1])
-	# return False, 0
-
+# Header bytes counted for every MTU sized segment a payload went out as.
+# 0 gives goodput, e.g. 52 (IP + TCP with timestamps) bandwidth on the wire.
+headerBytes = 0
+
+# Determines whether each message was between the given ports.
+# The order of the ports matters, only src > dest is counted.
+def isBetweenPorts(trace, srcPort, destPort):
+	return (trace["srcport"] == int(srcPort)) & (trace["dstport"] == int(destPort))
+
+# Determine how much data is transferred by each message by looking at
+# the len of the message sent. Non-zero len is data transferred. TSO/GRO
+# payloads add the headers of every segment they were split into.
+def isDataTransferred(trace):
+	dataLen = trace["len"]
+	if headerBytes != 0:
+		dataLen = dataLen + headerBytes * segments.segment_counts(dataLen)
+	return trace["len"] > 0, dataLen
+
+
+# Running bandwidth buckets of one trace. Chunks of the trace are fed in time
+# order so a capture never has to be in memory all at once. Bucket edges are
+# whole microseconds (see timescale.time_buckets), so they don't drift over
+# long captures, and states of chunks (or trials) merge by adding them up.
+class BandwidthState:
+	def __init__(self, srcPort, destPort):
+		self.srcPort = srcPort
+		self.destPort = destPort
+		self.packets = 0
+
+		# Data between the ports per bucket, a single level pyramid.
+		self.dataPerBucket = TimescalePyramid([bucketSize])
+
+		# Data sent by every stream direction in the trace, not just the graphed one.
+		self.flowTable = flows.FlowTable()
+		self.flowBytes = np.zeros(0, dtype=np.int64)
+
+	def update(self, csvData):
+		# Sum the amount of data transferred, if it was between the ports.
+		isData, dataLen = isDataTransferred(csvData)
+		flowIds = self.flowTable.ids(flows.direction_keys(csvData["srcport"], csvData["dstport"]))
+		self.addFlowBytes(flowIds, np.where(isData, dataLen, 0))
+		dataLen = np.where(isBetweenPorts(csvData, self.srcPort, self.destPort) & isData, dataLen, 0)
+		times = csvData["time_relative"]
+
+		# Ignore first row (row 0).
+		if self.packets == 0:
+			times = times[1:]
+			dataLen = dataLen[1:]
+		self.packets += len(csvData)
+
+		self.dataPerBucket.update(times, dataLen.astype(np.int64))
+
+	def addFlowBytes(self, flowIds, lengths):
+		flowBytes = np.bincount(flowIds, weights=lengths,
+			minlength=len(self.flowTable.keys)).astype(np.int64)
+		flowBytes[:len(self.flowBytes)] += self.flowBytes
+		self.flowBytes = flowBytes
+
+	def merge(self, other):
+		if (other.srcPort, other.destPort) != (self.srcPort, self.destPort):
+			raise ValueError("can't merge bandwidth of different ports")
+		self.packets += other.packets
+		self.dataPerBucket.merge(other.dataPerBucket)
+		self.addFlowBytes(self.flowTable.ids(other.flowTable.keys), other.flowBytes)
+
+	# (bucket end times, data per bucket) of every bucket up to the one of the
+	# last packet, which may still be filling up and isn't counted.
+	def result(self):
+		buckets, dataPerBucketList = self.dataPerBucket.level(bucketSize)
+		return buckets[:-1].tolist(), dataPerBucketList[:-1].tolist()
+
+	# (src port, dest port) -> data bytes sent, for every stream direction seen.
+	def flowTotals(self):
+		return {(key >> 16, key & 0xffff): int(total)
+			for (key, total) in zip(self.flowTable.keys.tolist(), self.flowBytes.tolist())}
 
 def calculateBandwidth(csvData, srcPort, destPort):
 	print("Calculating bandwidth between port %s and port %s..." % (srcPort, destPort))
-
-	bucketI = 0
-	bucketStart = 0
-	nextBucket = bucketStart + bucketSize
-
-	buckets = []
-	dataPerBucketList = []
-	dataForBucket = 0
-
-	# Ignore title row (row 0).
-	for i in range(1, len(csvData)):
-		row = csvData[i]
-
-		# See if we are on the next bucket.
-		if float(row[TIME_COL]) >= nextBucket:
-			buckets.append(nextBucket)  # Append x-axis point.
-			nextBucket += bucketSize  # Go to next bucket.
-			dataPerBucketList.append(dataForBucket)  # Append y-axis point.
-			dataForBucket = 0  # Reset y-axis sum.
-
-		# Sum the amount of data transferred, if it was in this row.
-		if isBetweenPorts(row):
-			isData, dataLen = isDataTransferred(row)
-			if isData:
-				dataForBucket += dataLen  # Length of data transferred.
-
-	return buckets, dataPerBucketList
+	state = BandwidthState(srcPort, destPort)
+	state.update(csvData)
+	return state.result()
 
 # To get bandwidth, divide the data transferred in that bucket time range
 # by the size of that time range.
@@ -97,32 +115,49 @@ def divideByBuckets(buckets, dataPerBucketList, prefix):
 def plotBandwidth(buckets, bandwidthPerBucket, prefix, filename, graphDir):
 	print("Plotting bandwidth...")
 	filename_no_ext = filename.split(".")[0]
-	plt.plot(buckets, bandwidthPerBucket)
-	plt.xlabel("Time (in buckets of %0.2f seconds)" % bucketSize)
-	plt.ylabel("Bandwidth (in data %sB/second)" % prefix)
-	plt.title("Bandwidth vs. Time for file %s" % (filename_no_ext))
+	# Own figure for every file, a worker plotting several files would
+	# otherwise draw each one on top of the ones before.
+	fig, ax = plt.subplots()
+	ax.plot(buckets, bandwidthPerBucket)
+	ax.set_xlabel("Time (in buckets of %0.2f seconds)" % bucketSize)
+	ax.set_ylabel("Bandwidth (in data %sB/second)" % prefix)
+	ax.set_title("Bandwidth vs. Time for file %s" % (filename_no_ext))
 	graphfile = graphDir + "/" + filename_no_ext + ".png"
 	print("Saving figure to graph dir {} ...".format(graphDir))
-	plt.savefig(graphfile)
+	fig.savefig(graphfile)
+	plt.close(fig)
 	#plt.show()
 
 # Main.
-def getBandwidth(csvDataForFiles, graphDir):
-
-	for filename in csvDataForFiles:
-		print("Getting bandwidth calculations on file %s wtih bucket size %0.3f..." % (filename, bucketSize))
-
-		csvData = csvDataForFiles[filename]
-		print("Got CSV data, row 1 = ", csvData[1])
-
-		buckets, dataPerBucketList = calculateBandwidth(csvData, srcPort, destPort)
-		print("Separated bandwidth data into buckets...")
-
-		bandwidthPerBucket = divideByBuckets(buckets, dataPerBucketList, prefix)
-		print("Got bandwidth per bucket...")
-
-		plotBandwidth(buckets, bandwidthPerBucket, prefix, filename, graphDir)
-		print("Calculations on file %s complete." % filename)
+def bandwidthForFile(filename, csvData, graphDir):
+	print("Getting bandwidth calculations on file %s wtih bucket size %0.3f..." % (filename, bucketSize))
+
+	# Either a whole trace or the BandwidthState of one fed chunk by chunk.
+	if isinstance(csvData, BandwidthState):
+		print("Got trace, %d packets" % csvData.packets)
+		state = csvData
+	else:
+		print("Got trace, %d packets" % len(csvData))
+		print("Calculating bandwidth between port %s and port %s..." % (srcPort, destPort))
+		state = BandwidthState(srcPort, destPort)
+		state.update(csvData)
+	buckets, dataPerBucketList = state.result()
+	for ((src, dest), total) in sorted(state.flowTotals().items()):
+		if total > 0:
+			print("Flow %d > %d: %d data bytes" % (src, dest, total))
+	print("Separated bandwidth data into buckets...")
+
+	bandwidthPerBucket = divideByBuckets(buckets, dataPerBucketList, prefix)
+	print("Got bandwidth per bucket...")
+
+	plotBandwidth(buckets, bandwidthPerBucket, prefix, filename, graphDir)
+	print("Calculations on file %s complete." % filename)
+
+# Each file is worked on by its own process, up to workers at once.
+def getBandwidth(csvDataForFiles, graphDir, workers=1):
+	tasks = [(filename, (filename, csvDataForFiles[filename], graphDir))
+		for filename in sorted(csvDataForFiles)]
+	executor.run_tasks(tasks, bandwidthForFile, workers)
 
 # Command-line flags are defined here.
 # def parse_arguments():
@@ -1,5 +1,8 @@
 # GENERAL CONSTANTS
 BUCKET_SIZE = 0.1
+# resolutions (in seconds) of timescale.TimescalePyramid, each a multiple of
+# the first, BUCKET_SIZE has to be one of them
+TIMESCALE_RESOLUTIONS = [0.001, 0.01, 0.1, 1.0, 10.0]
 TIME_NAME = "Time"
 TIME_COL = 1
 INFO_NAME = "Info"
@@ -18,9 +21,17 @@ ACK_NUM_COL = 5
 DATA_LEN_COL = 6
 
 MTU = 1448
+# how ip ids advance over the segments of a TSO/GRO payload sent by each
+# endpoint, see segments.IP_ID_POLICIES
+CLIENT_IP_ID_POLICY = "same"
+SERVER_IP_ID_POLICY = "increment"
+# how far apart in seconds (relative time of each capture) a packet can be
+# sent and received, covering latency, reordering and the difference between
+# the start of the client and server captures
+LOSS_HORIZON = 10.0
 
-CLIENT_1_PORT = 62387
-CLIENT_2_PORT = 62388
+# connections are told apart by their client port (see flows.py), only the
+# server's is fixed
 SERVER_PORT = 5201
 
 PORT_START = 62387
@@ -0,0 +1,61 @@
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from helpers import group_files
+
+
+def dump_locations(dumpfiles):
+    """
+    dump file name -> location of every dump, the location being the
+    directory the dump is in (e.g. starbucks_120s)
+    """
+    return {os.path.basename(f): os.path.basename(os.path.dirname(os.path.abspath(f)))
+        for f in dumpfiles}
+
+def location_runs(file_to_data, locations):
+    """
+    Splits a catalog into units of work, one per client/server run of a
+    connection at a location. Returns sorted list of
+    ((location, conn #, run #), {endpoint: data}).
+    """
+    by_location = defaultdict(dict)
+    for (file_name, data) in file_to_data.items():
+        by_location[locations[file_name]][file_name] = data
+    units = []
+    for location in sorted(by_location):
+        runs = group_files(by_location[location], True)
+        for conn_no in sorted(runs):
+            for run_no in sorted(runs[conn_no]):
+                units.append(((location, conn_no, run_no), runs[conn_no][run_no]))
+    return units
+
+def complete_runs(units, endpoints=("client", "server")):
+    """
+    The units of location_runs that have a dump of every endpoint, the others
+    are skipped with a warning
+    """
+    complete = []
+    for (unit, run) in units:
+        missing = [e for e in endpoints if e not in run]
+        if len(missing) > 0:
+            print("Skipping {} connection {} run {}, no {} dump".format(
+                unit[0], unit[1], unit[2], " or ".join(missing)))
+        else:
+            complete.append((unit, run))
+    return complete
+
+def run_tasks(tasks, fn, workers=None):
+    """
+    Runs fn(*args) for every (key, args) in tasks, on a pool of workers
+    processes if there is more than one. Returns {key: result} in the order
+    of tasks whatever order they finish in, so merging the results is
+    deterministic.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(tasks) <= 1:
+        return {key: fn(*args) for (key, args) in tasks}
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        futures = [(key, pool.submit(fn, *args)) for (key, args) in tasks]
+        return {key: future.result() for (key, future) in futures}
@@ -0,0 +1,74 @@
+import numpy as np
+
+
+def connection_keys(srcport, dstport):
+    """
+    Key of the connection every packet belongs to, the same for both of its
+    directions: (lower port << 16) | higher port. A dump is between one
+    client and one server, so the ports are all of the 4-tuple that varies.
+    """
+    srcport = np.asarray(srcport, dtype=np.uint32)
+    dstport = np.asarray(dstport, dtype=np.uint32)
+    return (np.minimum(srcport, dstport) << 16) | np.maximum(srcport, dstport)
+
+def direction_keys(srcport, dstport):
+    """
+    Key of the stream direction every packet belongs to, (src port << 16) |
+    dst port
+    """
+    return (np.asarray(srcport, dtype=np.uint32) << 16) | np.asarray(dstport, dtype=np.uint32)
+
+def reverse_keys(keys):
+    """
+    direction_keys of the opposite directions
+    """
+    return ((keys & 0xffff) << 16) | (keys >> 16)
+
+class FlowTable:
+    """
+    Assigns flow ids to keys (e.g. connection_keys) in the order flows are
+    first seen, consistently across the chunks of a trace. The known keys
+    are kept sorted, so a chunk is reduced to its distinct keys with
+    np.unique and those are looked up with one binary search.
+    """
+    def __init__(self):
+        self.keys = np.zeros(0, dtype=np.uint32) # key of every flow id
+        self.sorted_keys = np.zeros(0, dtype=np.uint32)
+        self.sorted_ids = np.zeros(0, dtype=np.int64)
+
+    def ids(self, keys):
+        """
+        Flow id of every key, new keys get the next ids
+        """
+        keys = np.asarray(keys, dtype=np.uint32)
+        unique, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        pos = np.searchsorted(self.sorted_keys, unique)
+        known = pos < len(self.sorted_keys)
+        known[known] = self.sorted_keys[pos[known]] == unique[known]
+        unique_ids = np.empty(len(unique), dtype=np.int64)
+        unique_ids[known] = self.sorted_ids[pos[known]]
+
+        # number new flows in order of appearance
+        new = np.flatnonzero(~known)
+        new = new[np.argsort(first[new], kind="stable")]
+        unique_ids[new] = len(self.keys) + np.arange(len(new))
+        if len(new) > 0:
+            self.keys = np.concatenate((self.keys, unique[new]))
+            self.sorted_ids = np.argsort(self.keys, kind="stable")
+            self.sorted_keys = self.keys[self.sorted_ids]
+        return unique_ids[inverse.ravel()]
+
+def group_flows(ids):
+    """
+    Splits packets by flow id with one stable sort. Returns {flow id: indices
+    of its packets in capture order}, every index array is a view into the
+    same sorted order.
+    """
+    if len(ids) == 0:
+        return {}
+    order = np.argsort(ids, kind="stable")
+    sorted_ids = ids[order]
+    bounds = np.flatnonzero(np.diff(sorted_ids)) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [len(ids)]))
+    return {int(sorted_ids[s]): order[s:e] for (s, e) in zip(starts.tolist(), ends.tolist())}
@@ -0,0 +1,263 @@
+import argparse
+import csv
+import os
+import sys
+
+import numpy as np
+
+import helpers
+from executor import dump_locations, location_runs, complete_runs, run_tasks
+from loss_stats import get_lost_packets
+
+# GEArgs lives with the simulations
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models"))
+import network_model
+
+GOOD, BAD = 0, 1
+# packets run through the scans at once, bounds the memory of a fit
+FIT_CHUNK = 1 << 20
+# (p, r, k, h) EM starts from
+INITIAL_PARAMS = (0.01, 0.3, 0.999, 0.5)
+
+
+def _step_matrices(params):
+    """
+    M[o][i, j] = P(state i -> state j) * P(observing o in state j), for o
+    received (0) and lost (1)
+    """
+    p, r, k, h = params
+    trans = np.array([[1 - p, p], [r, 1 - r]])
+    success = np.clip([k, h], 1e-12, 1 - 1e-12)
+    emit = np.array([success, 1 - success])
+    return trans[None, :, :] * emit[:, None, :]
+
+def _projectors(mats):
+    """
+    Splits every M into its eigenvalues and projectors, so that M^n scaled
+    by its largest eigenvalue^n is first + (second eigenvalue / largest)^n
+    * second and powers are closed form instead of repeated products.
+    Returns (first projectors, second projectors, eigenvalue ratios, log of
+    the largest eigenvalues), one of each per M.
+    """
+    lams, vecs = np.linalg.eig(mats)
+    order = np.argsort(-np.abs(lams), axis=1)
+    lams = np.take_along_axis(lams, order, axis=1).real
+    vecs = np.take_along_axis(vecs, order[:, None, :], axis=2).real
+    inverse = np.linalg.inv(vecs)
+    first = vecs[:, :, 0, None] * inverse[:, None, 0, :]
+    second = vecs[:, :, 1, None] * inverse[:, None, 1, :]
+    return first, second, lams[:, 1] / lams[:, 0], np.log(lams[:, 0])
+
+def _prefix_products(mats):
+    """
+    Inclusive prefix products mats[0] @ ... @ mats[t] of an (n, 2, 2) array by
+    doubling, in log2(n) vectorized steps. Every product is scaled to sum to
+    1, the log of what it was scaled by is returned alongside.
+    """
+    scale = mats.sum(axis=(1, 2))
+    prods = mats / scale[:, None, None]
+    logs = np.log(scale)
+    step = 1
+    while step < len(mats):
+        joined = prods[:-step] @ prods[step:]
+        scale = joined.sum(axis=(1, 2))
+        prods[step:] = joined / scale[:, None, None]
+        logs[step:] = logs[:-step] + logs[step:] + np.log(scale)
+        step *= 2
+    return prods, logs
+
+def _suffix_products(mats):
+    """
+    Scaled suffix products mats[t] @ ... @ mats[n - 1], see _prefix_products
+    """
+    prods, logs = _prefix_products(mats[::-1].transpose(0, 2, 1))
+    return prods[::-1].transpose(0, 2, 1), logs[::-1]
+
+def _normalize(v):
+    return v / v.sum(axis=-1, keepdims=True)
+
+def _segment(lost, mats, alpha, beta):
+    """
+    Forward and backward state distributions of the packets of a stretch of
+    a loss bitmap given the distribution before it (alpha) and the backward
+    one after it (beta). The bitmap is run-length encoded: the products over
+    whole runs are scanned and the packets within a run are powers of its
+    one matrix. Returns (forward, backward, log likelihood of the stretch).
+    """
+    obs = lost.astype(np.int64)
+    starts = np.concatenate(([0], np.flatnonzero(obs[1:] != obs[:-1]) + 1))
+    lengths = np.diff(np.concatenate((starts, [len(obs)])))
+    run_obs = obs[starts]
+    run_of = np.repeat(np.arange(len(starts)), lengths)
+    offset = np.arange(len(obs)) - starts[run_of]
+
+    first, second, ratio, log_lam = _projectors(mats)
+    runs = first[run_obs] + (ratio[run_obs] ** lengths)[:, None, None] * second[run_obs]
+    prefix, prefix_logs = _prefix_products(runs)
+    suffix, _ = _suffix_products(runs)
+    # distributions right before and right after every run
+    before = _normalize(np.concatenate(([alpha], alpha @ prefix[:-1])))
+    after = _normalize(np.concatenate((suffix[1:] @ beta, [beta])))
+
+    # alpha_t = before @ M^(offset + 1), beta_t = M^(rest of the run) @ after
+    ratio = ratio[obs]
+    into = np.einsum("ri,rij->rj", before, first[run_obs])[run_of] \
+        + (ratio ** (offset + 1))[:, None] \
+        * np.einsum("ri,rij->rj", before, second[run_obs])[run_of]
+    rest = np.einsum("rij,rj->ri", first[run_obs], after)[run_of] \
+        + (ratio ** (lengths[run_of] - offset - 1))[:, None] \
+        * np.einsum("rij,rj->ri", second[run_obs], after)[run_of]
+
+    loglik = np.log((alpha @ prefix[-1]).sum()) + prefix_logs[-1] \
+        + (lengths * log_lam[run_obs]).sum()
+    return _normalize(into), _normalize(rest), loglik
+
+def _expected_counts(lost, params):
+    """
+    E step over one loss bitmap. Returns (expected transitions [i, j],
+    expected packets received in each state, expected packets in each
+    state, log likelihood). Long bitmaps are worked through in chunks: a
+    forward pass keeps the state distribution at every chunk start, the
+    backward pass then redoes each chunk from it.
+    """
+    p, r, k, h = params
+    mats = _step_matrices(params)
+    # the stationary distribution stands in for the state before the first
+    # packet, it stays stationary after one transition
+    alpha = _normalize(np.array([r, p]))
+    starts = list(range(0, len(lost), FIT_CHUNK))
+    alphas = []
+    loglik = 0.0
+    for start in starts:
+        alphas.append(alpha)
+        forward, _, ll = _segment(lost[start:start + FIT_CHUNK], mats, alpha, np.ones(2))
+        loglik += ll
+        alpha = forward[-1]
+
+    trans = np.zeros((2, 2))
+    received = np.zeros(2)
+    total = np.zeros(2)
+    beta = np.ones(2)
+    for (start, alpha) in reversed(list(zip(starts, alphas))):
+        chunk = lost[start:start + FIT_CHUNK]
+        forward, backward, _ = _segment(chunk, mats, alpha, beta)
+
+        gamma = _normalize(forward * backward)
+        received += gamma[~chunk].sum(axis=0)
+        total += gamma.sum(axis=0)
+
+        # transitions into every packet, from the chunk's incoming state for
+        # the first one except at the very start of the bitmap
+        step = mats[chunk.astype(np.int64)]
+        prev = np.concatenate(([alpha], forward[:-1]))
+        xi = prev[:, :, None] * step * backward[:, None, :]
+        xi /= xi.sum(axis=(1, 2))[:, None, None]
+        trans += xi[1:].sum(axis=0) if start == 0 else xi.sum(axis=0)
+
+        beta = _normalize(step[0] @ backward[0])
+    return trans, received, total, loglik
+
+def fit_ge(bitmaps, iterations=200, tol=1e-7, params=INITIAL_PARAMS):
+    """
+    Fits a Gilbert-Elliott model to bool loss bitmaps (True where a packet
+    was lost, e.g. the "lost" of loss_stats.get_lost_packets) by Baum-Welch.
+    The bitmaps are independent runs sharing the parameters. Returns (p, r,
+    k, h, log likelihood), where the good state is the one losing less.
+    """
+    bitmaps = [np.asarray(b, dtype=bool) for b in bitmaps if len(b) > 0]
+    if len(bitmaps) == 0:
+        raise ValueError("no packets to fit a loss model to")
+    last = -np.inf
+    for _ in range(iterations):
+        trans = np.zeros((2, 2))
+        received = np.zeros(2)
+        total = np.zeros(2)
+        loglik = 0.0
+        for lost in bitmaps:
+            t, rc, tt, ll = _expected_counts(lost, params)
+            trans += t
+            received += rc
+            total += tt
+            loglik += ll
+        rates = trans / np.maximum(trans.sum(axis=1, keepdims=True), 1e-300)
+        success = received / np.maximum(total, 1e-300)
+        params = (rates[GOOD, BAD], rates[BAD, GOOD], success[GOOD], success[BAD])
+        if loglik - last < tol * abs(loglik):
+            break
+        last = loglik
+
+    p, r, k, h = params
+    if h > k:
+        p, r, k, h = r, p, h, k
+    return p, r, k, h, loglik
+
+def run_bitmaps(run, direction):
+    """
+    Loss bitmap of one direction ("client" or "server" for the packets they
+    sent) of a client/server run of dumps
+    """
+    client_data, server_data = get_lost_packets(helpers.decode_dump(run["client"]),
+        helpers.decode_dump(run["server"]))
+    return (client_data if direction == "client" else server_data)["lost"]
+
+def fit_locations(test_dir, direction="server", workers=1):
+    """
+    Fits a model per location to every run under test_dir, the location
+    being the directory the dumps are in. Returns location -> GEArgs.
+    """
+    dumps = [os.path.join(curr_dir, f) for (curr_dir, dirs, files) in os.walk(test_dir)
+        for f in files if f.endswith(".zst")]
+    units = complete_runs(location_runs({os.path.basename(f): f for f in dumps},
+        dump_locations(dumps)))
+    bitmaps = run_tasks([(unit, (run, direction)) for (unit, run) in units],
+        run_bitmaps, workers)
+
+    if len(bitmaps) == 0:
+        print("No complete client/server runs under {}".format(test_dir))
+    ge_args = {}
+    for location in sorted(set(unit[0] for unit in bitmaps)):
+        print("Fitting loss model for {}...".format(location))
+        p, r, k, h, loglik = fit_ge([b for (unit, b) in bitmaps.items()
+            if unit[0] == location])
+        print("p {:.6g} r {:.6g} k {:.6g} h {:.6g} (log likelihood {:.1f})".format(
+            p, r, k, h, loglik))
+        ge_args[location] = network_model.GEArgs(p, r, k, h,
+            "{}_{}_measured".format(location, direction))
+    return ge_args
+
+def save_ge_args(ge_args, csv_path):
+    """
+    Writes name,p,r,k,h rows for the simulations to read back
+    """
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        for args in ge_args.values():
+            writer.writerow([args.args_name, args.p, args.r, args.g_s, args.b_s])
+
+def main(args):
+    ge_args = fit_locations(args.testdir, args.direction, args.jobs)
+    save_ge_args(ge_args, args.output)
+    print("Loss model parameters written to {}".format(args.output))
+
+formatter = lambda prog: argparse.HelpFormatter(prog, max_help_position=30)
+parser = argparse.ArgumentParser(prog="PROG",
+    description="Fits Gilbert-Elliott loss models to measured dumps",
+    usage="python ge_fit.py",
+    formatter_class=formatter)
+parser.add_argument("-T", "--testdir",
+    required=True,
+    help="directory of a test (e.g. test_dumps/concurrent_long), one directory per location in it\n")
+parser.add_argument("-o", "--output",
+    required=True,
+    help="CSV file to write the parameters to, for simulation.py --measured\n")
+parser.add_argument("-d", "--direction",
+    choices=["client", "server"],
+    default="server",
+    help="endpoint whose sent packets are modeled, defaults to server (lost on the way to the client)\n")
+parser.add_argument("-j", "--jobs",
+    type=int,
+    default=os.cpu_count() or 1,
+    help="number of processes finding lost packets, defaults to number of cores\n")
+
+if __name__ == "__main__":
+    main(parser.parse_args())
@@ -0,0 +1,128 @@
+import json
+import math
+import os
+
+import numpy as np
+
+HDR_FORMAT = 1
+
+
+class HdrHistogram:
+    """
+    Log-linear histogram in the style of HdrHistogram. Values are counted in
+    whole units of lowest seconds, every power of two range of them is split
+    into the same number of equal sub-buckets, so each value is kept to
+    significant_digits decimal digits from lowest up to highest in a few
+    thousand counters. Values above highest are counted as overflow.
+    Histograms with the same layout are merged by adding their counts.
+    """
+    def __init__(self, lowest=1e-6, highest=60.0, significant_digits=2):
+        self.lowest = lowest
+        self.highest = highest
+        self.significant_digits = significant_digits
+
+        # enough sub-buckets that one is at most 10^-digits of its values
+        self.sub_bucket_half_magnitude = int(math.ceil(math.log2(2 * 10 ** significant_digits))) - 1
+        self.sub_bucket_half_count = 1 << self.sub_bucket_half_magnitude
+        self.sub_bucket_mask = 2 * self.sub_bucket_half_count - 1
+        self.highest_unit = int(math.ceil(highest / lowest))
+        bucket_count = 1
+        while (2 * self.sub_bucket_half_count) << (bucket_count - 1) <= self.highest_unit:
+            bucket_count += 1
+        self.counts = np.zeros((bucket_count + 1) * self.sub_bucket_half_count, dtype=np.int64)
+        self.overflow = 0
+        self.count = 0
+
+    def layout(self):
+        return (self.lowest, self.highest, self.significant_digits)
+
+    def _indices(self, units):
+        # the power of two range every value falls in past the first, whose
+        # sub-buckets are one unit wide
+        magnitude = np.frexp((units | self.sub_bucket_mask).astype(np.float64))[1] - 1
+        buckets = magnitude - self.sub_bucket_half_magnitude
+        sub_buckets = units >> buckets
+        return (buckets << self.sub_bucket_half_magnitude) + sub_buckets
+
+    def update(self, values):
+        """
+        Counts values given in seconds
+        """
+        units = np.floor(np.asarray(values, dtype=np.float64) / self.lowest)
+        units = np.maximum(units, 0).astype(np.int64)
+        over = units > self.highest_unit
+        self.overflow += int(np.count_nonzero(over))
+        self.count += len(units)
+        units = units[~over]
+        self.counts += np.bincount(self._indices(units), minlength=len(self.counts))
+
+    def merge(self, other):
+        if other.layout() != self.layout():
+            raise ValueError("can't merge HDR histograms of different layouts")
+        self.counts += other.counts
+        self.overflow += other.overflow
+        self.count += other.count
+
+    def bucket_starts(self):
+        """
+        Lowest value (in seconds) of every counter and its width
+        """
+        index = np.arange(len(self.counts), dtype=np.int64)
+        buckets = np.maximum((index >> self.sub_bucket_half_magnitude) - 1, 0)
+        sub_buckets = np.where(index < 2 * self.sub_bucket_half_count, index,
+            (index & (self.sub_bucket_half_count - 1)) + self.sub_bucket_half_count)
+        return (sub_buckets << buckets) * self.lowest, (1 << buckets) * self.lowest
+
+    def quantiles(self, qs):
+        """
+        Estimated quantiles (0 <= q <= 1), the middle of the counter each
+        falls in, inf in the overflow and nan if empty
+        """
+        qs = np.asarray(qs, dtype=np.float64)
+        if self.count == 0:
+            return np.full(len(qs), np.nan)
+        starts, widths = self.bucket_starts()
+        values = np.concatenate((starts + widths / 2, [np.inf]))
+        cumulative = np.cumsum(np.concatenate((self.counts, [self.overflow])))
+        return values[np.searchsorted(cumulative, qs * (self.count - 1), side="right")]
+
+    def quantile(self, q):
+        return float(self.quantiles([q])[0])
+
+    def to_dict(self):
+        """
+        JSON-able form, only nonzero counters are kept
+        """
+        nonzero = np.flatnonzero(self.counts)
+        return {
+            "format": HDR_FORMAT,
+            "lowest": self.lowest,
+            "highest": self.highest,
+            "significant_digits": self.significant_digits,
+            "indices": nonzero.tolist(),
+            "counts": self.counts[nonzero].tolist(),
+            "overflow": self.overflow,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        if d.get("format") != HDR_FORMAT:
+            raise ValueError("unknown HDR histogram format {}".format(d.get("format")))
+        hist = cls(d["lowest"], d["highest"], d["significant_digits"])
+        hist.counts[np.array(d["indices"], dtype=np.int64)] = d["counts"]
+        hist.overflow = d["overflow"]
+        hist.count = int(hist.counts.sum()) + hist.overflow
+        return hist
+
+def save_hdr(hist, path):
+    """
+    Writes a histogram to path as JSON, so runs can be merged later
+    """
+    tmp_file = "{}.tmp".format(path)
+    with open(tmp_file, "w") as f:
+        json.dump(hist.to_dict(), f)
+    os.replace(tmp_file, path)
+
+def load_hdr(path):
+    with open(path) as f:
+        return HdrHistogram.from_dict(json.load(f))
@@ -3,7 +3,28 @@ import os
 import sys
 from collections import defaultdict
 
+import numpy as np
+
 import constants
+import pcap_reader
+
+def parse_dump_name(file_name):
+    """
+    Splits a dump name into (endpoint, endpoint #, run #)
+    """
+    f, pcap, zst = file_name.split(".")
+
+    # assumes files are named as location_duration_endpoint_run
+    l, d, e, r = f.split("_")
+
+    digit_i = -1
+    endpoint_no = ""
+    while e[digit_i].isdigit():
+        endpoint_no = e[digit_i] + endpoint_no
+        digit_i -= 1
+    endpoint_no = int(endpoint_no)
+    endpoint = str(e[0:(digit_i + 1)])
+    return endpoint, endpoint_no, r
 
 def group_files(file_to_csvrows, pair):
     """
@@ -18,19 +39,7 @@ def group_files(file_to_csvrows, pair):
         runs = defaultdict(list)
     for file_name in file_to_csvrows:
         if file_name.endswith(".zst"):
-            f, pcap, zst = file_name.split(".")
-            
-            # assumes files are named as location_duration_endpoint_run
-            l, d, e, r = f.split("_")
-
-            digit_i = -1
-            endpoint_no = ""
-            while e[digit_i].isdigit():
-                endpoint_no = e[digit_i] + endpoint_no
-                digit_i -= 1
-            endpoint_no = int(endpoint_no)
-            endpoint = str(e[0:(digit_i + 1)])
-
+            endpoint, endpoint_no, r = parse_dump_name(file_name)
             if pair:
                 if endpoint_no not in runs:
                     runs[endpoint_no] = {}
@@ -38,11 +47,18 @@ def group_files(file_to_csvrows, pair):
                     runs[endpoint_no][r] = {}
                 runs[endpoint_no][r][endpoint] = file_to_csvrows[file_name]
             else:
-                runs[e].append(file_to_csvrows[file_name])
+                runs[endpoint + str(endpoint_no)].append(file_to_csvrows[file_name])
 
     # sys.exit(0)
     return runs
 
+def load_entry(entry):
+    """
+    Data of a catalog entry, which is either the data itself or a function
+    loading it
+    """
+    return entry() if callable(entry) else entry
+
 def parseCSV(file):
     """
     Raw CSV parser, includes the table headers.
@@ -54,33 +70,6 @@ def parseCSV(file):
             csvData.append(row)
     return csvData
 
-def calculate_time_bucket_data(csvData, data_fn):
-    """
-    Plots data on time scale graph in buckets of BUCKET_SIZE
-    Uses data_fn argument to calculate data to be plotted on y axis
-    """
-    bucketStart = 0
-    nextBucket = bucketStart + constants.BUCKET_SIZE
-
-    time_buckets = []
-    data_buckets = []
-    curr_data_bucket = 0
-
-    # Ignore title row (row 0).
-    for i in range(1, len(csvData)):
-        row = csvData[i]
-
-        # See if we are on the next bucket.
-        if float(row[constants.TIME_COL]) >= nextBucket:
-            time_buckets.append(nextBucket)  # Append x-axis point.
-            nextBucket += constants.BUCKET_SIZE  # Go to next bucket.
-            data_buckets.append(curr_data_bucket)  # Append y-axis point.
-            curr_data_bucket = 0  # Reset y-axis sum.
-
-        curr_data_bucket += data_fn(row) # add to curr_data_bucket
-
-    return time_buckets, data_buckets
-    
 # removes pcap file after creating csv file
 def make_csv(pcapfile, csvfile, analysis_type):
     if not os.path.exists(os.path.dirname(csvfile)):
@@ -111,6 +100,38 @@ def make_csv(pcapfile, csvfile, analysis_type):
     os.system("rm {}".format(pcapfile))
     return csvfile
 
+# takes a .zst file, decompresses it in memory while decoding
+def decode_dump(zstfile, flow_filter=None):
+    """
+    Decodes the TCP packets of a dump matching flow_filter (see
+    pcap_reader.FlowFilter) with the built-in reader instead of tshark,
+    returns a trace (see pcap_reader.TRACE_DTYPE)
+    """
+    return pcap_reader.to_trace(
+        pcap_reader.read_trace(zstfile, flow_filter=flow_filter))
+
+def rows_to_trace(csvData):
+    """
+    Converts rows of a tshark CSV made by make_csv into a trace
+    """
+    trace = np.zeros(len(csvData), dtype=pcap_reader.TRACE_DTYPE)
+    for i, row in enumerate(csvData):
+        trace[i] = (
+            float(row[constants.REL_TIME_COL]),
+            int(row[constants.IP_ID_COL], 16),
+            int(row[constants.SRC_PORT_COL]),
+            int(row[constants.DST_PORT_COL]),
+            int(row[constants.SEQ_NUM_COL] or 0),
+            int(row[constants.ACK_NUM_COL] or 0),
+            int(row[constants.DATA_LEN_COL] or 0))
+    return trace
+
+def rows_to_rtts(csvData):
+    """
+    Converts rows of a tshark tcp.analysis.ack_rtt CSV into an array of RTTs
+    """
+    return np.array([float(row[0]) for row in csvData if len(row) > 0], dtype=np.float64)
+
 # takes a .zst file, doesn't remove the compressed version
 def decompress(zstfile):
     pcapfile = zstfile.split(".zst")[0]
@@ -0,0 +1,68 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+import pcap_reader
+
+# smallest record a dump can hold (pcap record header + minimum Ethernet
+# frame), used to bound how many packets a capture of some size can contain
+MIN_RECORD_SIZE = 16 + 60
+COLUMN_BYTES = sum(np.dtype(d).itemsize for d in pcap_reader.FIELD_DTYPES.values())
+# per packet temporaries of pcap_reader.decode_records (record offsets and
+# header fields, mostly int64)
+DECODE_BYTES = 16 * 8
+
+
+def estimate_memory(decode_workers=1, dumps=1):
+    """
+    Rough upper bound on the memory needed to decode dumps at once (the client
+    and server dumps of a run are decoded together), in bytes. Dumps are
+    decoded block by block (see pcap_reader.iter_trace), so this depends on
+    the block size and the decode workers of each dump rather than on how big
+    the dumps are: every worker holds the block it reads along with what was
+    carried over from the last one, the header columns decoded from it and
+    the trace they make. Doesn't cover --tshark, whose CSVs are read whole, or
+    the packets loss keeps within its horizon.
+    """
+    block_packets = pcap_reader.BLOCK_SIZE // MIN_RECORD_SIZE
+    per_worker = 2 * pcap_reader.BLOCK_SIZE + block_packets * (DECODE_BYTES + COLUMN_BYTES)
+    return dumps * decode_workers * per_worker
+
+def ingest_dumps(jobs, load_fn, workers=None, mem_budget=None):
+    """
+    Runs load_fn(*load_args) for every (key, estimated memory, load_args) in
+    jobs on a process pool, the estimate being in bytes (see estimate_memory).
+    A job is only started while the estimates of all jobs in flight stay
+    under mem_budget bytes (one job always runs). Returns {key: result}, in
+    the same order as jobs.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    results = {}
+    if workers <= 1 or len(jobs) <= 1:
+        for (key, estimate, load_args) in jobs:
+            results[key] = load_fn(*load_args)
+        return results
+
+    pending = list(jobs)
+    in_flight = {} # future -> (key, estimated memory)
+    used = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while pending or in_flight:
+            while pending and len(in_flight) < workers:
+                key, estimate, load_args = pending[0]
+                if in_flight and mem_budget is not None and used + estimate > mem_budget:
+                    break
+                pending.pop(0)
+                in_flight[pool.submit(load_fn, *load_args)] = (key, estimate)
+                used += estimate
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                key, estimate = in_flight.pop(future)
+                used -= estimate
+                results[key] = future.result()
+
+    return {key: results[key] for (key, estimate, load_args) in jobs}
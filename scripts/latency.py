@@ -1,5 +1,6 @@
 import argparse
 import csv
+import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 import sys
@@ -7,12 +8,36 @@ import os
 
 from collections import defaultdict
 from helpers import group_files
+from hdr import HdrHistogram, save_hdr
+from sketch import QuantileSketch
+from windowed import WindowedPercentiles
+import executor
+import trials
 
 
 # Default values.
 bucketSize = 0.00005
 minBucket = 0.0
 maxBucket = 0.009
+# Any increasing bucket edges, e.g. linearBuckets() or logBuckets(...). None
+# plots the buckets of the HDR histogram every trial is kept in.
+bucketEdges = None
+# HDR histogram range (in seconds) and significant decimal digits.
+hdrLowest = 0.000001
+hdrHighest = 60.0
+hdrDigits = 2
+# Relative accuracy of the quantile sketches the CDFs are drawn from.
+sketchAccuracy = 0.01
+# Percentiles of the RTTs in windows of each of these sizes (in seconds) are
+# plotted over the run.
+windowSizes = [1.0]
+windowPercentiles = [50, 95, 99]
+
+# matplotlib before 3.3 (the locked 3.0.2) only knows the symlog threshold as
+# linthreshx.
+symlogThreshold = "linthresh"
+if tuple(int(v) for v in matplotlib.__version__.split(".")[:2]) < (3, 3):
+    symlogThreshold = "linthreshx"
 
 # removes csv file after extracting csv data
 def parseCSV(file, save):
@@ -48,8 +73,20 @@ def parseCSV(file, save):
 
 
 # plot single line for average latency across trials.
-def plotLatency(buckets, results, endpoint_no, graphDir):
-    yMax = max(results)
+# The last result is the overflow bin, it is noted in the title. HDR buckets
+# differ in width, so with widths packets per microsecond are plotted.
+def plotLatency(buckets, results, endpoint_no, graphDir, widths=None, name=None):
+    overflow = results[-1]
+    results = np.asarray(results[:-1], dtype=np.float64)
+    top = makeEdges()[-1] if widths is None else hdrHighest
+    if widths is not None:
+        results = results / (widths / 0.000001)
+        # only the range with packets in it
+        nonzero = np.flatnonzero(results)
+        if len(nonzero) > 0:
+            buckets = buckets[nonzero[0]:nonzero[-1] + 1]
+            results = results[nonzero[0]:nonzero[-1] + 1]
+    yMax = max(results) if len(results) > 0 else 0
     plt.ylim(top=(yMax + yMax/8.0))
     # if "server" not in endpoint_no:
     #     for last_i in range(len(results) - 1, -1, -1):
@@ -62,27 +99,31 @@ def plotLatency(buckets, results, endpoint_no, graphDir):
     #     results = results[:last_i]
 
     plt.plot(buckets, results)
-    plt.title("Per Packet Latency for endpoint %s" % endpoint_no)
-    plt.xlabel("Latency(in buckets of %0.5f seconds)" % bucketSize)
-    plt.ylabel("Number of packets")
+    if widths is not None:
+        plt.xscale("log")
+    elif len(buckets) > 1:
+        plt.xscale("symlog", **{symlogThreshold: buckets[1]})
+    plt.title("Per Packet Latency for endpoint %s (%d above %g s)" %
+        (endpoint_no, overflow, top))
+    plt.xlabel(bucketLabel())
+    plt.ylabel("Number of packets" if widths is None else "Number of packets per microsecond")
     plt.legend()
     #plt.show()
-    location = os.path.basename(graphDir)
-    test_type = os.path.basename(os.path.dirname(graphDir))
-    graphfile = "{}/Latency_{}_{}_{}.png".format(graphDir,
-        test_type,
-        location,
-        endpoint_no)
+    if name is None:
+        location = os.path.basename(graphDir)
+        test_type = os.path.basename(os.path.dirname(graphDir))
+        name = "{}_{}_{}".format(test_type, location, endpoint_no)
+    graphfile = "{}/Latency_{}.png".format(graphDir, name)
     print("Saving figure {} to graph dir {} ...".format(graphfile, graphDir))
     plt.savefig(graphfile)
 
     plt.clf()
     plt.close()
 
-def plotCDF(cdf_results, endpoint_no, graphDir):
-    sorted_res = np.sort(cdf_results)
-    y_values = np.arange(1, len(sorted_res) + 1) / len(sorted_res)
-    plt.plot(sorted_res, y_values, marker=".", linestyle="none")
+# CDF of the RTTs of every trial, from their merged QuantileSketch.
+def plotCDF(sketch, endpoint_no, graphDir):
+    values, y_values = sketch.cdf()
+    plt.plot(values, y_values, marker=".", linestyle="none")
 
     plt.title("Per Packet Latency CDF for endpoint %s" % endpoint_no)
 
@@ -97,7 +138,7 @@ def plotCDF(cdf_results, endpoint_no, graphDir):
     #     print(xMax, (xMax + xMax/8.0), yMax, (yMax + yMax/8.0))
     #     plt.xlim(left=0, right=(xMax + xMax/8.0))
 
-    plt.xlabel("Latency(in buckets of %0.5f seconds)" % bucketSize)
+    plt.xlabel("Latency (seconds)")
     plt.ylabel("Percentile")
     plt.legend()
     #plt.show()
@@ -114,22 +155,118 @@ def plotCDF(cdf_results, endpoint_no, graphDir):
     plt.close()
 
 
-# Group the latencies (elements of CSV data) by the number of times they occur
-# and are between the range given by the buckets.
-def sortIntoBuckets(buckets, csvData):
-    countsInBuckets = np.zeros(len(buckets))
-    for i in range(len(buckets)):
-        minVal = buckets[i]
-        if i != len(buckets) - 1:
-            maxVal = buckets[i+1]
-        else:
-            maxVal = maxBucket
+# Plot the percentiles of every window over time, averaged over the trials,
+# with the range between the trials shaded.
+def plotWindows(windowSize, trialWindows, endpoint_no, graphDir):
+    rows = [r for (_, r, _) in trialWindows]
+    if max([len(r) for r in rows]) == 0:
+        return
+    starts = max([s for (s, _, _) in trialWindows], key=len)
+    for (i, p) in enumerate(windowPercentiles):
+        stacked = trials.stack_trials([r[:, i] for r in rows], fill=np.nan)
+        present = ~np.isnan(stacked).all(axis=0)
+        mean = np.full(stacked.shape[1], np.nan)
+        low = np.full(stacked.shape[1], np.nan)
+        high = np.full(stacked.shape[1], np.nan)
+        mean[present] = np.nanmean(stacked[:, present], axis=0)
+        low[present] = np.nanmin(stacked[:, present], axis=0)
+        high[present] = np.nanmax(stacked[:, present], axis=0)
+        line = plt.plot(starts, mean, label="p%g" % p)[0]
+        plt.fill_between(starts, low, high, color=line.get_color(), alpha=0.2)
+
+    plt.title("Per Packet Latency over time for endpoint %s" % endpoint_no)
+    plt.xlabel("Time (in windows of %g seconds)" % windowSize)
+    plt.ylabel("Latency (seconds)")
+    plt.legend()
+    location = os.path.basename(graphDir)
+    test_type = os.path.basename(os.path.dirname(graphDir))
+    graphfile = "{}/LatencyWindows_{}_{}_{}_{}s.png".format(graphDir,
+        test_type,
+        location,
+        endpoint_no,
+        windowSize)
+    print("Saving figure {} to graph dir {} ...".format(graphfile, graphDir))
+    plt.savefig(graphfile)
+
+    plt.clf()
+    plt.close()
+
+
+# Group the latencies (array of RTTs) by the bucket they fall in, given the
+# bucket edges. Counts has one more entry than there are buckets, the RTTs at
+# or above the last edge go in that overflow bin.
+def sortIntoBuckets(edges, rtts):
+    rtts = np.asarray(rtts, dtype=np.float64)
+    bins = np.searchsorted(edges, rtts, side="right") - 1
+    # anything below the first edge isn't counted
+    bins = bins[bins >= 0]
+    return np.bincount(bins, minlength=len(edges)).astype(np.float64)
 
-        for latencyArr in csvData:
-            latency = float(latencyArr[0])
-            if minVal <= latency and latency < maxVal:
-                countsInBuckets[i] += 1
-    return countsInBuckets
+def makeEdges():
+    if bucketEdges is None:
+        return None
+    return np.asarray(bucketEdges, dtype=np.float64)
+
+# Buckets of bucketSize from minBucket to maxBucket.
+def linearBuckets():
+    numBuckets = int((maxBucket - minBucket) / float(bucketSize))
+    return np.linspace(minBucket, maxBucket, num=numBuckets + 1)
+
+# numBuckets log spaced buckets from low to high, below low is one bucket
+# starting at minBucket.
+def logBuckets(numBuckets, low=bucketSize, high=maxBucket):
+    return np.concatenate(([minBucket], np.geomspace(low, high, num=numBuckets)))
+
+def bucketLabel():
+    if bucketEdges is None:
+        return "Latency (in buckets of %d significant digits, seconds)" % hdrDigits
+    return "Latency (seconds)"
+
+def makeHdr():
+    return HdrHistogram(hdrLowest, hdrHighest, hdrDigits)
+
+# (bucket starts, bucket widths or None, counts with the overflow last) of
+# the histogram of a LatencyState.
+def histogramOf(state):
+    if state.counts is None:
+        starts, widths = state.hdr.bucket_starts()
+        return starts, widths, np.append(state.hdr.counts, state.hdr.overflow)
+    return makeEdges()[:-1], None, state.counts
+
+# Latency histogram of one trial, fed the RTTs chunk by chunk. States of
+# different chunks (or trials) can be merged by adding them up.
+class LatencyState:
+    def __init__(self):
+        # every RTT in microseconds to seconds, which can be merged across runs
+        self.hdr = makeHdr()
+        # the RTTs in bucketEdges, if given
+        self.counts = None
+        if bucketEdges is not None:
+            self.counts = np.zeros(len(makeEdges()))
+        # the CDF is drawn from a sketch of bounded size, not every RTT
+        self.sketch = QuantileSketch(sketchAccuracy)
+        # only when the times of the RTTs are known, tshark's aren't
+        self.windows = [WindowedPercentiles(w, windowPercentiles) for w in windowSizes]
+        self.timed = False
+
+    # times are the relative times of the ACKs, in order.
+    def update(self, rtts, times=None):
+        self.hdr.update(rtts)
+        if self.counts is not None:
+            self.counts += sortIntoBuckets(makeEdges(), rtts)
+        self.sketch.update(rtts)
+        if times is not None:
+            self.timed = True
+            for w in self.windows:
+                w.update(times, rtts)
+
+    def merge(self, other):
+        self.hdr.merge(other.hdr)
+        if self.counts is not None:
+            self.counts += other.counts
+        self.sketch.merge(other.sketch)
+        # windows are per trial, a merged state has none
+        self.timed = False
 
 # For each bucket, divide by the number of trials.
 def averageOverTrials(results, num_trials):
@@ -139,50 +276,122 @@ def averageOverTrials(results, num_trials):
             agg_results[i] = agg_results[i] + trial[i]
     return [result/float(num_trials) for result in agg_results]
 
+# Averages and plots the trials of one endpoint.
+def latencyForEndpoint(endpoint_no, trials, graphDir):
+    # 2D array of results. Indexing into results gives the data for the y-axis.
+    results = []
+    # RTTs of all trials together
+    cdfSketch = QuantileSketch(sketchAccuracy)
+    endpointHdr = makeHdr()
+    # per window size, the windowed percentiles of every timed trial
+    windowResults = [[] for w in windowSizes]
+
+    num_trials = len(trials)
+
+    for t in range(num_trials):
+
+        # Either the array of RTTs of the trial or its LatencyState.
+        trial = trials[t]
+
+        print("Getting latency calculations for endpoint %s trial %d..." % (endpoint_no, t))
+
+        # Get the tail latency by keeping track of individual packets,
+        # find when they are received (or ACK'd), and note that latency.
+        # Group latency values into buckets to get tail latency (x-axis)
+        # vs. number of packets (y-axis).
+
+        if not isinstance(trial, LatencyState):
+            state = LatencyState()
+            state.update(trial)
+            trial = state
+
+        buckets, widths, counts = histogramOf(trial)
+        results.append(counts)
+        cdfSketch.merge(trial.sketch)
+        endpointHdr.merge(trial.hdr)
+        if trial.timed:
+            for (i, w) in enumerate(trial.windows):
+                windowResults[i].append(w.result())
+
+        #print("Calculations for that trial complete." % file)
+
+    print("All trials for endpoint %s gathered. Averaging over %d trials..." %(endpoint_no, num_trials))
+    results = averageOverTrials(results, num_trials)
+
+    print("Plotting endpoint %s..." % endpoint_no)
+    print("len bucks %d len res %d " % (len(buckets), len(results)))
+    plotLatency(buckets, results, endpoint_no, graphDir, widths)
+    print("Endpoint %s p50 %0.5f p99 %0.5f seconds" % (endpoint_no,
+        cdfSketch.quantile(0.5), cdfSketch.quantile(0.99)))
+    plotCDF(cdfSketch, endpoint_no, graphDir)
+    for (windowSize, trialWindows) in zip(windowSizes, windowResults):
+        if len(trialWindows) > 0:
+            plotWindows(windowSize, trialWindows, endpoint_no, graphDir)
+
+    # kept so runs can be aggregated later on without their dumps
+    location = os.path.basename(graphDir)
+    test_type = os.path.basename(os.path.dirname(graphDir))
+    save_hdr(endpointHdr, "{}/LatencyHDR_{}_{}_{}.json".format(graphDir,
+        test_type, location, endpoint_no))
+
+# Merges the HDR histograms of every trial of each endpoint at each location
+# and plots the locations of an endpoint together.
+def aggregateLatency(csvDataForFiles, graphDir, testStr, locations):
+    print("Running aggregate latency script...")
+    byLocation = defaultdict(dict)
+    for (fileName, data) in csvDataForFiles.items():
+        byLocation[locations[fileName]][fileName] = data
+
+    merged = defaultdict(dict) # endpoint -> location -> HdrHistogram
+    for location in sorted(byLocation):
+        runs = group_files(byLocation[location], False)
+        for endpoint_no in sorted(runs):
+            hist = makeHdr()
+            for trial in runs[endpoint_no]:
+                if not isinstance(trial, LatencyState):
+                    state = LatencyState()
+                    state.update(trial)
+                    trial = state
+                hist.merge(trial.hdr)
+            merged[endpoint_no][location] = hist
+            save_hdr(hist, "{}/LatencyHDR_{}_aggregate_{}_{}.json".format(graphDir,
+                testStr, location, endpoint_no))
+
+    if not os.path.exists(graphDir):
+        os.makedirs(graphDir)
+    for endpoint_no in sorted(merged):
+        for (location, hist) in sorted(merged[endpoint_no].items()):
+            starts, widths = hist.bucket_starts()
+            # packets per microsecond, as a share of the location's packets
+            density = hist.counts / (widths / 0.000001) / max(hist.count, 1)
+            nonzero = np.flatnonzero(density)
+            if len(nonzero) > 0:
+                span = slice(nonzero[0], nonzero[-1] + 1)
+                plt.plot(starts[span], density[span], label=location)
+        plt.xscale("log")
+        plt.title("Per Packet Latency for endpoint %s" % endpoint_no)
+        plt.xlabel(bucketLabel())
+        plt.ylabel("Share of packets per microsecond")
+        plt.legend()
+        graphfile = "{}/Latency_{}_aggregate_{}.png".format(graphDir, testStr, endpoint_no)
+        print("Saving figure {} to graph dir {} ...".format(graphfile, graphDir))
+        plt.savefig(graphfile)
+        plt.clf()
+        plt.close()
+
+    print("Plotting complete for all locations.")
+
 # Main.
-def getLatency(csvDataForFiles, graphDir, aggregate=False):
+def getLatency(csvDataForFiles, graphDir, aggregate=False, workers=1):
     print("Running latency script...")
 
-    numBuckets = int((maxBucket - minBucket) / float(bucketSize))
-    buckets = np.linspace(minBucket, maxBucket, num=numBuckets, endpoint=False)
-
     # key is a run, each run's list should be averaged
     runs = group_files(csvDataForFiles, False)
 
-    for endpoint_no in runs:
-        # 2D array of results. Indexing into results gives the data for the y-axis.
-        results = []
-        cdf_results = []
-
-        trials = runs[endpoint_no]
-        num_trials = len(trials)
-
-        for t in range(num_trials):
-
-            csvData = trials[t]
-
-            print("Getting latency calculations for endpoint %s trial %d with bucket size %f..." % (endpoint_no, t, bucketSize))
-
-            # Get the tail latency by keeping track of individual packets,
-            # find when they are received (or ACK'd), and note that latency.
-            # Group latency values into buckets to get tail latency (x-axis)
-            # vs. number of packets (y-axis).
-
-            countsInBuckets = sortIntoBuckets(buckets, csvData)
-
-            results.append(countsInBuckets)
-            cdf_results.append([float(latencyArr[0]) for latencyArr in csvData])
-
-            #print("Calculations for that trial complete." % file)
-
-        print("All trials for endpoint %s gathered. Averaging over %d trials..." %(endpoint_no, num_trials))
-        results = averageOverTrials(results, num_trials)
-        cdf_results = averageOverTrials(cdf_results, num_trials)
-
-        print("Plotting endpoint %s..." % endpoint_no)
-        print("len bucks %d len res %d " % (len(buckets), len(results)))
-        plotLatency(buckets, results, endpoint_no, graphDir)
-        plotCDF(cdf_results, endpoint_no, graphDir)
+    # each endpoint is averaged and plotted by its own process, up to workers at once
+    tasks = [(endpoint_no, (endpoint_no, runs[endpoint_no], graphDir))
+        for endpoint_no in sorted(runs)]
+    executor.run_tasks(tasks, latencyForEndpoint, workers)
 
     print("Plotting complete for all runs.")
 
@@ -1,112 +1,238 @@
 import sys
 import os
 import matplotlib.pyplot as plt
-from collections import defaultdict
+import numpy as np
+from collections import defaultdict, namedtuple
 import pprint
 
 import constants
 import helpers
+import segments
+from flows import connection_keys
+import trials
+import executor
+from timescale import TimescalePyramid
+from pcap_reader import split_trace
 
 # **************************** DATA EXTRACTION ****************************** #
+def split_directions(data):
+    """
+    Splits a trace into (client -> server, server -> client) packets of every
+    connection to the server's port
+    """
+    to_server = (data["dstport"] == constants.SERVER_PORT) & (data["srcport"] != constants.SERVER_PORT)
+    to_client = (data["srcport"] == constants.SERVER_PORT) & (data["dstport"] != constants.SERVER_PORT)
+    return data[to_server], data[to_client]
+
+def match_columns(trace):
+    """
+    The columns of a trace packets are matched on, with the connection key
+    (see flows.connection_keys) of every packet as "flow"
+    """
+    return {
+        "ts": trace["time_relative"],
+        "seq": trace["seq"].astype(np.int64),
+        "ack": trace["ack"].astype(np.int64),
+        "ip_id": trace["ip_id"].astype(np.int64),
+        "flow": connection_keys(trace["srcport"], trace["dstport"]).astype(np.int64),
+    }
+
+def sent_columns(out_data, ip_id_policy):
+    """
+    match_columns of the MTU sized segments the packets of out_data were
+    sent as
+    """
+    sent = segments.expand_segments(out_data, ip_id_policy)
+    sent["flow"] = connection_keys(out_data["srcport"],
+        out_data["dstport"]).astype(np.int64)[sent["packet"]]
+    return sent
+
+# (relative time, is_lost) of every packet sent in one direction
+LOSS_DTYPE = np.dtype([("ts", np.float64), ("lost", bool)])
+
+def _rank(values):
+    _, rank = np.unique(values, return_inverse=True)
+    return rank.reshape(-1).astype(np.int64)
+
+def packet_keys(sent, received):
+    """
+    Packs (connection, seq, ack, ip id) of the sent and received packets (see
+    match_columns) into 64 bit keys, (connection, seq, ack) is replaced by
+    its rank among the ones on both sides so the key fits
+    """
+    seq_ack = np.concatenate(((sent["seq"] << 32) | sent["ack"],
+        (received["seq"] << 32) | received["ack"]))
+    flow = np.concatenate((sent["flow"], received["flow"]))
+    rank = _rank((_rank(seq_ack) << 32) | flow)
+    sent_keys = (rank[:len(sent["seq"])] << 16) | sent["ip_id"]
+    in_keys = (rank[len(sent["seq"]):] << 16) | received["ip_id"]
+    return sent_keys, in_keys
+
+def mark_received(sent, received):
+    """
+    Returns is_lost for every sent packet. A packet showing up in the data of
+    the opposite endpoint is not lost, if it was sent more than once with the
+    same (seq, ack, ip id) only the first one counts as received.
+    """
+    sent_keys, in_keys = packet_keys(sent, received)
+    keys, first = np.unique(sent_keys, return_index=True)
+    lost = np.ones(len(sent_keys), dtype=bool)
+    lost[first[np.isin(keys, in_keys)]] = False
+    return lost
+
+def lost_packets(out_data, in_data, ip_id_policy):
+    """
+    LOSS_DTYPE array of the MTU sized packets of out_data, sorted by time
+    """
+    sent = sent_columns(out_data, ip_id_policy)
+    received = match_columns(in_data)
+    # connections the other capture never saw (e.g. left out by its capture
+    # filter) can't be told apart from lost ones, so they aren't counted
+    seen = np.isin(sent["flow"], received["flow"])
+    sent = {f: c[seen] for (f, c) in sent.items()}
+    lost = mark_received(sent, received)
+    order = np.lexsort((lost, sent["ts"]))
+    result = np.empty(len(order), dtype=LOSS_DTYPE)
+    result["ts"] = sent["ts"][order]
+    result["lost"] = lost[order]
+    return result
+
 def get_lost_packets(client_data, server_data):
     """
     Main functionality
-    Looks at difference between packets sent and received at each endpoint
-    Stores into dict of results for each direction that has following format
-    key: (seq, ack)
-    value: [[is_lost : bool, relative time : float, UTC : float] .... ]
-    """
-    client_out_packets = defaultdict(list) # client -> server
-    server_out_packets = defaultdict(list) # server -> client
-    client_ports = set([str(constants.CLIENT_1_PORT), str(constants.CLIENT_2_PORT)])
-    server_port = str(constants.SERVER_PORT)
-
-    # parse data to populate respective dicts
-    client_in_data = [] # data to match against for server_out_packets
-    for row in client_data:
-        if row[constants.SRC_PORT_COL] in client_ports and row[constants.DST_PORT_COL] == server_port:
-            payload_size = int(row[constants.DATA_LEN_COL])
-            seq = int(row[constants.SEQ_NUM_COL])
-            ack = int(row[constants.ACK_NUM_COL])
-            if payload_size == 0:
-                client_out_packets[(seq, ack)].append([
-                    True,
-                    row[constants.REL_TIME_COL],
-                    int(row[constants.IP_ID_COL], 16)
-                ])
-            else:
-                end = int(payload_size/constants.MTU)
-                if payload_size % constants.MTU != 0:
-                    end += 1
-                for i in range(0, end):
-                    # breaks down larger payloads into MTU sized packets
-                    client_out_packets[(seq + i * constants.MTU, ack)].append([
-                        True,
-                        row[constants.REL_TIME_COL],
-                        int(row[constants.IP_ID_COL], 16)
-                    ])
-        elif row[constants.SRC_PORT_COL] == server_port and row[constants.DST_PORT_COL] in client_ports:
-            client_in_data.append(row)
-    
-    server_in_data = [] # data to match against for client_out_packets
-    for row in server_data:
-        if row[constants.SRC_PORT_COL] == server_port and row[constants.DST_PORT_COL] in client_ports:
-            payload_size = int(row[constants.DATA_LEN_COL])
-            seq = int(row[constants.SEQ_NUM_COL])
-            ack = int(row[constants.ACK_NUM_COL])
-            if payload_size == 0:
-                server_out_packets[(seq, ack)].append([
-                    True,
-                    row[constants.REL_TIME_COL],
-                    int(row[constants.IP_ID_COL], 16)
-                ])
-            else:
-                end = int(payload_size/constants.MTU)
-                if payload_size % constants.MTU != 0:
-                    end += 1
-                for i in range(0, end):
-                    # breaks down larger payloads into MTU sized packets
-                    server_out_packets[(seq + i * constants.MTU, ack)].append([
-                        True,
-                        row[constants.REL_TIME_COL],
-                        int(row[constants.IP_ID_COL], 16) + i
-                    ])
-        elif row[constants.SRC_PORT_COL] in client_ports and row[constants.DST_PORT_COL] == server_port:
-            server_in_data.append(row)
+    Looks at difference between packets sent and received at each endpoint,
+    client_data and server_data are traces (see pcap_reader.TRACE_DTYPE)
+    Returns LOSS_DTYPE array of (relative time, is_lost) sorted by time for
+    each direction
+    """
+    client_out_data, client_in_data = split_directions(client_data)
+    server_in_data, server_out_data = split_directions(server_data)
 
     # go through data of opposite direction to determine which packets were lost
-    for row in client_in_data:
-        seq = int(row[constants.SEQ_NUM_COL])
-        ack = int(row[constants.ACK_NUM_COL])
-
-        # any packet received should definitely have been sent so can assume will never get key err
-        for i in range(0, len(server_out_packets[(seq, ack)])):
-            if server_out_packets[(seq, ack)][i][2] == int(row[constants.IP_ID_COL], 16):
-                server_out_packets[(seq, ack)][i][0] = False
-                break
-
-    for row in server_in_data:
-        seq = int(row[constants.SEQ_NUM_COL])
-        ack = int(row[constants.ACK_NUM_COL])
-
-        # any packet received should definitely have been sent so can assume will never get key err
-        for i in range(0, len(client_out_packets[(seq, ack)])):
-            if client_out_packets[(seq, ack)][i][2] == int(row[constants.IP_ID_COL], 16):
-                client_out_packets[(seq, ack)][i][0] = False
-                break
-
-    # convert to list sorted by timestamp
-    client = []
-    for packets in client_out_packets.values():
-        client.extend([(ts, lost) for (lost, ts, utc) in packets])
-    client.sort()
-    server = []
-    for packets in server_out_packets.values():
-        server.extend([(ts, lost) for (lost, ts, utc) in packets])
-    server.sort()
-
+    client = lost_packets(client_out_data, server_in_data,
+        constants.CLIENT_IP_ID_POLICY) # client -> server
+    server = lost_packets(server_out_data, client_in_data,
+        constants.SERVER_IP_ID_POLICY) # server -> client
     return client, server
 
+def _append(table, columns):
+    return {f: np.concatenate((table[f], columns[f])) for f in table}
+
+def _drop_before(table, count):
+    return {f: c[count:] for (f, c) in table.items()}
+
+def _leading(ts, limit):
+    """
+    Number of leading times up to limit (capture order, which is almost but
+    not always time order)
+    """
+    over = np.flatnonzero(ts > limit)
+    return over[0] if len(over) > 0 else len(ts)
+
+class LossMatcher:
+    """
+    Streaming version of lost_packets for one direction. Sent and received
+    packets are added chunk by chunk in capture order, and a sent packet is
+    decided once the received side has been read up to horizon seconds past
+    it. Only packets within the horizon of undecided ones are kept, so unlike
+    lost_packets a packet can only be received (or be a duplicate) within
+    horizon seconds.
+    """
+    def __init__(self, ip_id_policy, horizon=constants.LOSS_HORIZON):
+        self.ip_id_policy = ip_id_policy
+        self.horizon = horizon
+        empty = {f: np.zeros(0, dtype=np.int64) for f in ("seq", "ack", "ip_id", "flow")}
+        empty["ts"] = np.zeros(0, dtype=np.float64)
+        self.sent = dict(empty)
+        # sent[:decided] were emitted already, kept to spot duplicates
+        self.decided = 0
+        self.received = dict(empty)
+        # connections seen on the received side so far, see lost_packets
+        self.seen_flows = np.zeros(0, dtype=np.int64)
+
+    def add_sent(self, out_data):
+        self.sent = _append(self.sent, sent_columns(out_data, self.ip_id_policy))
+
+    def add_received(self, in_data):
+        received = match_columns(in_data)
+        self.received = _append(self.received, received)
+        self.seen_flows = np.union1d(self.seen_flows, received["flow"])
+
+    def emit(self, received_until):
+        """
+        Decides the sent packets that were sent horizon seconds before the
+        received side was read up to (inf once it's read completely).
+        Returns LOSS_DTYPE array of them sorted by time.
+        """
+        end = self.decided + _leading(self.sent["ts"][self.decided:],
+            received_until - self.horizon)
+        if end == self.decided:
+            return np.zeros(0, dtype=LOSS_DTYPE)
+
+        sent_keys, in_keys = packet_keys(self.sent, self.received)
+        keys, first = np.unique(sent_keys, return_index=True)
+        is_first = np.zeros(len(sent_keys), dtype=bool)
+        is_first[first] = True
+        lost = ~(is_first[self.decided:end] & np.isin(sent_keys[self.decided:end], in_keys))
+        ts = self.sent["ts"][self.decided:end]
+        seen = np.isin(self.sent["flow"][self.decided:end], self.seen_flows)
+        lost = lost[seen]
+        ts = ts[seen]
+        order = np.lexsort((lost, ts))
+        result = np.empty(len(order), dtype=LOSS_DTYPE)
+        result["ts"] = ts[order]
+        result["lost"] = lost[order]
+        self.decided = end
+
+        # forget what can't be matched with the undecided packets anymore
+        if self.decided < len(self.sent["ts"]):
+            oldest = self.sent["ts"][self.decided]
+        else:
+            oldest = self.sent["ts"][self.decided - 1]
+        old_sent = _leading(self.sent["ts"][:self.decided], oldest - self.horizon)
+        self.sent = _drop_before(self.sent, old_sent)
+        self.decided -= old_sent
+        self.received = _drop_before(self.received,
+            _leading(self.received["ts"], oldest - self.horizon))
+        return result
+
+def stream_lost_packets(client_chunks, server_chunks, horizon=constants.LOSS_HORIZON):
+    """
+    Streaming get_lost_packets for captures too long to hold in memory. Walks
+    the chunks of both traces (see pcap_reader.TRACE_DTYPE), always reading
+    from the one that is behind, and yields (client, server) LOSS_DTYPE arrays
+    of the packets decided so far. Only packets within horizon seconds are
+    kept, see LossMatcher.
+    """
+    to_server = LossMatcher(constants.CLIENT_IP_ID_POLICY, horizon)
+    to_client = LossMatcher(constants.SERVER_IP_ID_POLICY, horizon)
+    client_chunks = iter(client_chunks)
+    server_chunks = iter(server_chunks)
+    client_until = -np.inf
+    server_until = -np.inf
+    while client_until < np.inf or server_until < np.inf:
+        if client_until <= server_until:
+            chunk = next(client_chunks, None)
+            if chunk is None:
+                client_until = np.inf
+            else:
+                client_out_data, client_in_data = split_directions(chunk)
+                to_server.add_sent(client_out_data)
+                to_client.add_received(client_in_data)
+                if len(chunk) > 0:
+                    client_until = chunk["time_relative"][-1]
+        else:
+            chunk = next(server_chunks, None)
+            if chunk is None:
+                server_until = np.inf
+            else:
+                server_in_data, server_out_data = split_directions(chunk)
+                to_client.add_sent(server_out_data)
+                to_server.add_received(server_in_data)
+                if len(chunk) > 0:
+                    server_until = chunk["time_relative"][-1]
+        yield to_server.emit(server_until), to_client.emit(client_until)
+
 def get_test_name(fname, endpoint):
     """
     Get file name of CSV data file
@@ -123,95 +249,142 @@ def get_test_name(fname, endpoint):
 # *********************************** END *********************************** #
 
 # ************************** STATISTIC ANALYSES ***************************** #
+# one run of consecutive lost (a burst) or received (a gap) packets, with
+# the times of its first and last packet
+RUN_DTYPE = np.dtype([("lost", bool), ("length", np.int64),
+    ("start", np.float64), ("end", np.float64)])
+
+# length -> count histograms of the bursts and gaps, and the times of the
+# first and last packet of every burst if they were kept
+LossRuns = namedtuple("LossRuns", ["burst_hist", "gap_hist",
+    "burst_starts", "burst_ends"])
+
+def loss_runs(data_lines):
+    """
+    Run-length encoding of a LOSS_DTYPE array, RUN_DTYPE array of its runs
+    """
+    lost = data_lines["lost"]
+    if len(lost) == 0:
+        return np.zeros(0, dtype=RUN_DTYPE)
+    starts = np.concatenate(([0], np.flatnonzero(lost[1:] != lost[:-1]) + 1))
+    ends = np.concatenate((starts[1:], [len(lost)])) - 1
+    runs = np.empty(len(starts), dtype=RUN_DTYPE)
+    runs["lost"] = lost[starts]
+    runs["length"] = ends - starts + 1
+    runs["start"] = data_lines["ts"][starts]
+    runs["end"] = data_lines["ts"][ends]
+    return runs
+
+def length_hist(lengths, hist=None):
+    """
+    length -> count of an array of run lengths, added to hist if given
+    """
+    if hist is None:
+        hist = {}
+    values, counts = np.unique(lengths, return_counts=True)
+    for (value, count) in zip(values.tolist(), counts.tolist()):
+        hist[value] = hist.get(value, 0) + count
+    return hist
+
+class LossRunState:
+    """
+    Bursts and gaps of a stream of LOSS_DTYPE arrays fed in chunks. The
+    lengths of closed runs go straight into length histograms, only the last
+    run stays open since it may go on in the next chunk. With keep_times the
+    start and end of every burst are kept too, which grows with the number of
+    bursts.
+    """
+    def __init__(self, keep_times=False):
+        self.keep_times = keep_times
+        self.burst_hist = {}
+        self.gap_hist = {}
+        self.burst_starts = [] # with keep_times, arrays of the closed bursts
+        self.burst_ends = []
+        self.last = np.zeros(0, dtype=RUN_DTYPE)
+
+    def update(self, data_lines):
+        runs = loss_runs(data_lines)
+        if len(runs) == 0:
+            return
+        if len(self.last) > 0 and self.last["lost"][0] == runs["lost"][0]:
+            runs = runs.copy()
+            runs["length"][0] += self.last["length"][0]
+            runs["start"][0] = self.last["start"][0]
+        else:
+            self._close(self.last, self.burst_hist, self.gap_hist)
+        self._close(runs[:-1], self.burst_hist, self.gap_hist)
+        self.last = runs[-1:]
+
+    def _close(self, runs, burst_hist, gap_hist):
+        lost = runs["lost"]
+        length_hist(runs["length"][lost], burst_hist)
+        length_hist(runs["length"][~lost], gap_hist)
+        if self.keep_times:
+            self.burst_starts.append(runs["start"][lost])
+            self.burst_ends.append(runs["end"][lost])
+
+    def result(self):
+        """
+        LossRuns of every burst (including one running into the end of the
+        trace) and gap, burst times are None without keep_times
+        """
+        burst_hist = dict(self.burst_hist)
+        gap_hist = dict(self.gap_hist)
+        # the open run is counted as closed without closing it
+        lost = self.last["lost"]
+        length_hist(self.last["length"][lost], burst_hist)
+        length_hist(self.last["length"][~lost], gap_hist)
+        if not self.keep_times:
+            return LossRuns(burst_hist, gap_hist, None, None)
+        return LossRuns(burst_hist, gap_hist,
+            np.concatenate(self.burst_starts + [self.last["start"][lost]]),
+            np.concatenate(self.burst_ends + [self.last["end"][lost]]))
+
 def loss_length_hist(data_lines, graph_individual=False):
     """
     Returns histogram of bursts of loss experienced
     """
-    loss_bursts = {}
-    loss_active = False
-    loss_count = 0
-    for (ts, lost) in data_lines:
-        if lost:
-            loss_count += 1
-            if not loss_active:
-                loss_active = True
-        else:
-            if loss_active:
-                # reset burst count and write to dict
-                if loss_count not in loss_bursts:
-                    loss_bursts[loss_count] = 1
-                else:
-                    loss_bursts[loss_count] += 1
-                loss_active = False
-                loss_count = 0
-    
-    return loss_bursts
+    state = LossRunState()
+    state.update(data_lines)
+    return state.result().burst_hist
 
 def loss_timescale(data_lines, graph_individual=False):
     """
     Returns loss on timescale
     """
-    bucketStart = 0
-    nextBucket = bucketStart + constants.BUCKET_SIZE
-
-    time_buckets = []
-    data_buckets = []
-    curr_data_bucket = 0
-
-    for (ts, lost) in data_lines:
-        # See if we are on the next bucket.
-        if float(ts) >= nextBucket:
-            time_buckets.append(nextBucket)  # Append x-axis point.
-            nextBucket += constants.BUCKET_SIZE  # Go to next bucket.
-            data_buckets.append(curr_data_bucket)  # Append y-axis point.
-            curr_data_bucket = 0  # Reset y-axis sum.
-
-        if lost:
-            curr_data_bucket += 1
-
-    return (time_buckets, data_buckets)
+    pyramid = TimescalePyramid()
+    pyramid.update(data_lines["ts"], data_lines["lost"])
+    return pyramid.level(constants.BUCKET_SIZE)
 
 def compute_average_hist(loss_bursts):
-    average_loss_bursts = defaultdict(int)
-    for hist in loss_bursts:
-        for length in hist:
-            average_loss_bursts[length] += hist[length]
-    
-    to_del = []
-    for length in average_loss_bursts:
-        average_loss_bursts[length] = int(average_loss_bursts[length] / len(loss_bursts))
-        if (average_loss_bursts[length] == 0):
-            to_del.append(length)
-    for length in to_del:
-        average_loss_bursts.pop(length, None)
-    
-    return average_loss_bursts
-
-def compute_average_timescale(loss_timescales):
-    time_buckets = []
-    average_data_buckets = []
-    for buckets in loss_timescales:
-        for i in range(0, len(buckets[1])):
-            if i >= len(average_data_buckets):
-                # first one so can just append
-                average_data_buckets.append(buckets[1][i])
-            else:
-                average_data_buckets[i] += buckets[1][i]
+    """
+    Average of the burst histograms of some runs, see trials.average_hist
+    """
+    return trials.average_hist(loss_bursts)
 
-            if i >= len(time_buckets):
-                # first one so can just append
-                time_buckets.append(buckets[0][i])
-    
-    for i in range(0, len(average_data_buckets)):
-        average_data_buckets[i] = int(average_data_buckets[i] / len(loss_timescales))
+def timescale_trials(loss_timescales, resolution=constants.BUCKET_SIZE):
+    """
+    (bucket end times, losses per bucket stacked with trials.stack_trials) of
+    the TimescalePyramids of some runs
+    """
+    stacked = trials.stack_trials([pyramid.level(resolution)[1]
+        for pyramid in loss_timescales])
+    return (np.arange(1, stacked.shape[1] + 1) * resolution, stacked)
 
-    return (time_buckets, average_data_buckets)
+def compute_average_timescale(loss_timescales, resolution=constants.BUCKET_SIZE):
+    """
+    Average losses per bucket of resolution seconds over the TimescalePyramids
+    of some runs
+    """
+    time_buckets, stacked = timescale_trials(loss_timescales, resolution)
+    return (time_buckets, trials.trial_stats(stacked).mean)
 # *********************************** END *********************************** #
 
 # ******************************** GRAPHING ********************************** #
-def graph_hist(loss_bursts_s, endpoint, name_pre, graph_dir):
+def graph_hist(loss_bursts_s, endpoint, name_pre, graph_dir, run="Burst"):
     """
-    Graphs the histogram generated from loss_length_hist
+    Graphs the histogram generated from loss_length_hist, or of the gaps
+    between bursts with run="Gap"
     """
     for loss_bursts in loss_bursts_s:
         keys = sorted([int(k) for k in loss_bursts.keys()])
@@ -230,24 +403,33 @@ def graph_hist(loss_bursts_s, endpoint, name_pre, graph_dir):
             rect = g.patches[i]
             ax.text(rect.get_x() + rect.get_width()/2,
                 rect.get_height() + height_space,
-                loss_bursts[keys[i]],
+                "{:.3g}".format(loss_bursts[keys[i]]),
                 ha="center",
                 va="bottom").set_fontsize(7)
 
-    plt.xlabel("Burst size")
+    plt.xlabel("{} size".format(run))
     plt.ylabel("Frequency")
-    plt.title("Frequency of loss burst sizes for {} {}".format(name_pre, endpoint))
-    plt.savefig("{}/LossBurstHist_{}_{}.png".format(
-        graph_dir, name_pre, endpoint))
+    plt.title("Frequency of loss {} sizes for {} {}".format(run.lower(), name_pre, endpoint))
+    plt.savefig("{}/Loss{}Hist_{}_{}.png".format(
+        graph_dir, run, name_pre, endpoint))
     plt.clf()
     plt.close()
 
-def graph_loss_timescale(timescales, endpoint, name_pre, graph_dir):
+def graph_loss_timescale(timescales, endpoint, name_pre, graph_dir,
+        resolution=constants.BUCKET_SIZE, bands=None):
+    """
+    Graphs (time buckets, losses) timescales, each band of (time buckets,
+    low, high) is shaded around them
+    """
+    if bands is None:
+        bands = []
     for timescale in timescales:
         time_buckets, data_buckets = timescale
         plt.plot(time_buckets, data_buckets)
+    for (time_buckets, low, high) in bands:
+        plt.fill_between(time_buckets, low, high, alpha=0.3)
     plt.ylim(top=50000)
-    plt.xlabel("Time (in buckets of %0.2f seconds)" % constants.BUCKET_SIZE)
+    plt.xlabel("Time (in buckets of %0.3g seconds)" % resolution)
     plt.ylabel("Packets lost")
     plt.title("Packets lost over time for {} {}".format(name_pre, endpoint))
     plt.savefig("{}/LossTime_{}_{}.png".format(
@@ -258,91 +440,127 @@ def graph_loss_timescale(timescales, endpoint, name_pre, graph_dir):
 # *********************************** END *********************************** #
 
 # ******************************** SCRIPTS ********************************** #
-def analyze_loss(file_to_csvrows, graph_dir, test_str, aggregate=False):
+def run_loss(run):
     """
-    Runs analysis on data for some files, assumed to be from the same test
+    Reduces one client/server run to {endpoint: (burst length hist, gap
+    length hist, TimescalePyramid)}. The data of the run may be loaders, in
+    which case the run is loaded here (in a worker process), and runs given
+    as chunks of their traces are matched while they stream in so only the
+    packets within the loss horizon are ever held.
+    """
+    if "client" not in run or "server" not in run:
+        print("Skipping a run without both a client and a server dump")
+        return {}
+    client_chunks, server_chunks = [split_trace(trace)
+        if isinstance(trace, np.ndarray) else trace
+        for trace in (helpers.load_entry(run["client"]), helpers.load_entry(run["server"]))]
+    client_runs = LossRunState()
+    client_timescale = TimescalePyramid()
+    server_runs = LossRunState()
+    server_timescale = TimescalePyramid()
+    for (client_loss_data, server_loss_data) in stream_lost_packets(
+            client_chunks, server_chunks):
+        client_runs.update(client_loss_data)
+        client_timescale.update(client_loss_data["ts"], client_loss_data["lost"])
+        server_runs.update(server_loss_data)
+        server_timescale.update(server_loss_data["ts"], server_loss_data["lost"])
+    client_loss_runs = client_runs.result()
+    server_loss_runs = server_runs.result()
+    return {
+        "client": (client_loss_runs.burst_hist, client_loss_runs.gap_hist,
+            client_timescale),
+        "server": (server_loss_runs.burst_hist, server_loss_runs.gap_hist,
+            server_timescale),
+    }
+
+def analyze_loss(file_to_csvrows, graph_dir, test_str, aggregate=False,
+        locations=None, workers=1, results=None):
+    """
+    Runs analysis on data for some files. Files are grouped by location
+    (file name -> location in locations, the location and duration in the
+    file name if not given), every run of a connection at a location is
+    reduced on its own on workers processes and the runs of each connection
+    are averaged and graphed. Runs already reduced elsewhere can be given as
+    results, (location, conn #, run #) -> run_loss result. If aggregate,
+    returns location -> (endpoint -> burst hists, endpoint ->
+    TimescalePyramids) of all runs.
     """
-    print(file_to_csvrows.keys())
-    l, d, e, r = list(file_to_csvrows.keys())[0].split("_")
-    name_pre = "{}_{}_{}_".format(test_str, l, d)
-
-    # group by connection number and run number
     print("Analyzing loss...")
-    runs = helpers.group_files(file_to_csvrows, True)
+    if results is None:
+        if locations is None:
+            locations = {f: "_".join(f.split("_")[:2]) for f in file_to_csvrows}
+        units = executor.complete_runs(executor.location_runs(file_to_csvrows, locations))
+        results = executor.run_tasks([(unit, (run,)) for (unit, run) in units],
+            run_loss, workers)
+
+    # location -> conn # -> endpoint -> one entry per run, in run order
+    loc_hists = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
+    loc_gaps = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
+    loc_timescales = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
+    for ((location, conn_no, run_no), run_result) in results.items():
+        if len(run_result) == 0:
+            # a run missing its client or server dump
+            continue
+        for (endpoint, (bursts, gaps, timescale)) in run_result.items():
+            endpoint = endpoint + str(conn_no)
+            loc_hists[location][conn_no][endpoint].append(bursts)
+            loc_gaps[location][conn_no][endpoint].append(gaps)
+            loc_timescales[location][conn_no][endpoint].append(timescale)
+        print("...{} connection {} run {} done".format(location, conn_no, run_no))
 
     # do the thing
-    for conn_no in runs:
-        print("\n")
-        print("analyzing connection {}...".format(conn_no))
-        loss_hists = defaultdict(list)
-        loss_timescales = defaultdict(list)
-        for run_no in runs[conn_no]:
-            print("analyzing connection {} run {}...".format(conn_no, run_no))
-            client_data = runs[conn_no][run_no]["client"]
-            server_data = runs[conn_no][run_no]["server"]
-
-            # run statistics analysis
-            print("figuring out lost packets...")
-            client_loss_data, server_loss_data = get_lost_packets(
-                client_data, server_data)
-            print("processing client...")
-            client_loss_bursts = loss_length_hist(client_loss_data)
-            client_loss_timescale = loss_timescale(client_loss_data)
-            print("processing server...")
-            server_loss_bursts = loss_length_hist(server_loss_data)
-            server_loss_timescale = loss_timescale(server_loss_data)
-
-            client_e = "client" + str(conn_no)
-            server_e = "server" + str(conn_no)
-            loss_hists[client_e].append(client_loss_bursts)
-            loss_timescales[client_e].append(client_loss_timescale)
-            loss_hists[server_e].append(server_loss_bursts)
-            loss_timescales[server_e].append(server_loss_timescale)
-            print("...connection {} run {} done\n".format(conn_no, run_no))
-        for endpoint in loss_hists:
-            # SERVER means packets lost from server to client
-            # CLIENT means packets lost from client to server
-            print("calculating average for {}...".format(endpoint))
-            avg_loss_bursts = compute_average_hist(loss_hists[endpoint])
-            avg_loss_timescale = compute_average_timescale(loss_timescales[endpoint])
-            graph_hist([avg_loss_bursts], endpoint, name_pre, graph_dir)
-            graph_loss_timescale([avg_loss_timescale], endpoint, name_pre, graph_dir)
-            print("...done")
-    
+    aggregated = {}
+    for location in loc_hists:
+        name_pre = "{}_{}_".format(test_str, location)
+        aggregated[location] = ({}, {})
+        for conn_no in loc_hists[location]:
+            print("\n")
+            print("analyzing {} connection {}...".format(location, conn_no))
+            loss_hists = loc_hists[location][conn_no]
+            loss_timescales = loc_timescales[location][conn_no]
+            for endpoint in loss_hists:
+                # SERVER means packets lost from server to client
+                # CLIENT means packets lost from client to server
+                print("calculating average for {}...".format(endpoint))
+                avg_loss_bursts = compute_average_hist(loss_hists[endpoint])
+                avg_loss_gaps = compute_average_hist(loc_gaps[location][conn_no][endpoint])
+                time_buckets, stacked = timescale_trials(loss_timescales[endpoint])
+                stats = trials.trial_stats(stacked)
+                graph_hist([avg_loss_bursts], endpoint, name_pre, graph_dir)
+                graph_hist([avg_loss_gaps], endpoint, name_pre, graph_dir, "Gap")
+                # shaded with the bootstrap confidence interval of the average
+                graph_loss_timescale([(time_buckets, stats.mean)], endpoint, name_pre,
+                    graph_dir, bands=[(time_buckets, stats.ci_low, stats.ci_high)])
+                print("...done")
+            aggregated[location][0].update(loss_hists)
+            aggregated[location][1].update(loss_timescales)
+
     if aggregate:
-        return (loss_hists, loss_timescales)
-
-def aggregate_loss(file_to_csvrows, graph_dir, test_str):
-    # get aggregate data
-    campus = {}
-    home = {}
-    starbucks = {}
-    for (key, values) in file_to_csvrows.items():
-        print(key)
-        if "campus" in key:
-            campus[key] = values
-        elif "home" in key:
-            home[key] = values
-        elif "starbucks" in key:
-            starbucks[key] = values
-
-    campus_hist, campus_timescale = analyze_loss(campus, graph_dir, test_str, True)
-    home_hist, home_timescale = analyze_loss(home, graph_dir, test_str, True)
-    starbucks_hist, starbucks_timescale = analyze_loss(starbucks, graph_dir, test_str, True)
-
-    for endpoint in campus_hist:
-        c_avg_loss_bursts = compute_average_hist(campus_hist[endpoint])
-        h_avg_loss_bursts = compute_average_hist(home_hist[endpoint])
-        s_avg_loss_bursts = compute_average_hist(starbucks_hist[endpoint])
-
-        c_avg_loss_timescale = compute_average_timescale(campus_timescale[endpoint])
-        h_avg_loss_timescale = compute_average_timescale(home_timescale[endpoint])
-        s_avg_loss_timescale = compute_average_timescale(starbucks_timescale[endpoint])
-
-        graph_hist([c_avg_loss_bursts, h_avg_loss_bursts, s_avg_loss_bursts], 
-            endpoint, "asdfasdf", graph_dir)
-        graph_loss_timescale([c_avg_loss_timescale, h_avg_loss_timescale, s_avg_loss_timescale], 
-            endpoint, "adfasdf", graph_dir)
+        return aggregated
+
+def aggregate_loss(file_to_csvrows, graph_dir, test_str, locations=None, workers=1,
+        results=None):
+    """
+    Graphs the average of every connection of each location (see
+    analyze_loss) together
+    """
+    aggregated = analyze_loss(file_to_csvrows, graph_dir, test_str, True,
+        locations, workers, results)
+
+    endpoints = sorted(set(endpoint for (hists, _) in aggregated.values()
+        for endpoint in hists))
+    name_pre = "{}_aggregate".format(test_str)
+    for endpoint in endpoints:
+        avg_loss_bursts = []
+        avg_loss_timescales = []
+        for location in sorted(aggregated):
+            loss_hists, loss_timescales = aggregated[location]
+            if endpoint in loss_hists:
+                avg_loss_bursts.append(compute_average_hist(loss_hists[endpoint]))
+                avg_loss_timescales.append(compute_average_timescale(loss_timescales[endpoint]))
+
+        graph_hist(avg_loss_bursts, endpoint, name_pre, graph_dir)
+        graph_loss_timescale(avg_loss_timescales, endpoint, name_pre, graph_dir)
 
 # *********************************** END *********************************** #
 
@@ -0,0 +1,118 @@
+import json
+import os
+
+from trace_cache import file_hash
+
+MANIFEST_NAME = "manifest.json"
+# bump whenever analysis code changes in a way that changes results
+MANIFEST_VERSION = 8
+
+
+def _stat(dumpfile):
+    st = os.stat(dumpfile)
+    return {"size": st.st_size, "mtime": st.st_mtime}
+
+def _same_stat(a, b):
+    return a["size"] == b["size"] and a["mtime"] == b["mtime"]
+
+def _same_input(a, b):
+    # dumps are compared by content where both were hashed
+    if a.get("sha1") is not None and b.get("sha1") is not None:
+        return a["sha1"] == b["sha1"]
+    return _same_stat(a, b)
+
+def known_inputs(result_dirs):
+    """
+    dump file name -> hashed input (see input_hashes) recorded in the
+    manifests of result_dirs
+    """
+    known = {}
+    for result_dir in result_dirs:
+        manifest = load_manifest(result_dir)
+        if manifest is None or manifest.get("version") != MANIFEST_VERSION:
+            continue
+        for (name, entry) in manifest["inputs"].items():
+            if entry.get("sha1") is not None:
+                known[name] = entry
+    return known
+
+def input_hashes(dumpfiles, known=None, hashed=True):
+    """
+    dump file name -> {"size", "mtime", "sha1"} for every input of an
+    analysis. A dump with the same size and modification time as in known
+    (see known_inputs) keeps the hash recorded there, the others are hashed,
+    or left without a hash if not hashed (nothing is compared with -F).
+    """
+    if known is None:
+        known = {}
+    inputs = {}
+    for f in sorted(dumpfiles):
+        name = os.path.basename(f)
+        entry = _stat(f)
+        if name in known and _same_stat(known[name], entry):
+            entry["sha1"] = known[name]["sha1"]
+        elif hashed:
+            entry["sha1"] = file_hash(f)
+        inputs[name] = entry
+    return inputs
+
+def _normalize(params):
+    # compare params the way they come back out of the JSON file
+    return json.loads(json.dumps(params, sort_keys=True))
+
+def load_manifest(result_dir):
+    manifest_file = "{}/{}".format(result_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_file):
+        return None
+    with open(manifest_file) as f:
+        try:
+            return json.load(f)
+        except ValueError:
+            return None
+
+def is_up_to_date(result_dir, inputs, params):
+    """
+    True if the results in result_dir were made from the same dumps with the
+    same parameters, and are all still there
+    """
+    manifest = load_manifest(result_dir)
+    if manifest is None or manifest.get("version") != MANIFEST_VERSION:
+        return False
+    if manifest["params"] != _normalize(params):
+        return False
+    recorded = manifest["inputs"]
+    if set(recorded) != set(inputs) or not all(
+            _same_input(recorded[name], inputs[name]) for name in inputs):
+        return False
+    return all(os.path.exists("{}/{}".format(result_dir, output))
+        for output in manifest["outputs"])
+
+def snapshot(result_dir):
+    """
+    file name -> modification time of everything in result_dir, taken before an
+    analysis so the files it writes can be told apart afterwards
+    """
+    if not os.path.exists(result_dir):
+        return {}
+    return {f: os.path.getmtime("{}/{}".format(result_dir, f))
+        for f in os.listdir(result_dir) if f != MANIFEST_NAME}
+
+def write_manifest(result_dir, inputs, params, before):
+    """
+    Records the inputs and parameters of an analysis along with every file it
+    wrote to result_dir
+    """
+    if not os.path.exists(result_dir):
+        os.makedirs(result_dir)
+    after = snapshot(result_dir)
+    outputs = sorted(f for f in after if before.get(f) != after[f])
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "inputs": inputs,
+        "params": _normalize(params),
+        "outputs": outputs,
+    }
+    tmp_file = "{}/{}.tmp".format(result_dir, MANIFEST_NAME)
+    with open(tmp_file, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, "{}/{}".format(result_dir, MANIFEST_NAME))
@@ -0,0 +1,716 @@
+import struct
+import subprocess
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    # fall back to piping through the zstd command line tool
+    zstandard = None
+
+# columns produced for every TCP packet, in the same order as the tshark CSV
+# (see constants.REL_TIME_COL ... constants.DATA_LEN_COL)
+FIELDS = ("time_relative", "ip_id", "srcport", "dstport", "seq", "ack", "len")
+FIELD_DTYPES = {
+    "time_relative": np.float64,
+    "ip_id": np.uint16,
+    "srcport": np.uint16,
+    "dstport": np.uint16,
+    "seq": np.uint32,
+    "ack": np.uint32,
+    "len": np.uint32,
+}
+
+# one record per packet, the trace type every analysis works on
+TRACE_DTYPE = np.dtype([(f, FIELD_DTYPES[f]) for f in FIELDS])
+
+# how much of the capture is read per decoding step
+BLOCK_SIZE = 16 * 1024 * 1024
+# how many packets analyses are fed at once when working through a trace
+CHUNK_PACKETS = 256 * 1024
+
+# link layer types
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = 0x8100
+IPPROTO_TCP = 6
+TCP_SYN = 0x02
+TCP_ACK = 0x10
+
+# splitting a capture at record boundaries without scanning up to them: a
+# position is taken as the start of a record if this many records chain up
+# from it, looking at most RESYNC_WINDOW bytes past where the cut should be
+RESYNC_RECORDS = 8
+RESYNC_WINDOW = 1024 * 1024
+MAX_RECORD_LEN = 256 * 1024
+PCAPNG_NRB = 0x00000004
+PCAPNG_ISB = 0x00000005
+
+# pcap/pcapng magic numbers
+PCAP_MAGIC_US = 0xa1b2c3d4
+PCAP_MAGIC_NS = 0xa1b23c4d
+PCAPNG_SHB = 0x0a0d0d0a
+PCAPNG_BYTE_ORDER = 0x1a2b3c4d
+PCAPNG_IDB = 0x00000001
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+IDB_OPT_TSRESOL = 9
+
+
+class PcapFormatError(Exception):
+    pass
+
+
+# per record location of the link layer frame inside a block of capture data
+Records = namedtuple("Records", ["ts", "units", "offset", "caplen", "wirelen", "linktype"])
+
+# which packets to decode, each field is None to not filter on it
+# ports: packets to or from any of these ports (both directions of a flow)
+# src_ports/dst_ports: packets sent from/to any of these ports
+# payload: True for packets carrying data only, False for ones without data
+FlowFilter = namedtuple("FlowFilter", ["ports", "src_ports", "dst_ports", "payload"])
+FlowFilter.__new__.__defaults__ = (None, None, None, None)
+
+
+def _in_ports(port, ports):
+    return np.isin(port, np.asarray(list(ports), dtype=np.uint16))
+
+def connection_mask(flow_filter, srcport, dstport):
+    """
+    Part of flow_filter that keeps or drops whole TCP connections
+    """
+    mask = np.ones(len(srcport), dtype=bool)
+    if flow_filter is not None and flow_filter.ports is not None:
+        mask = _in_ports(srcport, flow_filter.ports) | _in_ports(dstport, flow_filter.ports)
+    return mask
+
+def flow_mask(flow_filter, srcport, dstport, length):
+    """
+    Boolean mask of the packets matching flow_filter
+    """
+    mask = connection_mask(flow_filter, srcport, dstport)
+    if flow_filter is None:
+        return mask
+    if flow_filter.src_ports is not None:
+        mask &= _in_ports(srcport, flow_filter.src_ports)
+    if flow_filter.dst_ports is not None:
+        mask &= _in_ports(dstport, flow_filter.dst_ports)
+    if flow_filter.payload is not None:
+        mask &= (length > 0) == flow_filter.payload
+    return mask
+
+def filter_trace(trace, flow_filter):
+    """
+    Applies flow_filter to an already decoded trace (or dict of columns)
+    """
+    if flow_filter is None:
+        return trace
+    mask = flow_mask(flow_filter, trace["srcport"], trace["dstport"], trace["len"])
+    if isinstance(trace, dict):
+        return {f: c[mask] for (f, c) in trace.items()}
+    return trace[mask]
+
+
+class PcapScanner:
+    """
+    Splits raw pcap or pcapng bytes into packet records without copying the
+    packet data. Keeps the file/interface state needed to continue scanning
+    across blocks, so a capture can be fed in pieces of any size.
+    """
+    def __init__(self):
+        self.format = None
+        self.endian = "<"
+        self.linktype = None # classic pcap
+        self.units = None # classic pcap, timestamp units per second
+        self.interfaces = [] # pcapng, list of (linktype, units per second)
+
+    def scan(self, buf, final=False):
+        """
+        Returns (Records, consumed) for every complete record in buf, where
+        consumed is the number of bytes that don't need to be fed again
+        """
+        pos = 0
+        if self.format is None:
+            if len(buf) < 24:
+                if final and len(buf) > 0:
+                    raise PcapFormatError("capture too short for a pcap header")
+                return _empty_records(), 0
+            pos = self._read_file_header(buf)
+
+        if self.format == "pcap":
+            records, pos = self._scan_pcap(buf, pos)
+        else:
+            records, pos = self._scan_pcapng(buf, pos)
+
+        if final and pos != len(buf):
+            print("Ignoring {} bytes of truncated record at end of capture".format(len(buf) - pos))
+        return records, pos
+
+    def _read_file_header(self, buf):
+        magic_le = struct.unpack_from("<I", buf, 0)[0]
+        magic_be = struct.unpack_from(">I", buf, 0)[0]
+        if magic_le in (PCAP_MAGIC_US, PCAP_MAGIC_NS) or magic_be in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            self.format = "pcap"
+            self.endian = "<" if magic_le in (PCAP_MAGIC_US, PCAP_MAGIC_NS) else ">"
+            magic = magic_le if self.endian == "<" else magic_be
+            self.units = 1000000000 if magic == PCAP_MAGIC_NS else 1000000
+            self.linktype = struct.unpack_from(self.endian + "I", buf, 20)[0] & 0xffff
+            return 24
+        elif magic_le == PCAPNG_SHB:
+            # section header is parsed as a regular block
+            self.format = "pcapng"
+            return 0
+        raise PcapFormatError("not a pcap or pcapng capture (magic 0x{:08x})".format(magic_le))
+
+    def _scan_pcap(self, buf, pos):
+        hdr = struct.Struct(self.endian + "IIII")
+        n = len(buf)
+        ts = []
+        offset = []
+        caplen = []
+        wirelen = []
+        while pos + 16 <= n:
+            ts_sec, ts_frac, incl_len, orig_len = hdr.unpack_from(buf, pos)
+            if pos + 16 + incl_len > n:
+                break
+            ts.append(ts_sec * self.units + ts_frac)
+            offset.append(pos + 16)
+            caplen.append(incl_len)
+            wirelen.append(orig_len)
+            pos += 16 + incl_len
+
+        count = len(offset)
+        return Records(
+            np.array(ts, dtype=np.int64),
+            np.full(count, self.units, dtype=np.int64),
+            np.array(offset, dtype=np.int64),
+            np.array(caplen, dtype=np.int64),
+            np.array(wirelen, dtype=np.int64),
+            np.full(count, self.linktype, dtype=np.int64)), pos
+
+    def _scan_pcapng(self, buf, pos):
+        n = len(buf)
+        ts = []
+        units = []
+        offset = []
+        caplen = []
+        wirelen = []
+        linktype = []
+        while pos + 12 <= n:
+            if struct.unpack_from("<I", buf, pos)[0] == PCAPNG_SHB:
+                # a new section can switch byte order, so check it every time
+                byte_order = struct.unpack_from("<I", buf, pos + 8)[0]
+                self.endian = "<" if byte_order == PCAPNG_BYTE_ORDER else ">"
+            block_type, block_len = struct.unpack_from(self.endian + "II", buf, pos)
+            if block_len < 12:
+                raise PcapFormatError("bad pcapng block length {} at {}".format(block_len, pos))
+            if pos + block_len > n:
+                break
+
+            if block_type == PCAPNG_SHB:
+                self.interfaces = []
+            elif block_type == PCAPNG_IDB:
+                self.interfaces.append(self._read_idb(buf, pos, block_len))
+            elif block_type == PCAPNG_EPB:
+                if_id, ts_high, ts_low, cap, orig = struct.unpack_from(
+                    self.endian + "IIIII", buf, pos + 8)
+                if_linktype, if_units = self.interfaces[if_id]
+                ts.append((ts_high << 32) | ts_low)
+                units.append(if_units)
+                offset.append(pos + 28)
+                caplen.append(cap)
+                wirelen.append(orig)
+                linktype.append(if_linktype)
+            elif block_type == PCAPNG_SPB:
+                # simple packets have no timestamp, so they can't be placed in time
+                pass
+            pos += block_len
+
+        return Records(
+            np.array(ts, dtype=np.int64),
+            np.array(units, dtype=np.int64),
+            np.array(offset, dtype=np.int64),
+            np.array(caplen, dtype=np.int64),
+            np.array(wirelen, dtype=np.int64),
+            np.array(linktype, dtype=np.int64)), pos
+
+    def find_record(self, buf, pos, base=0):
+        """
+        First offset at or after pos (within RESYNC_WINDOW) where a record
+        starts, found by checking that RESYNC_RECORDS plausible record headers
+        chain up from it. base is any known record boundary before pos, pcapng
+        blocks are 4 byte aligned relative to it. Returns None if none found.
+        """
+        step = 1
+        if self.format == "pcapng":
+            step = 4
+            pos += (base - pos) % 4
+        end = min(pos + RESYNC_WINDOW, len(buf))
+        chains = self._chains_pcap if self.format == "pcap" else self._chains_pcapng
+        for start in range(pos, end, step):
+            if chains(buf, start):
+                return start
+        return None
+
+    def _chains_pcap(self, buf, pos):
+        hdr = struct.Struct(self.endian + "IIII")
+        prev_sec = None
+        for _ in range(RESYNC_RECORDS):
+            if pos + 16 > len(buf):
+                return False
+            ts_sec, ts_frac, incl_len, orig_len = hdr.unpack_from(buf, pos)
+            if (ts_frac >= self.units or incl_len > orig_len
+                    or orig_len > MAX_RECORD_LEN or incl_len == 0):
+                return False
+            # packets of a capture are close together in time
+            if prev_sec is not None and abs(ts_sec - prev_sec) > 3600:
+                return False
+            prev_sec = ts_sec
+            pos += 16 + incl_len
+        return pos <= len(buf)
+
+    def _chains_pcapng(self, buf, pos):
+        for _ in range(RESYNC_RECORDS):
+            if pos + 12 > len(buf):
+                return False
+            block_type, block_len = struct.unpack_from(self.endian + "II", buf, pos)
+            if (block_type not in (PCAPNG_EPB, PCAPNG_SPB, PCAPNG_IDB, PCAPNG_NRB, PCAPNG_ISB)
+                    or block_len < 12 or block_len % 4 != 0
+                    or block_len > MAX_RECORD_LEN + 64 or pos + block_len > len(buf)):
+                return False
+            # the block length is repeated at its end
+            if struct.unpack_from(self.endian + "I", buf, pos + block_len - 4)[0] != block_len:
+                return False
+            if block_type == PCAPNG_EPB and (block_len < 32
+                    or struct.unpack_from(self.endian + "I", buf, pos + 8)[0] >= len(self.interfaces)):
+                return False
+            pos += block_len
+        return True
+
+    def _read_idb(self, buf, pos, block_len):
+        linktype = struct.unpack_from(self.endian + "H", buf, pos + 8)[0]
+        units = 1000000
+        opt = pos + 16
+        end = pos + block_len - 4
+        while opt + 4 <= end:
+            code, length = struct.unpack_from(self.endian + "HH", buf, opt)
+            if code == 0:
+                break
+            if code == IDB_OPT_TSRESOL and length >= 1:
+                resol = buf[opt + 4]
+                if resol & 0x80:
+                    units = 2 ** (resol & 0x7f)
+                else:
+                    units = 10 ** resol
+            opt += 4 + ((length + 3) & ~3)
+        return (linktype, units)
+
+
+def _empty_records():
+    empty = np.zeros(0, dtype=np.int64)
+    return Records(empty, empty, empty, empty, empty, empty)
+
+
+def _u8(data, idx):
+    return data[idx].astype(np.uint32)
+
+def _u16(data, idx):
+    return (_u8(data, idx) << 8) | _u8(data, idx + 1)
+
+def _u32(data, idx):
+    return (_u16(data, idx) << 16) | _u16(data, idx + 2)
+
+
+def decode_records(buf, records, flow_filter=None):
+    """
+    Decodes the Ethernet/Linux cooked/raw IPv4/TCP headers of every record at
+    once. Returns a dict of raw header columns for the TCP packets only:
+    absolute timestamp, ip_id, ports, absolute seq/ack, len, flags and the
+    IPv4 addresses (needed to tell TCP streams apart).
+
+    flow_filter is evaluated on the raw headers. Connections it rules out are
+    dropped before anything else is read. Packets of the remaining connections
+    that don't match its direction/payload part still get their stream fields
+    (addresses, ports, seq, ack, flags) decoded so relative seq/ack numbers
+    come out the same as without a filter, while "selected" holds the indices
+    of the matching packets and the other columns are only read for those.
+    """
+    data = np.frombuffer(buf, dtype=np.uint8)
+    # leave room for the widest (4 byte) read
+    last = max(len(data) - 4, 0)
+    start = records.offset
+    caplen = records.caplen
+    linktype = records.linktype
+
+    def at(rel):
+        # clip so truncated packets can be read safely and masked out later
+        return np.minimum(start + rel, last)
+
+    # link layer
+    l2_len = np.full(len(start), -1, dtype=np.int64)
+    ethertype = np.zeros(len(start), dtype=np.uint32)
+
+    eth = linktype == LINKTYPE_ETHERNET
+    eth_type = _u16(data, at(12))
+    vlan = eth & (eth_type == ETHERTYPE_VLAN)
+    l2_len[eth] = 14
+    l2_len[vlan] = 18
+    ethertype[eth] = eth_type[eth]
+    ethertype[vlan] = _u16(data, at(16))[vlan]
+
+    sll = linktype == LINKTYPE_LINUX_SLL
+    l2_len[sll] = 16
+    ethertype[sll] = _u16(data, at(14))[sll]
+
+    sll2 = linktype == LINKTYPE_LINUX_SLL2
+    l2_len[sll2] = 20
+    ethertype[sll2] = _u16(data, at(0))[sll2]
+
+    raw = (linktype == LINKTYPE_RAW) | (linktype == LINKTYPE_IPV4)
+    l2_len[raw] = 0
+    ethertype[raw] = np.where((_u8(data, at(0)) >> 4) == 4, ETHERTYPE_IPV4, 0)[raw]
+
+    null = linktype == LINKTYPE_NULL
+    l2_len[null] = 4
+    # address family is in host byte order, AF_INET is 2 everywhere
+    family = _u8(data, at(0)) | _u8(data, at(3))
+    ethertype[null] = np.where(family == 2, ETHERTYPE_IPV4, 0)[null]
+
+    # IPv4
+    ip = np.maximum(l2_len, 0)
+    ihl = (_u8(data, at(ip)) & 0xf).astype(np.int64) * 4
+    valid = ((l2_len >= 0) & (ethertype == ETHERTYPE_IPV4)
+        & (caplen >= ip + 20)
+        & ((_u8(data, at(ip)) >> 4) == 4)
+        & (ihl >= 20)
+        & (_u8(data, at(ip + 9)) == IPPROTO_TCP)
+        & ((_u16(data, at(ip + 6)) & 0x1fff) == 0))
+
+    # TCP
+    tcp = ip + ihl
+    thl = (_u8(data, at(tcp + 12)) >> 4).astype(np.int64) * 4
+    valid &= (caplen >= tcp + 20) & (thl >= 20)
+    if flow_filter is not None:
+        valid &= connection_mask(flow_filter,
+            _u16(data, at(tcp)), _u16(data, at(tcp + 2)))
+
+    keep = np.flatnonzero(valid)
+    ip = ip[keep]
+    tcp = tcp[keep]
+    start = start[keep]
+    ihl = ihl[keep]
+    thl = thl[keep]
+
+    total_len = _u16(data, start + ip + 2).astype(np.int64)
+    # segmentation offload can leave the IP total length at 0
+    wire_ip_len = records.wirelen[keep] - ip
+    total_len = np.where(total_len == 0, wire_ip_len, total_len)
+    payload = np.maximum(total_len - ihl - thl, 0)
+    srcport = _u16(data, start + tcp).astype(np.uint16)
+    dstport = _u16(data, start + tcp + 2).astype(np.uint16)
+    stream = {
+        "src_ip": _u32(data, start + ip + 12),
+        "dst_ip": _u32(data, start + ip + 16),
+        "srcport": srcport,
+        "dstport": dstport,
+        "seq": _u32(data, start + tcp + 4),
+        "ack": _u32(data, start + tcp + 8),
+        "flags": _u8(data, start + tcp + 13).astype(np.uint8),
+        "selected": None,
+    }
+
+    if flow_filter is not None:
+        selected = np.flatnonzero(flow_mask(flow_filter, srcport, dstport, payload))
+        stream["selected"] = selected
+        keep = keep[selected]
+        start = start[selected]
+        ip = ip[selected]
+        payload = payload[selected]
+
+    stream.update({
+        "ts": records.ts[keep],
+        "units": records.units[keep],
+        "ip_id": _u16(data, start + ip + 4).astype(np.uint16),
+        "len": payload.astype(np.uint32),
+    })
+    return stream
+
+
+class TraceState:
+    """
+    Converts raw decoded headers into the tshark columns: time relative to the
+    first frame of the capture and sequence/ack numbers relative to the start
+    of each TCP stream direction. Has to see the packets in capture order.
+    """
+    def __init__(self):
+        self.first_ts = None # (timestamp, units per second)
+        self.seq_bases = {} # (src ip, dst ip, src port, dst port) -> base seq
+        self.ack_bases = {}
+
+    def set_first_record(self, records):
+        if self.first_ts is None and len(records.ts) > 0:
+            self.first_ts = (int(records.ts[0]), int(records.units[0]))
+
+    def columns(self, raw):
+        """
+        Returns dict of FIELDS -> np.ndarray for the raw decoded headers
+        """
+        first_ts, first_units = self.first_ts if self.first_ts is not None else (0, 1)
+        ts = raw["ts"]
+        units = raw["units"]
+        # subtract in integer units where possible to keep full precision
+        same_units = (ts - first_ts) / units
+        sec = (ts // units - first_ts // first_units).astype(np.float64)
+        frac = (ts % units) / units - (first_ts % first_units) / first_units
+        time_relative = np.where(units == first_units, same_units, sec + frac)
+
+        # stream bases are tracked over all packets, even filtered out ones
+        seq_base, ack_base = self._stream_bases(raw)
+        seq = (raw["seq"] - seq_base).astype(np.uint32)
+        acked = (raw["flags"] & TCP_ACK) != 0
+        ack = np.where(acked, raw["ack"] - ack_base, 0).astype(np.uint32)
+        srcport = raw["srcport"]
+        dstport = raw["dstport"]
+        selected = raw.get("selected")
+        if selected is not None:
+            seq = seq[selected]
+            ack = ack[selected]
+            srcport = srcport[selected]
+            dstport = dstport[selected]
+        return {
+            "time_relative": time_relative,
+            "ip_id": raw["ip_id"],
+            "srcport": srcport,
+            "dstport": dstport,
+            "seq": seq,
+            "ack": ack,
+            "len": raw["len"],
+        }
+
+    def _stream_bases(self, raw):
+        count = len(raw["seq"])
+        if count == 0:
+            zero = np.zeros(0, dtype=np.uint32)
+            return zero, zero
+
+        keys = np.empty(count, dtype=[("s", "u4"), ("d", "u4"), ("sp", "u2"), ("dp", "u2")])
+        keys["s"] = raw["src_ip"]
+        keys["d"] = raw["dst_ip"]
+        keys["sp"] = raw["srcport"]
+        keys["dp"] = raw["dstport"]
+        streams, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        stream_keys = [tuple(int(v) for v in s) for s in streams]
+
+        # like tshark, the first packet of a direction is seq 0 if it is the
+        # SYN and seq 1 otherwise
+        for i, key in enumerate(stream_keys):
+            if key not in self.seq_bases:
+                syn = raw["flags"][first[i]] & TCP_SYN
+                self.seq_bases[key] = int(raw["seq"][first[i]]) - (0 if syn else 1)
+
+        acked = np.flatnonzero((raw["flags"] & TCP_ACK) != 0)
+        for i, key in enumerate(stream_keys):
+            if key in self.ack_bases:
+                continue
+            reverse = (key[1], key[0], key[3], key[2])
+            if reverse in self.seq_bases:
+                self.ack_bases[key] = self.seq_bases[reverse]
+            else:
+                first_ack = acked[inverse.reshape(-1)[acked] == i]
+                if len(first_ack) > 0:
+                    self.ack_bases[key] = int(raw["ack"][first_ack[0]]) - 1
+
+        seq_base = np.array([self.seq_bases[k] for k in stream_keys], dtype=np.int64)
+        ack_base = np.array([self.ack_bases.get(k, 0) for k in stream_keys], dtype=np.int64)
+        inverse = inverse.reshape(-1)
+        return (seq_base[inverse] & 0xffffffff).astype(np.uint32), \
+            (ack_base[inverse] & 0xffffffff).astype(np.uint32)
+
+
+def empty_columns():
+    return {f: np.zeros(0, dtype=FIELD_DTYPES[f]) for f in FIELDS}
+
+def concat_columns(parts):
+    """
+    Concatenates a list of column dicts in order
+    """
+    if len(parts) == 0:
+        return empty_columns()
+    return {f: np.concatenate([p[f] for p in parts]) for f in FIELDS}
+
+
+def to_trace(columns):
+    """
+    Packs a dict of FIELDS -> np.ndarray into a trace (array of TRACE_DTYPE)
+    """
+    trace = np.empty(len(columns[FIELDS[0]]), dtype=TRACE_DTYPE)
+    for f in FIELDS:
+        trace[f] = columns[f]
+    return trace
+
+
+def iter_chunks(fileobj, block_size=BLOCK_SIZE, flow_filter=None):
+    """
+    Reads a pcap/pcapng capture from a binary file object block by block and
+    yields a dict of FIELDS -> np.ndarray for the TCP packets of each block
+    that match flow_filter
+    """
+    scanner = PcapScanner()
+    state = TraceState()
+    pending = b""
+    while True:
+        block = fileobj.read(block_size)
+        final = not block
+        buf = pending + block if pending else block
+        records, consumed = scanner.scan(buf, final=final)
+        state.set_first_record(records)
+        if len(records.offset) > 0:
+            yield state.columns(decode_records(buf, records, flow_filter))
+        pending = buf[consumed:]
+        if final:
+            break
+
+def _decode_range(scanner, buf, final, flow_filter):
+    """
+    Scans and decodes one range of a capture on a worker, with a copy of the
+    scanner state at its start. Returns (first record, raw columns, consumed
+    bytes, whether the range changed the scanner state).
+    """
+    before = (scanner.endian, list(scanner.interfaces))
+    records, consumed = scanner.scan(buf, final=final)
+    first = Records(*(r[:1] for r in records))
+    changed = (scanner.endian, scanner.interfaces) != before
+    raw = None
+    if len(records.offset) > 0:
+        raw = decode_records(buf, records, flow_filter)
+    return first, raw, consumed, changed
+
+def iter_chunks_parallel(fileobj, workers, block_size=BLOCK_SIZE, flow_filter=None):
+    """
+    Same as iter_chunks, but reads workers blocks at once, cuts them at record
+    boundaries into one range per worker and scans and decodes the ranges on
+    a process pool. Only turning the raw headers into relative seq/ack and
+    time, which depends on every earlier packet, is done here in order.
+    """
+    scanner = PcapScanner()
+    state = TraceState()
+    pending = b""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            block = fileobj.read(block_size * workers)
+            final = not block
+            buf = pending + block if pending else block
+
+            # cut where records chain up, the first time through the file
+            # header and interfaces still have to be read in order
+            cuts = None
+            if scanner.format is not None:
+                cuts = [0]
+                for i in range(1, workers):
+                    cut = scanner.find_record(buf, max(len(buf) * i // workers, cuts[-1] + 1))
+                    if cut is None:
+                        break
+                    cuts.append(cut)
+                cuts.append(len(buf))
+
+            results = None
+            if cuts is not None and len(cuts) > 2:
+                futures = [pool.submit(_decode_range, scanner, buf[start:end],
+                    final and end == len(buf), flow_filter)
+                    for (start, end) in zip(cuts[:-1], cuts[1:])]
+                results = [f.result() for f in futures]
+                # every range but the last has to be used up exactly, or a cut
+                # wasn't really at a record
+                for (i, (first, raw, consumed, changed)) in enumerate(results):
+                    if changed or (i < len(results) - 1 and consumed != cuts[i + 1] - cuts[i]):
+                        results = None
+                        break
+
+            if results is None:
+                records, consumed = scanner.scan(buf, final=final)
+                state.set_first_record(records)
+                if len(records.offset) > 0:
+                    yield state.columns(decode_records(buf, records, flow_filter))
+                pending = buf[consumed:]
+            else:
+                for (first, raw, consumed, changed) in results:
+                    state.set_first_record(first)
+                    if raw is not None:
+                        yield state.columns(raw)
+                pending = buf[cuts[-2] + results[-1][2]:]
+            if final:
+                break
+
+def split_trace(trace, chunk_packets=CHUNK_PACKETS):
+    """
+    Yields consecutive slices of a trace (or dict of columns) of at most
+    chunk_packets packets. Slices of a memmapped trace are only read when used.
+    """
+    if isinstance(trace, dict):
+        count = len(trace[FIELDS[0]])
+    else:
+        count = len(trace)
+    for start in range(0, count, chunk_packets):
+        if isinstance(trace, dict):
+            yield {f: c[start:start + chunk_packets] for (f, c) in trace.items()}
+        else:
+            yield trace[start:start + chunk_packets]
+
+@contextmanager
+def open_capture(path):
+    """
+    Opens a capture as a binary stream. .zst captures are decompressed on the
+    fly, frame by frame, so the decompressed pcap is never written to disk.
+    """
+    if not path.endswith(".zst"):
+        with open(path, "rb") as f:
+            yield f
+    elif zstandard is not None:
+        with open(path, "rb") as raw:
+            with zstandard.ZstdDecompressor().stream_reader(
+                    raw, read_size=BLOCK_SIZE, read_across_frames=True) as f:
+                yield f
+    else:
+        proc = subprocess.Popen(["zstd", "-dcq", path],
+            stdout=subprocess.PIPE, bufsize=BLOCK_SIZE)
+        try:
+            yield proc.stdout
+        finally:
+            proc.stdout.close()
+            proc.wait()
+
+def capture_chunks(fileobj, block_size=BLOCK_SIZE, flow_filter=None, workers=1):
+    """
+    iter_chunks, or iter_chunks_parallel if more than one worker is given
+    """
+    if workers is not None and workers > 1:
+        return iter_chunks_parallel(fileobj, workers, block_size, flow_filter)
+    return iter_chunks(fileobj, block_size, flow_filter)
+
+def iter_trace(path, block_size=BLOCK_SIZE, flow_filter=None, workers=1):
+    """
+    Decodes a .pcap, .pcapng or .pcap.zst file block by block, yielding a
+    trace (see TRACE_DTYPE) of the packets matching flow_filter in each block.
+    Only one block (per worker) is in memory at a time.
+    """
+    with open_capture(path) as f:
+        for columns in capture_chunks(f, block_size, flow_filter, workers):
+            yield to_trace(columns)
+
+def read_trace(path, block_size=BLOCK_SIZE, flow_filter=None, workers=1):
+    """
+    Decodes every TCP packet of a .pcap, .pcapng or .pcap.zst file matching
+    flow_filter into a dict of FIELDS -> np.ndarray, on workers processes
+    """
+    with open_capture(path) as f:
+        return concat_columns(list(capture_chunks(f, block_size, flow_filter, workers)))
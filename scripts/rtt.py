@@ -0,0 +1,174 @@
+import numpy as np
+
+from flows import direction_keys, reverse_keys, group_flows
+
+SEQ_MOD = 1 << 32
+
+
+def unwrap_seq(values, last=None):
+    """
+    Undoes the 32 bit wrap around of the seq (or ack) numbers of one stream
+    direction, in capture order. Steps backwards (retransmissions) are kept.
+    last is the (raw, unwrapped) value the previous chunk ended with.
+    """
+    values = values.astype(np.int64)
+    if len(values) == 0:
+        return values
+    if last is None:
+        last = (values[0], values[0])
+    steps = np.diff(np.concatenate(([last[0]], values)))
+    steps = (steps + SEQ_MOD // 2) % SEQ_MOD - SEQ_MOD // 2
+    return last[1] + np.cumsum(steps)
+
+
+class DirectionState:
+    """
+    What is needed to keep timing the segments of one stream direction across
+    chunks: the last seq/ack numbers for unwrapping, the highest byte sent and
+    acked so far and the original transmissions still waiting for an ACK
+    """
+    def __init__(self):
+        self.last_seq = None
+        self.last_ack = None
+        self.highest = np.iinfo(np.int64).min
+        self.acked = np.iinfo(np.int64).min
+        self.pending = {
+            "ts": np.zeros(0, dtype=np.float64),
+            "start": np.zeros(0, dtype=np.int64),
+            "end": np.zeros(0, dtype=np.int64),
+            "sampled": np.zeros(0, dtype=bool),
+            "ambiguous": np.zeros(0, dtype=bool),
+        }
+
+    def update(self, seg_ts, seg_seq, seg_len, sampled, ack_ts, ack):
+        """
+        Times the data segments of this direction given the ACKs coming back
+        on the reverse direction, both from the same chunk. A segment's RTT is
+        the time until the first ACK whose cumulative acked bytes cover its
+        last byte. Returns (time of the ACK, RTT) for every segment timed.
+        """
+        start = unwrap_seq(seg_seq, self.last_seq)
+        end = start + seg_len
+        if len(start) > 0:
+            self.last_seq = (int(seg_seq[-1]), int(start[-1]))
+
+        # retransmissions start below the highest byte sent before them
+        highest = np.maximum.accumulate(np.concatenate(([self.highest], end)))
+        retrans = start < highest[:-1]
+        self.highest = highest[-1]
+
+        # original transmissions have strictly increasing ends, the ones still
+        # waiting from earlier chunks come first
+        new = ~retrans
+        orig = {
+            "ts": np.concatenate((self.pending["ts"], seg_ts[new])),
+            "start": np.concatenate((self.pending["start"], start[new])),
+            "end": np.concatenate((self.pending["end"], end[new])),
+            "sampled": np.concatenate((self.pending["sampled"], sampled[new])),
+            "ambiguous": np.concatenate((self.pending["ambiguous"],
+                np.zeros(np.count_nonzero(new), dtype=bool))),
+        }
+
+        # cumulative acked bytes only ever grow, so the covering ACK of every
+        # segment can be found with one binary search. What was acked before
+        # this chunk stands in as an ACK from before any segment.
+        acked = unwrap_seq(ack, self.last_ack)
+        if len(acked) > 0:
+            self.last_ack = (int(ack[-1]), int(acked[-1]))
+        acked = np.maximum.accumulate(np.concatenate(([self.acked], acked)))
+        ack_times = np.concatenate(([-np.inf], ack_ts))
+        self.acked = acked[-1]
+        covering = np.searchsorted(acked, orig["end"], side="left")
+        answered = covering < len(acked)
+        acked_at = np.where(answered,
+            ack_times[np.minimum(covering, len(acked) - 1)], np.inf)
+
+        # Karn's rule: an ACK arriving after a segment's bytes were sent again
+        # can't be told apart from an ACK for the copy. A retransmission
+        # overlaps a contiguous range of originals, and since acked_at grows
+        # with the originals the ones acked after it was sent are a suffix.
+        lo = np.searchsorted(orig["end"], start[retrans], side="right")
+        hi = np.searchsorted(orig["start"], end[retrans], side="left")
+        lo = np.maximum(lo, np.searchsorted(acked_at, seg_ts[retrans], side="right"))
+        overlapping = lo < hi
+        overlaps = np.zeros(len(orig["end"]) + 1, dtype=np.int64)
+        np.add.at(overlaps, lo[overlapping], 1)
+        np.add.at(overlaps, hi[overlapping], -1)
+        orig["ambiguous"] |= np.cumsum(overlaps[:-1]) > 0
+
+        rtts = acked_at - orig["ts"]
+        # an ACK captured before the segment it covers isn't a measurement
+        timed = answered & orig["sampled"] & ~orig["ambiguous"] & (rtts >= 0)
+
+        # unanswered segments are always the newest ones
+        self.pending = {f: v[~answered] for (f, v) in orig.items()}
+        return acked_at[timed], rtts[timed]
+
+
+class RttEstimator:
+    """
+    Per segment ACK RTTs of every TCP stream direction, in place of tshark's
+    tcp.analysis.ack_rtt. Unlike tshark, which gives one RTT per ACK for the
+    last segment it acks, every segment acked by a delayed or cumulative ACK
+    gets its own sample. Chunks of a trace are fed in capture order with
+    update(), only segments still waiting for an ACK are kept between chunks.
+    """
+    def __init__(self):
+        self.directions = {} # (src port << 16) | dst port -> DirectionState
+
+    def update(self, trace, data_mask=None):
+        """
+        Returns a float64 array of the RTTs (in seconds) of the segments acked
+        in this chunk (see pcap_reader.TRACE_DTYPE), in the order of the ACKs.
+        If data_mask is given only the data segments in it are timed, the rest
+        of the chunk is still used to find ACKs and retransmissions.
+        """
+        return self.update_timed(trace, data_mask)[1]
+
+    def update_timed(self, trace, data_mask=None):
+        """
+        Like update, but returns (relative time of the ACK, RTT) arrays
+        """
+        # streams are told apart by their ports, like the rest of the analysis
+        keys = direction_keys(trace["srcport"], trace["dstport"])
+        times = trace["time_relative"]
+        has_data = trace["len"] > 0
+        # relative ack is 0 exactly when the ACK flag isn't set
+        has_ack = trace["ack"] > 0
+        sampled = has_data if data_mask is None else has_data & data_mask
+
+        # one sort splits the chunk into its directions, however many there are
+        data_groups = group_flows(keys[has_data])
+        ack_groups = group_flows(keys[has_ack])
+        data_index = np.flatnonzero(has_data)
+        ack_index = np.flatnonzero(has_ack)
+        active = set(data_groups) | set(reverse_keys(np.array(list(ack_groups),
+            dtype=np.uint32)).tolist())
+
+        ack_times = []
+        rtts = []
+        no_packets = np.zeros(0, dtype=np.int64)
+        for key in sorted(active):
+            if key not in self.directions:
+                self.directions[key] = DirectionState()
+            segs = data_index[data_groups.get(key, no_packets)]
+            reverse = int(reverse_keys(np.uint32(key)))
+            acks = ack_index[ack_groups.get(reverse, no_packets)]
+            t, r = self.directions[key].update(times[segs], trace["seq"][segs],
+                trace["len"][segs].astype(np.int64), sampled[segs],
+                times[acks], trace["ack"][acks])
+            ack_times.append(t)
+            rtts.append(r)
+
+        if len(rtts) == 0:
+            return np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.float64)
+        ack_times = np.concatenate(ack_times)
+        rtts = np.concatenate(rtts)
+        order = np.argsort(ack_times, kind="stable")
+        return ack_times[order].astype(np.float64), rtts[order].astype(np.float64)
+
+def ack_rtts(trace, data_mask=None):
+    """
+    RTTs of a whole trace, see RttEstimator
+    """
+    return RttEstimator().update(trace, data_mask)
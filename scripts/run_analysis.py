@@ -9,11 +9,21 @@ import atexit
 import bandwidth as bw
 import csv
 from collections import defaultdict
+from functools import partial
 
 from constants import PORT_START
-from loss_stats import analyze_loss, aggregate_loss
-from helpers import make_csv, decompress, compress
+from loss_stats import analyze_loss, aggregate_loss, run_loss
+from helpers import make_csv, decompress, compress, rows_to_trace, rows_to_rtts
+from pcap_reader import to_trace, filter_trace, flow_mask, split_trace, iter_trace, \
+    FlowFilter
+from rtt import RttEstimator
 from latency import getLatency
+from trace_cache import load_or_decode
+from ingest import estimate_memory, ingest_dumps
+from executor import dump_locations, location_runs
+from manifest import input_hashes, is_up_to_date, known_inputs, snapshot, write_manifest
+import constants
+import latency
 
 # removes csv file after extracting csv data
 def parseCSV(file, save):
@@ -29,25 +39,255 @@ def parseCSV(file, save):
         os.system("rm {}".format(file))
     return csvData
 
+def tshark_csv_rows(file_with_path, csvfile, analysis_type, args):
+    """
+    Gets the rows of tshark's CSV for a single dump, making the CSV first if it
+    isn't saved
+    """
+    file_name = os.path.basename(file_with_path)
+    if not os.path.exists(csvfile):
+        # decompress one at a time size these files are big
+        print("Decompressing {}...".format(file_name))
+        pcapfile = decompress(file_with_path)
+        if not os.path.exists(pcapfile):
+            print("Failed to create pcap file for {}".format(file_name))
+            sys.exit(1)
+
+        # make different csv depending on the test, remove pcap too
+        print("Parsing {} to csv...".format(file_name))
+        new_csvfile = make_csv(pcapfile, csvfile, analysis_type)
+        if not os.path.exists(new_csvfile):
+            print("Failed to create csv file for {}".format(file_name))
+            sys.exit(1)
+
+    # extract data for each file
+    print("Extracting from {}...".format(os.path.basename(csvfile)))
+    return parseCSV(csvfile, args.savecsv) # removes csvfile
+
+def parse_ports(ports):
+    if ports is None:
+        return None
+    return [int(p) for p in ports.split(",")]
+
+def flow_filter_from_args(args):
+    """
+    Builds the pcap_reader.FlowFilter given on the command line, None if no
+    filter was given
+    """
+    payload = {None: None, "data": True, "nodata": False}[args.payload]
+    flow_filter = FlowFilter(parse_ports(args.ports), parse_ports(args.srcports),
+        parse_ports(args.dstports), payload)
+    if flow_filter == FlowFilter():
+        return None
+    return flow_filter
+
+def trace_chunks(file_with_path, csvfiles, trace_cache_dir, args, decode_filter=None,
+        decode_workers=1):
+    """
+    Chunks of a single dump's trace (see pcap_reader.TRACE_DTYPE, or column
+    dicts from the cache), from tshark's CSV with --tshark, the trace cache
+    with -S or else decoded straight from the dump on decode_workers processes
+    """
+    file_name = os.path.basename(file_with_path)
+    if args.tshark:
+        return split_trace(rows_to_trace(
+            tshark_csv_rows(file_with_path, csvfiles["info"], "info", args)))
+    elif args.savecsv:
+        # the cache holds whole dumps so it can be shared by all filters
+        print("Loading trace for {}...".format(file_name))
+        return split_trace(load_or_decode(trace_cache_dir, file_with_path,
+            decode_workers))
+    else:
+        # streams the .zst straight into the decoder, no pcap on disk, and
+        # packets outside the flow filter are never decoded
+        print("Decoding {}...".format(file_name))
+        return iter_trace(file_with_path, flow_filter=decode_filter,
+            workers=decode_workers)
+
+def metric_chunks(file_with_path, csvfiles, trace_cache_dir, metrics, args, data,
+        decode_workers=1):
+    """
+    Decodes a single dump once, worked through in chunks of packets. Every
+    chunk is fed to bandwidth (a bw.BandwidthState) and latency (a
+    latency.LatencyState of RTTs estimated from the same chunks unless
+    --tshark is given), whose states are put in data and don't grow with the
+    capture, and the flow filtered chunk is yielded so loss can be matched
+    from the same pass. The states are complete once all chunks are taken.
+    """
+    flow_filter = flow_filter_from_args(args)
+    native_latency = "latency" in metrics and not args.tshark
+    # RTTs need the ACKs coming back, so for latency only the part of the
+    # filter that picks connections is pushed into the decoder
+    decode_filter = flow_filter
+    if native_latency and flow_filter is not None:
+        decode_filter = FlowFilter(ports=flow_filter.ports)
+    chunks = trace_chunks(file_with_path, csvfiles, trace_cache_dir, args,
+        decode_filter, decode_workers)
+
+    if "bandwidth" in metrics:
+        data["bandwidth"] = bw.BandwidthState(bw.srcPort, bw.destPort)
+    if native_latency:
+        estimator = RttEstimator()
+        data["latency"] = latency.LatencyState()
+    for chunk in chunks:
+        if isinstance(chunk, dict):
+            chunk = to_trace(chunk)
+        if native_latency:
+            data_mask = None
+            if flow_filter is not None:
+                data_mask = flow_mask(flow_filter,
+                    chunk["srcport"], chunk["dstport"], chunk["len"])
+            ack_times, rtts = estimator.update_timed(chunk, data_mask)
+            data["latency"].update(rtts, ack_times)
+        chunk = filter_trace(chunk, flow_filter)
+        if "bandwidth" in metrics:
+            data["bandwidth"].update(chunk)
+        yield chunk
+
+def tshark_latency(file_with_path, csvfiles, metrics, args, data):
+    """
+    Puts the latency.LatencyState of tshark's RTTs in data with --tshark
+    """
+    if "latency" in metrics and args.tshark:
+        data["latency"] = latency.LatencyState()
+        data["latency"].update(rows_to_rtts(
+            tshark_csv_rows(file_with_path, csvfiles["rtt"], "latency", args)))
+
+def extract_file_data(file_with_path, csvfiles, trace_cache_dir, metrics, args,
+        decode_workers=1):
+    """
+    Gets the data for a single dump needed by bandwidth and latency, decoding
+    it only once (see metric_chunks). Loss is streamed later on (see
+    loss_chunks and analyze_run), here it only gets its CSV or cache entry
+    made for -p.
+    Runs in an ingestion worker process, the dump itself is decoded on
+    decode_workers processes.
+    """
+    file_name = os.path.basename(file_with_path)
+    native_latency = "latency" in metrics and not args.tshark
+    data = {}
+    if "bandwidth" in metrics or "loss" in metrics or native_latency:
+        for chunk in metric_chunks(file_with_path, csvfiles, trace_cache_dir,
+                metrics, args, data, decode_workers):
+            pass
+    tshark_latency(file_with_path, csvfiles, metrics, args, data)
+
+    print("...{} done".format(file_name))
+    return data
+
+def analyze_run(run, trace_cache_dir, metrics, args, decode_workers=1):
+    """
+    Reduces one client/server run (endpoint -> (dump, csvfiles)) for loss and
+    the metrics in metrics while decoding each of its dumps once: loss is
+    matched from the same chunks that feed bandwidth and latency (see
+    metric_chunks). Returns (loss_stats.run_loss result of the run, dump file
+    name -> data as from extract_file_data). Runs in a worker process.
+    """
+    data = {endpoint: {} for endpoint in run}
+    chunks = {endpoint: metric_chunks(file_with_path, csvfiles, trace_cache_dir,
+            metrics, args, data[endpoint], decode_workers)
+        for (endpoint, (file_with_path, csvfiles)) in run.items()}
+    loss = run_loss(chunks)
+    # whatever loss didn't take (all of a run missing an endpoint) still has
+    # to go through bandwidth and latency
+    for endpoint_chunks in chunks.values():
+        for chunk in endpoint_chunks:
+            pass
+
+    file_data = {}
+    for (endpoint, (file_with_path, csvfiles)) in run.items():
+        tshark_latency(file_with_path, csvfiles, metrics, args, data[endpoint])
+        file_data[os.path.basename(file_with_path)] = data[endpoint]
+        print("...{} done".format(os.path.basename(file_with_path)))
+    return loss, file_data
+
+def loss_chunks(file_with_path, csvfiles, trace_cache_dir, args, decode_workers=1):
+    """
+    Yields the flow filtered chunks of a single dump's trace for loss, used
+    for lazy catalogs so loss can be matched while the dump streams in
+    """
+    flow_filter = flow_filter_from_args(args)
+    for chunk in trace_chunks(file_with_path, csvfiles, trace_cache_dir, args,
+            flow_filter, decode_workers):
+        if isinstance(chunk, dict):
+            chunk = to_trace(chunk)
+        yield filter_trace(chunk, flow_filter)
+    print("...{} done".format(os.path.basename(file_with_path)))
+
+def csv_paths(root_csv_dir, test_str, l_info, file_name, savecsv):
+    """
+    Where the tshark CSVs of a dump are looked for and saved
+    """
+    dump_name = file_name.split(".pcap.zst")[0]
+    if not savecsv:
+        csvfile = os.path.abspath(dump_name) + ".csv"
+        return {"info": csvfile, "rtt": csvfile}
+    return {
+        "info": "{}/info/{}/{}/{}.csv".format(root_csv_dir, test_str, l_info, dump_name),
+        "rtt": "{}/rtt/{}/{}/{}.csv".format(root_csv_dir, test_str, l_info, dump_name)
+    }
+
+def analysis_params(metric, args):
+    """
+    Everything besides the dumps that the results of a metric depend on
+    """
+    flow_filter = flow_filter_from_args(args)
+    params = {
+        "aggregate": bool(args.aggregate),
+        "tshark": bool(args.tshark),
+        "flow_filter": flow_filter._asdict() if flow_filter is not None else None,
+    }
+    if metric == "bandwidth":
+        params.update({
+            "bucket_size": bw.bucketSize,
+            "src_port": bw.srcPort,
+            "dest_port": bw.destPort,
+            "prefix": bw.prefix,
+            "header_bytes": bw.headerBytes
+        })
+    elif metric == "loss":
+        params.update({
+            "bucket_size": constants.BUCKET_SIZE,
+            "timescale_resolutions": constants.TIMESCALE_RESOLUTIONS,
+            "mtu": constants.MTU,
+            "horizon": constants.LOSS_HORIZON,
+            "ip_id_policies": [constants.CLIENT_IP_ID_POLICY, constants.SERVER_IP_ID_POLICY],
+            "server_port": constants.SERVER_PORT
+        })
+    elif metric == "latency":
+        params.update({
+            "bucket_size": latency.bucketSize,
+            "min_bucket": latency.minBucket,
+            "max_bucket": latency.maxBucket,
+            "bucket_edges": None if latency.bucketEdges is None else latency.makeEdges().tolist(),
+            "hdr": [latency.hdrLowest, latency.hdrHighest, latency.hdrDigits],
+            "sketch_accuracy": latency.sketchAccuracy,
+            "window_sizes": latency.windowSizes,
+            "window_percentiles": latency.windowPercentiles
+        })
+    return params
+
 def analysis(args):
     """
     main analysis function
     """
     print("Getting necessary files for ", end="")
-    analysis_type = ""
+    metrics = []
     if args.bandwidth:
-        analysis_type = "bandwidth"
-        print("bandwidth ",end="")
+        metrics = ["bandwidth"]
     elif args.loss:
-        analysis_type = "loss"
-        print("loss ",end="")
+        metrics = ["loss"]
     elif args.latency:
-        analysis_type = "latency"
-        print("latency ",end="")
+        metrics = ["latency"]
+    elif args.allmetrics:
+        # decode each dump once and run every analysis on it
+        metrics = ["bandwidth", "loss", "latency"]
     else:
         print("Invalid analysis specified")
         sys.exit(1)
-    print("analysis...")
+    print("{} analysis...".format(", ".join(metrics)))
+    if args.logbuckets is not None:
+        latency.bucketEdges = latency.logBuckets(args.logbuckets)
     
     # make file name
     duration = ""
@@ -76,70 +316,46 @@ def analysis(args):
         root_csv_dir = root_dir + args.csvdir
     else:
         root_csv_dir = ""
+    # decoded traces are keyed by dump content, so all tests share one cache
+    trace_cache_dir = "{}/traces".format(root_csv_dir)
     test_str = ""
     if args.concurrentlong:
         analysis_dir = "{}/{}/{}".format(root_analysis_dir, "concurrent_long", file_name)
         test_dir = "{}/{}/{}".format(root_test_dir, "concurrent_long", file_name)
-        graph_dir = "{}/{}/{}/{}".format(root_graph_dir, analysis_type, "concurrent_long", file_name)
         test_str = "concurrent_long"
     elif args.longshort:
         analysis_dir = "{}/{}/{}".format(root_analysis_dir, "long_and_short", file_name)
         test_dir = "{}/{}/{}".format(root_test_dir, "long_and_short", file_name)
-        graph_dir = "{}/{}/{}/{}".format(root_graph_dir, analysis_type, "long_and_short", file_name)
         test_str = "long_and_short"
     elif args.normal:
         analysis_dir = "{}/{}/{}".format(root_analysis_dir, "normal", file_name)
         test_dir = "{}/{}/{}".format(root_test_dir, "normal", file_name)
-        graph_dir = "{}/{}/{}/{}".format(root_graph_dir, analysis_type, "normal", file_name)
         test_str = "normal"
     l_info = file_name
 
     if not os.path.exists(test_dir) and not args.aggregate:
         print("Test dir {} doesn't exist!".format(test_dir))
         sys.exit(1)
-    print(graph_dir)
-    if not os.path.exists(graph_dir):
-        os.makedirs(graph_dir)
+    graph_dirs = {}
+    for metric in metrics:
+        graph_dirs[metric] = "{}/{}/{}/{}".format(root_graph_dir, metric, test_str, file_name)
+        print(graph_dirs[metric])
+        if not os.path.exists(graph_dirs[metric]):
+            os.makedirs(graph_dirs[metric])
     print(analysis_dir)
     if not os.path.exists(analysis_dir):
         os.makedirs(analysis_dir)
     print("Analysis_dir {} set up to analyze test_dir {}.".format(analysis_dir, test_dir))
 
-    # decompress files one at a time and extract information from them
-    csv_data_for_files = {}
+    # find all the dumps first, then decode them in parallel
+    dumps = []
     if not args.aggregate:
         for file_name in os.listdir(test_dir):
             if file_name.endswith(".zst"):
                 # check if saved first
-                csvfile = os.path.abspath(file_name).split(".pcap.zst")[0] + ".csv"
-                if args.savecsv:
-                    if analysis_type == "latency":
-                        csvfile = "{}/rtt/{}/{}/{}.csv".format(
-                            root_csv_dir, test_str, l_info, file_name.split(".pcap.zst")[0])
-                    else:
-                        csvfile = "{}/info/{}/{}/{}.csv".format(
-                            root_csv_dir, test_str, l_info, file_name.split(".pcap.zst")[0])
-                
-                if not os.path.exists(csvfile):
-                    file_with_path = test_dir + "/" + file_name
-                    # decompress one at a time size these files are big
-                    print("Decompressing {}...".format(os.path.basename(file_name)))
-                    pcapfile = decompress(file_with_path)
-                    if not os.path.exists(pcapfile):
-                        print("Failed to create pcap file for {}".format(file_name))
-                        sys.exit(1)
-
-                    # make different csv depending on the test, remove pcap too
-                    print("Parsing {} to csv...".format(os.path.basename(file_name)))
-                    new_csvfile = make_csv(pcapfile, csvfile, analysis_type)
-                    if not os.path.exists(new_csvfile):
-                        print("Failed to create csv file for {}".format(file_name))
-                        sys.exit(1)
-
-                # extract data for each file
-                print("Extracting from {}...".format(os.path.basename(csvfile)))
-                csv_data_for_files[file_name] = parseCSV(csvfile, args.savecsv) # removes csvfile
-                print("...{} done".format(os.path.basename(file_name)))
+                csvfiles = csv_paths(root_csv_dir, test_str, l_info, file_name, args.savecsv)
+                file_with_path = test_dir + "/" + file_name
+                dumps.append((file_name, file_with_path, csvfiles))
     else:
         if args.concurrentlong:
             test_dir = "{}/{}".format(root_test_dir, "concurrent_long")
@@ -151,56 +367,99 @@ def analysis(args):
             for file_name in files:
                 if file_name.endswith(".zst"):
                     # check if saved first
-                    csvfile = os.path.abspath(file_name).split(".pcap.zst")[0] + ".csv"
-                    if args.savecsv:
-                        if analysis_type == "latency":
-                            csvfile = "{}/rtt/{}/{}/{}.csv".format(
-                                root_csv_dir, test_str, os.path.basename(curr_dir), file_name.split(".pcap.zst")[0])
-                        else:
-                            csvfile = "{}/info/{}/{}/{}.csv".format(
-                                root_csv_dir, test_str, os.path.basename(curr_dir), file_name.split(".pcap.zst")[0])
-                    
-                    if not os.path.exists(csvfile):
-                        file_with_path = curr_dir + "/" + file_name
-                        # decompress one at a time size these files are big
-                        print("Decompressing {}...".format(os.path.basename(file_name)))
-                        pcapfile = decompress(file_with_path)
-                        if not os.path.exists(pcapfile):
-                            print("Failed to create pcap file for {}".format(file_name))
-                            sys.exit(1)
-
-                        # make different csv depending on the test, remove pcap too
-                        print("Parsing {} to csv...".format(os.path.basename(file_name)))
-                        new_csvfile = make_csv(pcapfile, csvfile, analysis_type)
-                        if not os.path.exists(new_csvfile):
-                            print("Failed to create csv file for {}".format(file_name))
-                            sys.exit(1)
-
-                    # extract data for each file
-                    print("Extracting from {}...".format(os.path.basename(csvfile)))
-                    csv_data_for_files[file_name] = parseCSV(csvfile, args.savecsv) # removes csvfile
-                    print("...{} done".format(os.path.basename(file_name)))
-    
+                    csvfiles = csv_paths(root_csv_dir, test_str,
+                        os.path.basename(curr_dir), file_name, args.savecsv)
+                    file_with_path = curr_dir + "/" + file_name
+                    dumps.append((file_name, file_with_path, csvfiles))
+
+    # only redo metrics whose dumps or parameters changed since the last run,
+    # dumps are only hashed again if their size or modification time changed
+    inputs = input_hashes([file_with_path for (_, file_with_path, _) in dumps],
+        known_inputs(sorted(set(graph_dirs.values()))), not (args.force or args.processcsv))
+    if not args.force and not args.processcsv:
+        for metric in list(metrics):
+            if is_up_to_date(graph_dirs[metric], inputs, analysis_params(metric, args)):
+                print("{} results in {} are up to date, skipping".format(
+                    metric, graph_dirs[metric]))
+                metrics.remove(metric)
+        if len(metrics) == 0:
+            print("Analysis complete.")
+            return
+
+    # loss is matched run by run while the client and server dumps stream
+    # in, rather than from dumps held whole
+    lazy_loss = "loss" in metrics and not args.processcsv
+    eager_metrics = [m for m in metrics if not (lazy_loss and m == "loss")]
+
+    # with fewer dumps than workers the spare workers split up the dumps
+    # themselves, so even a single big dump is decoded on every core
+    workers = args.jobs if args.jobs is not None else (os.cpu_count() or 1)
+    decode_workers = max(1, workers // max(len(dumps), 1))
+
+    # locations are the directories the dumps are in
+    locations = dump_locations([file_with_path for (_, file_with_path, _) in dumps])
+    # runs are reduced on their own processes, up to run_workers at once, and
+    # the workers left over split up the two dumps of each run, so no more
+    # than workers decode at once
+    run_workers = min(workers, max(len(dumps) // 2, 1))
+    run_decode_workers = max(1, workers // (2 * run_workers))
+
+    data_for_files = {}
+    loss_results = None
+    traces = {}
+    if lazy_loss and len(eager_metrics) > 0:
+        # loss is matched run by run from the same pass over the client and
+        # server dumps that feeds bandwidth and latency, so each dump is
+        # only decoded once
+        catalog = {file_name: (file_with_path, csvfiles)
+            for (file_name, file_with_path, csvfiles) in dumps}
+        run_results = ingest_dumps([(unit, estimate_memory(run_decode_workers, len(run)),
+                (run, trace_cache_dir, eager_metrics, args, run_decode_workers))
+                for (unit, run) in location_runs(catalog, locations)],
+            analyze_run, run_workers, args.memlimit * 1024 * 1024)
+        loss_results = {unit: loss for (unit, (loss, _)) in run_results.items()}
+        for (_, file_data) in run_results.values():
+            data_for_files.update(file_data)
+    elif len(eager_metrics) > 0:
+        jobs = [(file_name, estimate_memory(decode_workers),
+            (file_with_path, csvfiles, trace_cache_dir, eager_metrics, args, decode_workers))
+            for (file_name, file_with_path, csvfiles) in dumps]
+        data_for_files = ingest_dumps(jobs, extract_file_data,
+            workers, args.memlimit * 1024 * 1024)
+    if lazy_loss and loss_results is None:
+        # loss on its own gets a catalog that decodes one client/server run
+        # at a time while matching it
+        traces = {file_name: partial(loss_chunks,
+            file_with_path, csvfiles, trace_cache_dir, args, run_decode_workers)
+            for (file_name, file_with_path, csvfiles) in dumps}
+    bandwidths = {f: data["bandwidth"] for (f, data) in data_for_files.items() if "bandwidth" in data}
+    latencies = {f: data["latency"] for (f, data) in data_for_files.items() if "latency" in data}
+
     # run analysis on files
     print("\n")
     if args.processcsv:
         sys.exit(0)
-    elif args.bandwidth:
-        print("Analyzing bandwidth...")
-        bw.getBandwidth(csv_data_for_files, graph_dir)
-    elif args.loss:
-        print("Analyzing packet loss...")
-        if args.aggregate:
-            aggregate_loss(csv_data_for_files, graph_dir, test_str)
-        else:
-            analyze_loss(csv_data_for_files, graph_dir, test_str)
-    elif args.latency:
-        print("Analyzing per packet latency...")
-        if args.aggregate:
-            aggregate_latency(csv_data_for_files, graph_dir)
-        else:
-            getLatency(csv_data_for_files, graph_dir)
-        
+    for metric in metrics:
+        before = snapshot(graph_dirs[metric])
+        if metric == "bandwidth":
+            print("Analyzing bandwidth...")
+            bw.getBandwidth(bandwidths, graph_dirs["bandwidth"], workers)
+        elif metric == "loss":
+            print("Analyzing packet loss...")
+            if args.aggregate:
+                aggregate_loss(traces, graph_dirs["loss"], test_str, locations, run_workers,
+                    loss_results)
+            else:
+                analyze_loss(traces, graph_dirs["loss"], test_str, False, locations, run_workers,
+                    loss_results)
+        elif metric == "latency":
+            print("Analyzing per packet latency...")
+            if args.aggregate:
+                latency.aggregateLatency(latencies, graph_dirs["latency"], test_str, locations)
+            else:
+                getLatency(latencies, graph_dirs["latency"], False, workers)
+        write_manifest(graph_dirs[metric], inputs, analysis_params(metric, args), before)
+
     print("Analysis complete.")
     return
 
@@ -229,10 +488,27 @@ required_args.add_argument("-T", "--testdir",
 required_args.add_argument("-G", "--graphdir",
     help="directory name for where the graphs should be saved (not full path)")
 required_args.add_argument("-c", "--csvdir", 
-    help="path to root directory of where to store csvs\n")
+    help="path to root directory of where to store cached traces and csvs\n")
 required_args.add_argument("-S", "--savecsv",
     action="store_true",
-    help="save CSVs and look for saved CSVs\n")
+    help="cache decoded traces (and tshark CSVs) and look for cached ones\n")
+required_args.add_argument("--tshark",
+    action="store_true",
+    help="parse dumps and get RTTs with tshark instead of the built-in decoder\n")
+required_args.add_argument("-F", "--force",
+    action="store_true",
+    help="redo analyses even if their results are up to date\n")
+required_args.add_argument("-j", "--jobs",
+    type=int,
+    help="number of processes decoding dumps, defaults to number of cores\n")
+required_args.add_argument("--logbuckets",
+    type=int,
+    help="number of log spaced latency buckets, instead of the linear grid\n")
+required_args.add_argument("-m", "--memlimit",
+    type=int,
+    default=4096,
+    help="memory budget in MB for the decoding blocks of dumps decoded at once\n")
+
 # required_args.add_argument("-n", "--numtests", 
 #     help="number of times to run analysis\n")
 # required_args.add_argument("-i", "--keyfile",
@@ -265,6 +541,21 @@ test_args.add_argument("-X", "--loss",
 test_args.add_argument("-Y", "--latency",
     action="store_true",
     help="analyze per packet latency\n")
+test_args.add_argument("-M", "--allmetrics",
+    action="store_true",
+    help="analyze bandwidth, loss and latency from a single decode of each dump\n")
+
+flow_args = parser.add_argument_group("flow filter",
+    "only decode the packets of some flows, comma separated port lists")
+flow_args.add_argument("--ports",
+    help="packets to or from any of these ports\n")
+flow_args.add_argument("--srcports",
+    help="packets sent from any of these ports\n")
+flow_args.add_argument("--dstports",
+    help="packets sent to any of these ports\n")
+flow_args.add_argument("--payload",
+    choices=["data", "nodata"],
+    help="only packets carrying data, or only packets without data\n")
 
 parser.set_defaults(func=analysis)
 
@@ -0,0 +1,44 @@
+import numpy as np
+
+import constants
+
+# how the ip ids of the MTU sized segments a TSO/GRO payload went out as
+# advance: "same" reuses the payload's ip id for every segment, "increment"
+# gives the ith segment the payload's ip id + i (wrapping like the header does)
+IP_ID_POLICIES = ("same", "increment")
+
+
+def segment_counts(lengths, mtu=constants.MTU):
+    """
+    Number of segments each payload went out as, packets without data count as
+    one
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    return np.maximum(-(-lengths // mtu), 1)
+
+def expand_segments(trace, ip_id_policy, mtu=constants.MTU):
+    """
+    Breaks the payloads of a trace (see pcap_reader.TRACE_DTYPE) down into the
+    MTU sized segments they were sent as. Returns dict of "packet" (index of
+    the packet in trace), "ts", "seq", "ack", "ip_id" and "len" arrays with one
+    entry per segment, in the order they were sent.
+    """
+    if ip_id_policy not in IP_ID_POLICIES:
+        raise ValueError("unknown ip id policy {}".format(ip_id_policy))
+    lengths = trace["len"].astype(np.int64)
+    counts = segment_counts(lengths, mtu)
+    packet = np.repeat(np.arange(len(trace)), counts)
+    # index of each segment within its payload
+    index = np.arange(len(packet)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    ip_id = trace["ip_id"][packet].astype(np.int64)
+    if ip_id_policy == "increment":
+        ip_id = (ip_id + index) & 0xffff
+    return {
+        "packet": packet,
+        "ts": trace["time_relative"][packet],
+        "seq": (trace["seq"][packet].astype(np.int64) + index * mtu) & 0xffffffff,
+        "ack": trace["ack"][packet].astype(np.int64),
+        "ip_id": ip_id,
+        "len": np.minimum(lengths[packet] - index * mtu, mtu).clip(min=0),
+    }
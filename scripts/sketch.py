@@ -0,0 +1,102 @@
+import math
+
+import numpy as np
+
+# every quantile is within this relative error of an actual value
+DEFAULT_ACCURACY = 0.01
+# at 1% accuracy this covers a microsecond to over a minute before the
+# lowest bins start getting folded together
+DEFAULT_MAX_BINS = 2048
+# values at or below this are counted as zero
+MIN_VALUE = 1e-9
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch of positive values in the style of DDSketch:
+    bin i counts the values in (gamma^(i-1), gamma^i], so any quantile is
+    known to within the relative accuracy whatever the distribution. The
+    bins are a dense count array from the lowest bin used, and if there
+    would be more than max_bins the lowest ones are folded together, giving
+    up accuracy at the low end first. Sketches of chunks or trials with the
+    same accuracy are merged by adding up their bins.
+    """
+    def __init__(self, accuracy=DEFAULT_ACCURACY, max_bins=DEFAULT_MAX_BINS):
+        self.accuracy = accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.offset = 0 # bin index of counts[0]
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.zeros = 0
+        self.count = 0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        positive = values > MIN_VALUE
+        self.zeros += len(values) - np.count_nonzero(positive)
+        self.count += len(values)
+        values = values[positive]
+        if len(values) == 0:
+            return
+        bins = np.ceil(np.log(values) / self.log_gamma).astype(np.int64)
+        lo = int(bins.min())
+        self._add(lo, np.bincount(bins - lo))
+
+    def merge(self, other):
+        if other.gamma != self.gamma:
+            raise ValueError("can't merge sketches of different accuracy")
+        self.zeros += other.zeros
+        self.count += other.count
+        if len(other.counts) > 0:
+            self._add(other.offset, other.counts)
+
+    def _add(self, lo, counts):
+        if len(self.counts) == 0:
+            merged_lo = lo
+            merged = counts.astype(np.int64)
+        else:
+            merged_lo = min(self.offset, lo)
+            hi = max(self.offset + len(self.counts), lo + len(counts))
+            merged = np.zeros(hi - merged_lo, dtype=np.int64)
+            merged[self.offset - merged_lo:self.offset - merged_lo + len(self.counts)] += self.counts
+            merged[lo - merged_lo:lo - merged_lo + len(counts)] += counts
+        # fold the lowest bins into the lowest one kept
+        extra = len(merged) - self.max_bins
+        if extra > 0:
+            merged[extra] += merged[:extra].sum()
+            merged = merged[extra:]
+            merged_lo += extra
+        self.offset = merged_lo
+        self.counts = merged
+
+    def _values(self):
+        # the value every bin stands for, within accuracy of all of (gamma^(i-1), gamma^i]
+        bins = np.arange(self.offset, self.offset + len(self.counts))
+        return 2 * np.power(self.gamma, bins) / (self.gamma + 1)
+
+    def quantile(self, q):
+        """
+        Estimated q quantile (0 <= q <= 1) of the values added, nan if empty
+        """
+        return float(self.quantiles([q])[0])
+
+    def quantiles(self, qs):
+        qs = np.asarray(qs, dtype=np.float64)
+        if self.count == 0:
+            return np.full(len(qs), np.nan)
+        values = np.concatenate(([0.0], self._values()))
+        cumulative = np.cumsum(np.concatenate(([self.zeros], self.counts)))
+        ranks = qs * (self.count - 1)
+        return values[np.searchsorted(cumulative, ranks, side="right")]
+
+    def cdf(self):
+        """
+        (values, fraction of values at or below each) for every nonempty bin
+        """
+        values = np.concatenate(([0.0], self._values()))
+        counts = np.concatenate(([self.zeros], self.counts))
+        nonempty = counts > 0
+        if self.count == 0:
+            return values[nonempty], np.zeros(0, dtype=np.float64)
+        return values[nonempty], np.cumsum(counts[nonempty]) / float(self.count)
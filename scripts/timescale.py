@@ -0,0 +1,104 @@
+import numpy as np
+
+import constants
+
+
+def time_buckets(ts, bucket_us):
+    """
+    Index of the bucket of bucket_us microseconds every relative time falls
+    in. Times are rounded to microseconds (the resolution of the dumps) first
+    so bucket edges are exact instead of drifting like summed float sizes.
+    """
+    us = np.rint(np.asarray(ts, dtype=np.float64) * 1e6).astype(np.int64)
+    return np.maximum(us // bucket_us, 0)
+
+class TimescalePyramid:
+    """
+    Counts of events over time at every resolution in resolutions, bucketed
+    in one pass. Every level is a dense count array from the start of the
+    trace, grown geometrically as later times come in, so a chunk is added
+    with one bincount per level whatever has been counted before. Events are
+    fed in chunks with update(), and pyramids of runs with the same
+    resolutions are merged by adding up their levels.
+    """
+    def __init__(self, resolutions=constants.TIMESCALE_RESOLUTIONS):
+        self.resolutions = sorted(resolutions)
+        self.bucket_us = int(round(self.resolutions[0] * 1e6))
+        self.factors = [self._factor(resolution) for resolution in self.resolutions]
+        # counts of every level, past the used part they are zeros kept as
+        # room to grow
+        self.levels = [np.zeros(0, dtype=np.float64) for _ in self.resolutions]
+        self.end = 0 # number of finest buckets, empty ones at the end included
+        self.integral = True
+
+    def _factor(self, resolution):
+        factor = int(round(resolution * 1e6)) // self.bucket_us
+        if factor < 1 or factor * self.bucket_us != int(round(resolution * 1e6)):
+            raise ValueError("resolution {} isn't a multiple of {}".format(
+                resolution, self.resolutions[0]))
+        return factor
+
+    def update(self, ts, weights=None):
+        """
+        Adds the events at relative times ts, each counting weights (1 if not
+        given, e.g. a bool array counts the events where it's True)
+        """
+        buckets = time_buckets(ts, self.bucket_us)
+        if len(buckets) == 0:
+            return
+        if weights is None:
+            weights = np.ones(len(buckets), dtype=np.int64)
+        weights = np.asarray(weights)
+        self.integral = self.integral and weights.dtype.kind in "biu"
+        self._grow(int(buckets.max()) + 1)
+        weights = weights.astype(np.float64)
+        for (counts, factor) in zip(self.levels, self.factors):
+            level_buckets = buckets // factor
+            lo = int(level_buckets.min())
+            added = np.bincount(level_buckets - lo, weights)
+            counts[lo:lo + len(added)] += added
+
+    def merge(self, other):
+        """
+        Adds the counts of another pyramid with the same resolutions
+        """
+        if other.resolutions != self.resolutions:
+            raise ValueError("can't merge pyramids of different resolutions")
+        self.integral = self.integral and other.integral
+        self._grow(other.end)
+        for (counts, other_counts, factor) in zip(self.levels, other.levels, self.factors):
+            n = -(-other.end // factor)
+            counts[:n] += other_counts[:n]
+
+    def _grow(self, end):
+        # at least doubling keeps the copies down to a constant per bucket
+        self.end = max(self.end, end)
+        for (i, factor) in enumerate(self.factors):
+            n = -(-self.end // factor)
+            if n > len(self.levels[i]):
+                grown = np.zeros(max(n, 2 * len(self.levels[i])), dtype=np.float64)
+                grown[:len(self.levels[i])] = self.levels[i]
+                self.levels[i] = grown
+
+    def level(self, resolution=constants.BUCKET_SIZE):
+        """
+        (bucket end times, counts) of every bucket of resolution seconds from
+        the start of the trace to its last event, empty buckets included
+        """
+        factor = self._factor(resolution)
+        n = -(-self.end // factor)
+        if factor in self.factors:
+            counts = self.levels[self.factors.index(factor)][:n].copy()
+        else:
+            # summed from the finest level
+            finest = self.levels[0][:self.end]
+            counts = np.bincount(np.arange(self.end) // factor, finest, minlength=n)
+        if self.integral:
+            counts = np.rint(counts).astype(np.int64)
+        return np.arange(1, n + 1) * resolution, counts
+
+    def pyramid(self):
+        """
+        resolution -> level(resolution) for every resolution
+        """
+        return {resolution: self.level(resolution) for resolution in self.resolutions}
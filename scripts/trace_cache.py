@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import pcap_reader
+
+# bump whenever the decoder output changes so old caches are rebuilt
+CACHE_VERSION = 1
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_hash(path):
+    """
+    Content hash of a dump, used as the cache key
+    """
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        block = f.read(HASH_BLOCK_SIZE)
+        while block:
+            h.update(block)
+            block = f.read(HASH_BLOCK_SIZE)
+    return h.hexdigest()
+
+def entry_dir(cache_dir, digest):
+    return "{}/{}".format(cache_dir, digest)
+
+def load_trace(cache_dir, dumpfile, digest=None):
+    """
+    Returns the cached columns for dumpfile as read-only memmaps, or None if the
+    dump isn't cached or the cache is stale
+    """
+    if digest is None:
+        digest = file_hash(dumpfile)
+    entry = entry_dir(cache_dir, digest)
+    meta_file = "{}/meta.json".format(entry)
+    if not os.path.exists(meta_file):
+        return None
+    with open(meta_file) as f:
+        meta = json.load(f)
+    if meta.get("version") != CACHE_VERSION or meta.get("hash") != digest:
+        return None
+
+    count = meta["count"]
+    columns = {}
+    for field in pcap_reader.FIELDS:
+        dtype = np.dtype(meta["dtypes"][field])
+        if count == 0:
+            # can't memmap an empty file
+            columns[field] = np.zeros(0, dtype=dtype)
+        else:
+            columns[field] = np.memmap("{}/{}.bin".format(entry, field),
+                dtype=dtype, mode="r", shape=(count,))
+    return columns
+
+def save_trace(cache_dir, dumpfile, columns, digest=None):
+    """
+    Writes one raw binary file per column, meta.json is written last so a
+    partially written entry is never loaded
+    """
+    save_chunks(cache_dir, dumpfile, [columns], digest)
+
+def save_chunks(cache_dir, dumpfile, chunks, digest=None):
+    """
+    Like save_trace, but appends the column dicts of chunks to the column
+    files one by one so the whole trace is never in memory
+    """
+    if digest is None:
+        digest = file_hash(dumpfile)
+    entry = entry_dir(cache_dir, digest)
+    if not os.path.exists(entry):
+        os.makedirs(entry)
+
+    files = {f: open("{}/{}.bin".format(entry, f), "wb") for f in pcap_reader.FIELDS}
+    dtypes = {f: np.dtype(pcap_reader.FIELD_DTYPES[f]).str for f in pcap_reader.FIELDS}
+    count = 0
+    try:
+        for columns in chunks:
+            for field in pcap_reader.FIELDS:
+                column = np.ascontiguousarray(columns[field])
+                column.tofile(files[field])
+                dtypes[field] = column.dtype.str
+            count += len(columns[pcap_reader.FIELDS[0]])
+    finally:
+        for f in files.values():
+            f.close()
+
+    meta = {
+        "version": CACHE_VERSION,
+        "hash": digest,
+        "source": os.path.basename(dumpfile),
+        "count": count,
+        "dtypes": dtypes,
+    }
+    tmp_file = "{}/meta.json.tmp".format(entry)
+    with open(tmp_file, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_file, "{}/meta.json".format(entry))
+
+def load_or_decode(cache_dir, dumpfile, workers=1):
+    """
+    Loads a dump's columns from the cache as memmaps, decoding and caching it
+    on a miss (on workers processes)
+    """
+    digest = file_hash(dumpfile)
+    columns = load_trace(cache_dir, dumpfile, digest)
+    if columns is None:
+        print("No cached trace for {}, decoding...".format(os.path.basename(dumpfile)))
+        # decoded block by block straight into the cache, then memmapped
+        with pcap_reader.open_capture(dumpfile) as f:
+            save_chunks(cache_dir, dumpfile,
+                pcap_reader.capture_chunks(f, workers=workers), digest)
+        columns = load_trace(cache_dir, dumpfile, digest)
+    return columns
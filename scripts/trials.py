@@ -0,0 +1,78 @@
+from collections import namedtuple
+
+import numpy as np
+
+# per index statistics over the trials (runs) of a test
+TrialStats = namedtuple("TrialStats", ["mean", "median", "low", "high",
+    "ci_low", "ci_high"])
+
+
+def stack_trials(series, fill=0):
+    """
+    Pads per trial series of different lengths with fill into a 2D float
+    array, one row per trial
+    """
+    lengths = np.array([len(s) for s in series], dtype=np.int64)
+    stacked = np.full((len(series), lengths.max() if len(series) > 0 else 0),
+        fill, dtype=np.float64)
+    present = np.arange(stacked.shape[1]) < lengths[:, None]
+    if present.any():
+        stacked[present] = np.concatenate([np.asarray(s, dtype=np.float64)
+            for s in series])
+    return stacked
+
+def stack_hists(hists):
+    """
+    Stacks per trial histograms (dicts of value -> count) over the sorted
+    union of their values, values missing from a trial count 0. Returns
+    (values, 2D array with one row per trial).
+    """
+    values = np.unique(np.concatenate([np.array(list(h.keys()), dtype=np.int64)
+        for h in hists])) if len(hists) > 0 else np.zeros(0, dtype=np.int64)
+    stacked = np.zeros((len(hists), len(values)), dtype=np.float64)
+    for (i, h) in enumerate(hists):
+        keys = np.array(list(h.keys()), dtype=np.int64)
+        stacked[i, np.searchsorted(values, keys)] = list(h.values())
+    return values, stacked
+
+def average_hist(hists):
+    """
+    Average of per trial histograms, values missing from a trial count 0 for
+    it and values averaging 0 are left out
+    """
+    values, stacked = stack_hists(hists)
+    if len(hists) > 0:
+        stacked = stacked / len(hists)
+    return {value: count for (value, count)
+        in zip(values.tolist(), stacked.sum(axis=0).tolist()) if count > 0}
+
+def bootstrap_means(stacked, resamples=1000, seed=0):
+    """
+    Means of resamples bootstrap resamples of the trials (rows), each row of
+    the result is the mean of one resample
+    """
+    n = stacked.shape[0]
+    # RandomState rather than default_rng, which the locked numpy predates
+    rng = np.random.RandomState(seed)
+    picks = rng.randint(0, n, size=(resamples, n))
+    # how often each trial was picked in each resample
+    weights = np.zeros((resamples, n), dtype=np.float64)
+    np.add.at(weights, (np.repeat(np.arange(resamples), n), picks.ravel()), 1)
+    return weights @ stacked / n
+
+def trial_stats(stacked, percentiles=(5, 95), confidence=0.95, resamples=1000,
+        seed=0):
+    """
+    TrialStats of every column of stacked trials: mean, median, the
+    percentiles band over the trials and the bootstrap confidence interval
+    of the mean
+    """
+    if stacked.shape[0] == 0:
+        empty = np.zeros(stacked.shape[1], dtype=np.float64)
+        return TrialStats(empty, empty, empty, empty, empty, empty)
+    low, high = np.percentile(stacked, percentiles, axis=0)
+    tail = (1 - confidence) / 2 * 100
+    ci_low, ci_high = np.percentile(bootstrap_means(stacked, resamples, seed),
+        [tail, 100 - tail], axis=0)
+    return TrialStats(stacked.mean(axis=0), np.median(stacked, axis=0),
+        low, high, ci_low, ci_high)
@@ -0,0 +1,74 @@
+import numpy as np
+
+from timescale import time_buckets
+
+PERCENTILES = [50, 95, 99]
+
+
+def nearest_rank(sorted_values, percentiles):
+    """
+    Nearest rank percentiles of already sorted values
+    """
+    n = len(sorted_values)
+    ranks = np.ceil(np.asarray(percentiles, dtype=np.float64) / 100 * n).astype(np.int64) - 1
+    return sorted_values[np.clip(ranks, 0, n - 1)]
+
+class WindowedPercentiles:
+    """
+    Percentiles of a series (e.g. RTTs by the time of their ACK) over every
+    window of window seconds of a trace. Chunks are fed in time order with
+    update(), only the values of the window still open are kept and each
+    window is sorted once, when it closes.
+    """
+    def __init__(self, window, percentiles=PERCENTILES):
+        self.window = window
+        self.window_us = int(round(window * 1e6))
+        self.percentiles = list(percentiles)
+        self.current = None # index of the open window
+        self.pending = []
+        self.windows = [] # indices of the closed windows with values
+        self.rows = [] # their percentiles
+        self.counts = []
+
+    def update(self, times, values):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+        windows = time_buckets(times, self.window_us)
+        if self.current is not None:
+            # a late time is counted in the window still open
+            windows = np.maximum(windows, self.current)
+        bounds = np.flatnonzero(np.diff(windows)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(values)]))
+        for (s, e) in zip(starts.tolist(), ends.tolist()):
+            if windows[s] != self.current:
+                self._close()
+                self.current = int(windows[s])
+            self.pending.append(values[s:e])
+
+    def _close(self):
+        if len(self.pending) == 0:
+            return
+        values = np.sort(np.concatenate(self.pending))
+        self.windows.append(self.current)
+        self.rows.append(nearest_rank(values, self.percentiles))
+        self.counts.append(len(values))
+        self.pending = []
+
+    def result(self):
+        """
+        (window start times, 2D array of the percentiles of every window, one
+        column per percentile, count of every window). Windows run from the
+        start of the trace to the last one with values, empty ones are nan
+        with a count of 0 so results of different trials line up.
+        """
+        self._close()
+        n = self.windows[-1] + 1 if len(self.windows) > 0 else 0
+        starts = np.arange(n) * self.window
+        rows = np.full((n, len(self.percentiles)), np.nan)
+        counts = np.zeros(n, dtype=np.int64)
+        if len(self.windows) > 0:
+            rows[self.windows] = self.rows
+            counts[self.windows] = self.counts
+        return starts, rows, counts
@@ -0,0 +1,133 @@
+"""
+Small synthetic client/server captures for the tests
+"""
+import struct
+
+import numpy as np
+import zstandard
+
+from constants import MTU, PORT_START, SERVER_PORT
+
+TCP_SYN = 0x02
+TCP_ACK = 0x10
+CLIENT_IP = 0x0a000001
+SERVER_IP = 0x0a000002
+EPOCH = 1600000000
+
+
+def tcp_frame(p):
+    """
+    Ethernet + IPv4 + TCP frame of a packet dict, the payload is zeros
+    """
+    ip_len = 40 + p["len"]
+    eth = b"\x00" * 12 + struct.pack(">H", 0x0800)
+    ip = struct.pack(">BBHHHBBHII", 0x45, 0, ip_len, p["ip_id"], 0x4000, 64, 6, 0,
+        p["src_ip"], p["dst_ip"])
+    tcp = struct.pack(">HHIIBBHHH", p["srcport"], p["dstport"], p["seq"], p["ack"],
+        5 << 4, p["flags"], 65535, 0, 0)
+    return eth + ip + tcp + b"\x00" * p["len"]
+
+def _time(ts):
+    usec = int(round((EPOCH + ts) * 1e6))
+    return usec // 1000000, usec % 1000000, usec
+
+def write_pcap(path, packets):
+    with open(path, "wb") as f:
+        f.write(struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        for p in packets:
+            frame = tcp_frame(p)
+            sec, usec, _ = _time(p["ts"])
+            f.write(struct.pack("<IIII", sec, usec, len(frame), len(frame)))
+            f.write(frame)
+
+def _block(block_type, body):
+    body += b"\x00" * (-len(body) % 4)
+    length = len(body) + 12
+    return struct.pack("<II", block_type, length) + body + struct.pack("<I", length)
+
+def write_pcapng(path, packets):
+    with open(path, "wb") as f:
+        f.write(_block(0x0a0d0d0a, struct.pack("<IHHq", 0x1a2b3c4d, 1, 0, -1)))
+        f.write(_block(0x00000001, struct.pack("<HHI", 1, 0, 65535)))
+        for p in packets:
+            frame = tcp_frame(p)
+            _, _, usec = _time(p["ts"])
+            f.write(_block(0x00000006, struct.pack("<IIIII", 0, usec >> 32,
+                usec & 0xffffffff, len(frame), len(frame)) + frame))
+
+def compress(path):
+    """
+    Writes path.zst next to path, in several frames like a rotated dump
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    cctx = zstandard.ZstdCompressor()
+    with open(path + ".zst", "wb") as f:
+        for start in range(0, len(data), 4096):
+            f.write(cctx.compress(data[start:start + 4096]))
+    return path + ".zst"
+
+def _packet(ts, client_sends, seq, ack, flags, ip_id, length, port):
+    src, dst = (CLIENT_IP, SERVER_IP) if client_sends else (SERVER_IP, CLIENT_IP)
+    srcport, dstport = (port, SERVER_PORT) if client_sends else (SERVER_PORT, port)
+    return {"ts": ts, "src_ip": src, "dst_ip": dst, "srcport": srcport,
+        "dstport": dstport, "seq": seq & 0xffffffff, "ack": ack & 0xffffffff,
+        "flags": flags, "ip_id": ip_id & 0xffff, "len": length}
+
+def conversation(segments=200, loss=0.05, seed=0, delay=0.02, connections=1,
+        max_len=MTU, duplicates=0.0, isn=(0xfffff000, 0x7fff0000),
+        ip_id_start=(0xffc0, 0xfff0)):
+    """
+    Client and server captures of connections where the client sends segments
+    payloads of up to max_len bytes and the server answers each with up to
+    max_len bytes of its own. Payloads over the MTU are captured whole by
+    the sender and as MTU sized segments by the receiver, with ip ids as in
+    constants.CLIENT_IP_ID_POLICY and SERVER_IP_ID_POLICY. Every segment
+    after the handshake is lost with probability loss, and a payload is sent
+    again unchanged with probability duplicates. The default ISNs and ip ids
+    wrap around. Returns (client packets, server packets) in capture order.
+    """
+    rng = np.random.RandomState(seed)
+    client = []
+    server = []
+
+    def send(ts, client_sends, seq, ack, flags, ip_id, length, port, lossy=True):
+        out, into = (client, server) if client_sends else (server, client)
+        out.append(_packet(ts, client_sends, seq, ack, flags, ip_id, length, port))
+        increment = not client_sends
+        for i in range(max(-(-length // MTU), 1)):
+            if lossy and rng.rand() < loss:
+                continue
+            into.append(_packet(ts + delay + i * 1e-5, client_sends, seq + i * MTU,
+                ack, flags, ip_id + (i if increment else 0),
+                min(length - i * MTU, MTU) if length > 0 else 0, port))
+
+    for c in range(connections):
+        port = PORT_START + c
+        start = c * 0.001
+        client_seq, server_seq = isn[0] + c, isn[1] + c
+        client_id, server_id = ip_id_start
+        send(start, True, client_seq, 0, TCP_SYN, client_id, 0, port, lossy=False)
+        send(start + delay, False, server_seq, client_seq + 1, TCP_SYN | TCP_ACK,
+            server_id, 0, port, lossy=False)
+        client_seq += 1
+        server_seq += 1
+        for i in range(segments):
+            ts = start + 2 * delay + i * 0.002
+            length = int(rng.randint(1, max_len + 1))
+            client_id += 1
+            for _ in range(1 + (rng.rand() < duplicates)):
+                send(ts, True, client_seq, server_seq, TCP_ACK, client_id, length, port)
+                ts += 1e-4
+            client_seq += length
+            reply = int(rng.randint(0, max_len + 1))
+            for _ in range(1 + (rng.rand() < duplicates)):
+                send(ts + delay, False, server_seq, client_seq, TCP_ACK,
+                    server_id + 1, reply, port)
+                ts += 1e-4
+            server_id += max(-(-reply // MTU), 1)
+            server_seq += reply
+
+    client.sort(key=lambda p: p["ts"])
+    server.sort(key=lambda p: p["ts"])
+    return client, server
@@ -0,0 +1,8 @@
+import os
+import sys
+
+import matplotlib
+matplotlib.use("Agg")
+
+# the scripts import each other as top level modules
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
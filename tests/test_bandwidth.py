@@ -0,0 +1,48 @@
+import numpy as np
+
+import bandwidth as bw
+from pcap_reader import TRACE_DTYPE
+
+
+def trace(n, seed=0):
+    rng = np.random.RandomState(seed)
+    data = np.zeros(n, dtype=TRACE_DTYPE)
+    # a gap of several empty buckets in the middle
+    data["time_relative"] = np.sort(rng.rand(n)) * 5 + np.where(np.arange(n) > n // 2, 1.0, 0)
+    outgoing = rng.rand(n) < 0.7
+    data["srcport"] = np.where(outgoing, 62388, 5201)
+    data["dstport"] = np.where(outgoing, 5201, 62388)
+    data["len"] = np.where(rng.rand(n) < 0.8, rng.randint(1, 3000, n), 0)
+    return data
+
+def naive_buckets(data):
+    # every bucket up to the one of the last packet, the first packet is left out
+    counted = (data["srcport"] == 62388) & (data["dstport"] == 5201)
+    buckets = np.floor(np.rint(data["time_relative"] * 1e6) / 100000).astype(np.int64)
+    return np.bincount(buckets[1:], np.where(counted, data["len"], 0)[1:]).astype(np.int64)
+
+def state_of(chunks):
+    state = bw.BandwidthState("62388", "5201")
+    for chunk in chunks:
+        state.update(chunk)
+    return state
+
+def test_buckets_match_naive_bincount():
+    data = trace(5000)
+    buckets, dataPerBucket = state_of(np.array_split(data, 9)).result()
+    # the bucket of the last packet isn't done
+    assert dataPerBucket == naive_buckets(data)[:-1].tolist()
+    np.testing.assert_allclose(buckets, np.arange(1, len(dataPerBucket) + 1) * 0.1)
+
+def test_merge_adds_up_states():
+    a, b = trace(2000, 1)[:1000], trace(3000, 2)
+    merged = state_of([a])
+    merged.merge(state_of([b]))
+    assert merged.packets == 4000
+    expected = naive_buckets(b)
+    expected[:len(naive_buckets(a))] += naive_buckets(a)
+    assert merged.result()[1] == expected[:-1].tolist()
+    totals = merged.flowTotals()
+    for (src, dest) in ((62388, 5201), (5201, 62388)):
+        sent = [d[(d["srcport"] == src) & (d["dstport"] == dest)]["len"].sum() for d in (a, b)]
+        assert totals[(src, dest)] == sum(sent)
@@ -0,0 +1,29 @@
+import numpy as np
+
+from flows import FlowTable, connection_keys, direction_keys, group_flows, reverse_keys
+
+
+def test_flow_ids_in_order_of_appearance_across_chunks():
+    rng = np.random.RandomState(0)
+    table = FlowTable()
+    expected = {}
+    for _ in range(20):
+        keys = (rng.randint(0, 50, size=rng.randint(0, 30)) * 7919).astype(np.uint32)
+        for key in keys.tolist():
+            expected.setdefault(key, len(expected))
+        assert table.ids(keys).tolist() == [expected[key] for key in keys.tolist()]
+    assert table.keys.tolist() == sorted(expected, key=expected.get)
+
+def test_both_directions_share_a_connection_key():
+    src = np.array([62387, 5201, 62388, 5201])
+    dst = np.array([5201, 62387, 5201, 62388])
+    keys = connection_keys(src, dst)
+    assert keys[0] == keys[1] and keys[2] == keys[3] and keys[0] != keys[2]
+    directions = direction_keys(src, dst)
+    np.testing.assert_array_equal(reverse_keys(directions), direction_keys(dst, src))
+
+def test_group_flows_keeps_capture_order():
+    ids = np.array([2, 0, 2, 1, 0, 2])
+    groups = group_flows(ids)
+    assert {k: v.tolist() for (k, v) in groups.items()} == {0: [1, 4], 1: [3], 2: [0, 2, 5]}
+    assert group_flows(np.zeros(0, dtype=np.int64)) == {}
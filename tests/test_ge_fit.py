@@ -0,0 +1,30 @@
+import numpy as np
+
+import ge_fit
+from ge_fit import fit_ge
+
+
+def simulate(n, p, r, k, h, seed):
+    # loss bitmap of a Gilbert-Elliott chain started in the good state
+    rng = np.random.RandomState(seed)
+    switch = rng.rand(n)
+    bad = np.zeros(n, dtype=bool)
+    state = False
+    for i in range(n):
+        state = (switch[i] >= r) if state else (switch[i] < p)
+        bad[i] = state
+    return rng.rand(n) >= np.where(bad, h, k)
+
+def test_fit_recovers_simulated_chain():
+    truth = (0.01, 0.2, 0.995, 0.3)
+    bitmaps = [simulate(100000, *truth, seed=seed) for seed in range(2)]
+    p, r, k, h, loglik = fit_ge(bitmaps)
+    np.testing.assert_allclose((p, r), truth[:2], rtol=0.15)
+    np.testing.assert_allclose((k, h), truth[2:], atol=0.02)
+    assert loglik < 0
+
+def test_fit_does_not_depend_on_the_chunks_it_works_in(monkeypatch):
+    lost = simulate(20000, 0.02, 0.3, 0.99, 0.4, seed=3)
+    whole = fit_ge([lost])
+    monkeypatch.setattr(ge_fit, "FIT_CHUNK", 1000)
+    np.testing.assert_allclose(fit_ge([lost]), whole, rtol=1e-6)
@@ -0,0 +1,37 @@
+import numpy as np
+
+from hdr import HdrHistogram
+
+
+def exact_quantiles(values, qs):
+    # the value at the rank HdrHistogram.quantiles looks for
+    return np.sort(values)[np.floor(np.asarray(qs) * (len(values) - 1)).astype(np.int64)]
+
+def test_quantiles_within_significant_digits():
+    values = np.random.RandomState(0).lognormal(np.log(0.02), 1.5, 100000)
+    values = values[(values > 1e-4) & (values < 60)]
+    hist = HdrHistogram(significant_digits=2)
+    for chunk in np.array_split(values, 7):
+        hist.update(chunk)
+    qs = np.linspace(0, 1, 101)
+    error = np.abs(hist.quantiles(qs) - exact_quantiles(values, qs)) / exact_quantiles(values, qs)
+    assert error.max() <= 0.01
+
+def test_overflow_and_merge():
+    a = HdrHistogram(highest=1.0)
+    a.update([0.5, 2.0])
+    b = HdrHistogram(highest=1.0)
+    b.update([0.001, 5.0, 7.0])
+    a.merge(b)
+    assert a.count == 5 and a.overflow == 3
+    assert a.quantile(1.0) == np.inf
+    both = HdrHistogram(highest=1.0)
+    both.update([0.5, 2.0, 0.001, 5.0, 7.0])
+    np.testing.assert_array_equal(a.counts, both.counts)
+
+def test_dict_round_trip():
+    hist = HdrHistogram()
+    hist.update(np.random.RandomState(1).exponential(0.01, 1000))
+    again = HdrHistogram.from_dict(hist.to_dict())
+    np.testing.assert_array_equal(again.counts, hist.counts)
+    assert again.count == hist.count and again.layout() == hist.layout()
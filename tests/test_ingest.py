@@ -0,0 +1,39 @@
+import os
+import time
+
+import pcap_reader
+from ingest import estimate_memory, ingest_dumps
+
+
+def record_run(log_dir, key):
+    # notes when the job ran, in a file per job since jobs run in other processes
+    start = time.time()
+    time.sleep(0.05)
+    with open(os.path.join(log_dir, str(key)), "w") as f:
+        f.write("{} {}".format(start, time.time()))
+    return key * 2
+
+def spans(log_dir, keys):
+    result = []
+    for key in keys:
+        with open(os.path.join(log_dir, str(key))) as f:
+            result.append(tuple(float(v) for v in f.read().split()))
+    return sorted(result)
+
+def test_results_in_job_order(tmpdir):
+    jobs = [(key, 1, (str(tmpdir), key)) for key in (3, 1, 2)]
+    results = ingest_dumps(jobs, record_run, workers=2)
+    assert list(results.items()) == [(3, 6), (1, 2), (2, 4)]
+
+def test_memory_budget_runs_jobs_one_at_a_time(tmpdir):
+    jobs = [(key, 100, (str(tmpdir), key)) for key in range(4)]
+    ingest_dumps(jobs, record_run, workers=4, mem_budget=150)
+    runs = spans(str(tmpdir), range(4))
+    for (earlier, later) in zip(runs, runs[1:]):
+        assert earlier[1] <= later[0]
+
+def test_estimate_grows_with_decode_workers_not_dump_size():
+    one = estimate_memory()
+    assert one > 2 * pcap_reader.BLOCK_SIZE
+    assert estimate_memory(decode_workers=4) == 4 * one
+    assert estimate_memory(decode_workers=2, dumps=2) == 4 * one
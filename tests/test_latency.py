@@ -0,0 +1,35 @@
+import numpy as np
+
+import latency
+
+
+def test_rtts_past_the_last_edge_go_in_the_overflow_bin():
+    edges = np.array([0.001, 0.002, 0.004])
+    counts = latency.sortIntoBuckets(edges, [0.0005, 0.001, 0.0019, 0.0039, 0.004, 10.0])
+    # below the first edge isn't counted, the last bin is the overflow
+    np.testing.assert_array_equal(counts, [2, 1, 2])
+
+def test_state_buckets_and_hdr_overflow(monkeypatch):
+    monkeypatch.setattr(latency, "bucketEdges", [0.0, 0.001, 0.01])
+    monkeypatch.setattr(latency, "hdrHighest", 1.0)
+    state = latency.LatencyState()
+    state.update([0.0005, 0.002, 0.02, 5.0])
+    other = latency.LatencyState()
+    other.update([0.0001])
+    state.merge(other)
+    starts, widths, counts = latency.histogramOf(state)
+    np.testing.assert_array_equal(starts, [0.0, 0.001])
+    assert widths is None
+    np.testing.assert_array_equal(counts, [2, 1, 2])
+    # the HDR histogram counts past hdrHighest as its overflow
+    assert state.hdr.overflow == 1 and state.hdr.count == 5
+
+    monkeypatch.setattr(latency, "bucketEdges", None)
+    hdr_only = latency.LatencyState()
+    hdr_only.update([0.002, 5.0])
+    starts, widths, counts = latency.histogramOf(hdr_only)
+    assert len(counts) == len(starts) + 1 and counts[-1] == 1 and counts.sum() == 2
+
+def test_log_buckets_start_at_min_bucket():
+    edges = latency.logBuckets(5, 0.0001, 0.01)
+    np.testing.assert_allclose(edges, [0.0, 0.0001, 0.000316227766, 0.001, 0.00316227766, 0.01])
@@ -0,0 +1,75 @@
+import numpy as np
+
+from loss_stats import LOSS_DTYPE, LossRunState, loss_runs
+
+
+def loss_array(lost):
+    data = np.zeros(len(lost), dtype=LOSS_DTYPE)
+    data["ts"] = np.arange(len(lost)) * 0.001
+    data["lost"] = lost
+    return data
+
+def runs_of(chunks, keep_times=True):
+    state = LossRunState(keep_times)
+    for chunk in chunks:
+        state.update(chunk)
+    return state.result()
+
+def assert_same_runs(a, b):
+    assert a.burst_hist == b.burst_hist
+    assert a.gap_hist == b.gap_hist
+    np.testing.assert_array_equal(a.burst_starts, b.burst_starts)
+    np.testing.assert_array_equal(a.burst_ends, b.burst_ends)
+
+def naive_runs(lost):
+    # (is lost, length) of every run, one packet at a time
+    runs = []
+    for l in lost.tolist():
+        if runs and runs[-1][0] == l:
+            runs[-1][1] += 1
+        else:
+            runs.append([l, 1])
+    return runs
+
+def test_loss_runs_match_naive_encoding():
+    lost = np.random.RandomState(0).rand(500) < 0.3
+    runs = loss_runs(loss_array(lost))
+    assert [[l, n] for (l, n) in zip(runs["lost"].tolist(), runs["length"].tolist())] \
+        == naive_runs(lost)
+
+def test_split_at_any_point_gives_same_runs():
+    lost = np.random.RandomState(1).rand(200) < 0.4
+    data = loss_array(lost)
+    whole = runs_of([data])
+    for split in range(len(data) + 1):
+        assert_same_runs(runs_of([data[:split], data[split:]]), whole)
+
+def test_many_chunks_with_empty_ones_give_same_runs():
+    rng = np.random.RandomState(2)
+    # long bursts so runs span several chunks
+    lost = np.repeat(rng.rand(60) < 0.5, rng.randint(1, 30, size=60))
+    data = loss_array(lost)
+    whole = runs_of([data])
+    for _ in range(20):
+        cuts = np.sort(rng.randint(0, len(data) + 1, size=15))
+        chunks = np.split(data, cuts)
+        assert_same_runs(runs_of(chunks), whole)
+
+def test_burst_running_into_the_end_is_counted():
+    data = loss_array(np.array([False, True, True, False, True, True, True]))
+    result = runs_of([data[:5], data[5:]])
+    assert result.burst_hist == {2: 1, 3: 1}
+    assert result.gap_hist == {1: 2}
+    assert result.burst_starts.tolist() == [0.001, 0.004]
+    assert result.burst_ends.tolist() == [0.002, 0.006]
+
+def test_hists_match_naive_runs_without_keeping_times():
+    lost = np.random.RandomState(3).rand(1000) < 0.2
+    data = loss_array(lost)
+    result = runs_of(np.array_split(data, 13), keep_times=False)
+    runs = naive_runs(lost)
+    bursts = [n for (l, n) in runs if l]
+    gaps = [n for (l, n) in runs if not l]
+    assert result.burst_hist == {n: bursts.count(n) for n in set(bursts)}
+    assert result.gap_hist == {n: gaps.count(n) for n in set(gaps)}
+    assert result.burst_starts is None and result.burst_ends is None
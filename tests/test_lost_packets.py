@@ -0,0 +1,67 @@
+from collections import defaultdict
+
+import numpy as np
+
+import constants
+from captures import conversation
+from loss_stats import get_lost_packets, split_directions, stream_lost_packets
+from pcap_reader import TRACE_DTYPE, split_trace
+
+
+def trace_of(packets):
+    """
+    Trace of synthetic packets, with their raw (wrapping) seq/ack numbers
+    """
+    trace = np.zeros(len(packets), dtype=TRACE_DTYPE)
+    for (i, p) in enumerate(packets):
+        trace[i] = (p["ts"], p["ip_id"], p["srcport"], p["dstport"], p["seq"],
+            p["ack"], p["len"])
+    return trace
+
+def dict_lost_packets(out_data, in_data, increment):
+    # the (seq, ack) -> [is_lost, time, ip id] dict get_lost_packets used
+    # before the join, with the connection in the key and seq/ip id wrapping
+    sent = defaultdict(list)
+    for p in out_data.tolist():
+        ts, ip_id, srcport, dstport, seq, ack, length = p
+        conn = srcport ^ dstport
+        for i in range(max(-(-length // constants.MTU), 1)):
+            sent[(conn, (seq + i * constants.MTU) & 0xffffffff, ack)].append(
+                [True, ts, (ip_id + (i if increment else 0)) & 0xffff])
+    for p in in_data.tolist():
+        ts, ip_id, srcport, dstport, seq, ack, length = p
+        for packet in sent[(srcport ^ dstport, seq, ack)]:
+            if packet[2] == ip_id:
+                packet[0] = False
+                break
+    return sorted((ts, lost) for packets in sent.values() for (lost, ts, ip_id) in packets)
+
+def as_list(loss_data):
+    return list(zip(loss_data["ts"].tolist(), loss_data["lost"].tolist()))
+
+def test_join_matches_dict_implementation():
+    client, server = conversation(segments=400, loss=0.1, connections=3,
+        max_len=3 * constants.MTU, duplicates=0.1)
+    client, server = trace_of(client), trace_of(server)
+    # seq numbers and ip ids wrap within the conversation
+    assert (np.diff(client["seq"].astype(np.int64)) < -(1 << 31)).any()
+    assert (np.diff(server["ip_id"].astype(np.int64)) < -(1 << 15)).any()
+
+    client_loss, server_loss = get_lost_packets(client, server)
+    client_out, client_in = split_directions(client)
+    server_in, server_out = split_directions(server)
+    assert as_list(client_loss) == dict_lost_packets(client_out, server_in, False)
+    assert as_list(server_loss) == dict_lost_packets(server_out, client_in, True)
+    assert client_loss["lost"].any() and not client_loss["lost"].all()
+    assert server_loss["lost"].any() and not server_loss["lost"].all()
+
+def test_streaming_matches_batch():
+    client, server = conversation(segments=500, loss=0.1, connections=2,
+        max_len=3 * constants.MTU, duplicates=0.1)
+    client, server = trace_of(client), trace_of(server)
+    client_loss, server_loss = get_lost_packets(client, server)
+    for chunk_packets in (1, 7, 100, len(client) + len(server)):
+        parts = list(stream_lost_packets(split_trace(client, chunk_packets),
+            split_trace(server, chunk_packets)))
+        assert as_list(np.concatenate([c for (c, s) in parts])) == as_list(client_loss)
+        assert as_list(np.concatenate([s for (c, s) in parts])) == as_list(server_loss)
@@ -0,0 +1,58 @@
+import os
+
+import manifest
+from manifest import input_hashes, is_up_to_date, known_inputs, snapshot, write_manifest
+
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+def analyze(result_dir, inputs, params):
+    before = snapshot(result_dir)
+    if not os.path.exists(result_dir):
+        os.makedirs(result_dir)
+    write(os.path.join(result_dir, "graph.png"), b"png")
+    write_manifest(result_dir, inputs, params, before)
+
+def test_manifest_hit_and_miss(tmpdir):
+    dump = str(tmpdir.join("run_client1_1.pcap.zst"))
+    result_dir = str(tmpdir.join("graphs"))
+    write(dump, b"dump")
+    params = {"bucket_size": 0.1}
+    analyze(result_dir, input_hashes([dump]), params)
+
+    assert is_up_to_date(result_dir, input_hashes([dump]), params)
+    assert not is_up_to_date(result_dir, input_hashes([dump]), {"bucket_size": 0.2})
+    write(dump, b"changed dump")
+    assert not is_up_to_date(result_dir, input_hashes([dump]), params)
+    write(dump, b"dump")
+    assert is_up_to_date(result_dir, input_hashes([dump]), params)
+    os.remove(os.path.join(result_dir, "graph.png"))
+    assert not is_up_to_date(result_dir, input_hashes([dump]), params)
+
+def test_dumps_are_only_hashed_when_their_stat_changes(tmpdir, monkeypatch):
+    dump = str(tmpdir.join("run_client1_1.pcap.zst"))
+    result_dir = str(tmpdir.join("graphs"))
+    write(dump, b"dump")
+    params = {}
+    analyze(result_dir, input_hashes([dump]), params)
+
+    hashed = []
+    def counting_hash(path):
+        hashed.append(path)
+        return "not the hash"
+    monkeypatch.setattr(manifest, "file_hash", counting_hash)
+    assert is_up_to_date(result_dir, input_hashes([dump], known_inputs([result_dir])), params)
+    assert hashed == []
+    # -F doesn't hash at all, and what it records still matches
+    os.utime(dump, (0, 0))
+    inputs = input_hashes([dump], known_inputs([result_dir]), hashed=False)
+    assert hashed == [] and "sha1" not in inputs[os.path.basename(dump)]
+    analyze(result_dir, inputs, params)
+    assert is_up_to_date(result_dir, input_hashes([dump], known_inputs([result_dir]),
+        hashed=False), params)
+    # a touched dump is hashed again
+    os.utime(dump, (1, 1))
+    assert not is_up_to_date(result_dir, input_hashes([dump], known_inputs([result_dir])), params)
+    assert hashed == [dump]
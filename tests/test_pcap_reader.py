@@ -0,0 +1,32 @@
+import os
+
+import numpy as np
+import pytest
+
+from captures import compress, conversation, write_pcap, write_pcapng
+from pcap_reader import FIELDS, concat_columns, iter_chunks, iter_chunks_parallel, \
+    open_capture, read_trace
+
+
+@pytest.mark.parametrize("writer", [write_pcap, write_pcapng])
+def test_parallel_decode_matches_serial(tmpdir, writer):
+    client, _ = conversation(segments=300, loss=0.05, connections=2)
+    path = os.path.join(str(tmpdir), "client.pcap")
+    writer(path, client)
+    with open(path, "rb") as f:
+        serial = concat_columns(list(iter_chunks(f, block_size=4096)))
+    assert len(serial["seq"]) == len(client)
+    # small blocks so every read is cut into ranges for the workers
+    for workers in (2, 3):
+        with open(path, "rb") as f:
+            parallel = concat_columns(list(iter_chunks_parallel(f, workers,
+                block_size=4096)))
+        for field in FIELDS:
+            np.testing.assert_array_equal(parallel[field], serial[field])
+
+    with open_capture(compress(path)) as f:
+        compressed = concat_columns(list(iter_chunks_parallel(f, 2, block_size=4096)))
+    whole = read_trace(path)
+    for field in FIELDS:
+        np.testing.assert_array_equal(compressed[field], serial[field])
+        np.testing.assert_array_equal(whole[field], serial[field])
@@ -0,0 +1,29 @@
+import numpy as np
+
+from pcap_reader import TRACE_DTYPE
+from rtt import ack_rtts
+
+
+def packets(rows):
+    # (time, src port, dst port, seq, ack, len) of every packet
+    trace = np.zeros(len(rows), dtype=TRACE_DTYPE)
+    for (i, (ts, srcport, dstport, seq, ack, length)) in enumerate(rows):
+        trace[i] = (ts, i, srcport, dstport, seq, ack, length)
+    return trace
+
+def test_karns_rule_skips_retransmitted_segments():
+    trace = packets([
+        (0.00, 1, 2, 1, 1, 100),
+        (0.05, 2, 1, 1, 101, 0),
+        # sent again after its ACK, so the sample above stands
+        (0.055, 1, 2, 1, 1, 100),
+        (0.06, 1, 2, 101, 1, 100),
+        (0.07, 1, 2, 201, 1, 100),
+        # times out and is sent again, the ACK can't be told apart from one
+        # for the copy
+        (0.30, 1, 2, 101, 1, 100),
+        (0.35, 2, 1, 1, 301, 0),
+        (0.40, 1, 2, 301, 1, 100),
+        (0.45, 2, 1, 1, 401, 0),
+    ])
+    np.testing.assert_allclose(ack_rtts(trace), [0.05, 0.28, 0.05])
@@ -0,0 +1,45 @@
+import argparse
+import os
+from collections import Counter
+
+import run_analysis
+from captures import compress, conversation, write_pcap
+from loss_stats import run_loss
+from pcap_reader import iter_trace
+
+
+def write_run(tmpdir):
+    client, server = conversation(segments=300, loss=0.05, connections=2)
+    run = {}
+    for (endpoint, packets) in (("client", client), ("server", server)):
+        path = os.path.join(str(tmpdir), "{}.pcap".format(endpoint))
+        write_pcap(path, packets)
+        run[endpoint] = (compress(path), {})
+    return run
+
+def args():
+    return argparse.Namespace(tshark=False, savecsv=False, ports=None,
+        srcports=None, dstports=None, payload=None)
+
+def test_analyze_run_decodes_every_dump_once(tmpdir, monkeypatch):
+    run = write_run(tmpdir)
+    decodes = Counter()
+
+    def counting_iter_trace(path, *a, **kw):
+        decodes[path] += 1
+        return iter_trace(path, *a, **kw)
+    monkeypatch.setattr(run_analysis, "iter_trace", counting_iter_trace)
+
+    loss, file_data = run_analysis.analyze_run(run, None, ["bandwidth", "latency"], args())
+    assert decodes == Counter({path: 1 for (path, _) in run.values()})
+    assert set(file_data) == {os.path.basename(path) for (path, _) in run.values()}
+    for data in file_data.values():
+        assert data["bandwidth"].packets > 0
+        assert data["latency"].hdr.count > 0
+
+    # same loss as decoding the dumps for loss alone
+    expected = run_loss({endpoint: iter_trace(path) for (endpoint, (path, _)) in run.items()})
+    for endpoint in ("client", "server"):
+        # burst and gap length hists
+        assert loss[endpoint][:2] == expected[endpoint][:2]
+    assert len(loss["client"][0]) > 0 and len(loss["server"][0]) > 0
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from pcap_reader import TRACE_DTYPE
+from segments import expand_segments, segment_counts
+
+
+def trace():
+    data = np.zeros(3, dtype=TRACE_DTYPE)
+    data["time_relative"] = [0.1, 0.2, 0.3]
+    data["ip_id"] = [7, 0xfffe, 9]
+    data["seq"] = [1, 0xffffffff - 1000, 5000]
+    data["ack"] = [11, 12, 13]
+    data["len"] = [0, 3000, 1448]
+    return data
+
+def test_segment_counts():
+    np.testing.assert_array_equal(segment_counts([0, 1, 1448, 1449, 4344]), [1, 1, 1, 2, 3])
+
+def test_increment_policy_wraps_seq_and_ip_id():
+    segs = expand_segments(trace(), "increment")
+    np.testing.assert_array_equal(segs["packet"], [0, 1, 1, 1, 2])
+    np.testing.assert_array_equal(segs["ip_id"], [7, 0xfffe, 0xffff, 0, 9])
+    np.testing.assert_array_equal(segs["seq"],
+        [1, 0xffffffff - 1000, 447, 447 + 1448, 5000])
+    np.testing.assert_array_equal(segs["len"], [0, 1448, 1448, 104, 1448])
+    np.testing.assert_array_equal(segs["ack"], [11, 12, 12, 12, 13])
+    np.testing.assert_array_equal(segs["ts"], [0.1, 0.2, 0.2, 0.2, 0.3])
+
+def test_same_policy_keeps_ip_id():
+    segs = expand_segments(trace(), "same")
+    np.testing.assert_array_equal(segs["ip_id"], [7, 0xfffe, 0xfffe, 0xfffe, 9])
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        expand_segments(trace(), "random")
@@ -0,0 +1,40 @@
+import numpy as np
+
+from sketch import QuantileSketch
+
+
+def exact_quantiles(values, qs):
+    return np.sort(values)[np.floor(np.asarray(qs) * (len(values) - 1)).astype(np.int64)]
+
+def test_quantiles_within_relative_accuracy():
+    values = np.random.RandomState(0).lognormal(np.log(0.02), 2, 100000)
+    sketch = QuantileSketch(accuracy=0.01)
+    for chunk in np.array_split(values, 5):
+        sketch.update(chunk)
+    qs = np.linspace(0, 1, 101)
+    exact = exact_quantiles(values, qs)
+    assert (np.abs(sketch.quantiles(qs) - exact) / exact).max() <= 0.01
+
+def test_merge_is_the_same_as_one_sketch():
+    rng = np.random.RandomState(1)
+    a_values, b_values = rng.exponential(0.01, 1000), rng.exponential(1.0, 1000)
+    a = QuantileSketch()
+    a.update(a_values)
+    b = QuantileSketch()
+    b.update(b_values)
+    a.merge(b)
+    both = QuantileSketch()
+    both.update(np.concatenate((a_values, b_values)))
+    assert a.offset == both.offset
+    np.testing.assert_array_equal(a.counts, both.counts)
+
+def test_folding_keeps_high_quantiles():
+    values = np.random.RandomState(2).lognormal(0, 0.5, 10000)
+    sketch = QuantileSketch(accuracy=0.01, max_bins=100)
+    sketch.update(values)
+    assert len(sketch.counts) == 100 and sketch.count == len(values)
+    # 100 bins cover a factor of about 7 down from the largest value
+    assert sketch.quantile(0.0) > values.min()
+    qs = np.array([0.9, 0.99, 1.0])
+    exact = exact_quantiles(values, qs)
+    assert (np.abs(sketch.quantiles(qs) - exact) / exact).max() <= 0.01
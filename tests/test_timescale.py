@@ -0,0 +1,39 @@
+import numpy as np
+
+from timescale import TimescalePyramid, time_buckets
+
+
+def naive_level(ts, weights, resolution):
+    buckets = np.floor(np.rint(ts * 1e6) / np.rint(resolution * 1e6)).astype(np.int64)
+    return np.bincount(buckets, weights)
+
+def test_pyramid_matches_naive_bincount():
+    rng = np.random.RandomState(0)
+    ts = np.sort(rng.rand(20000)) * 30
+    lost = rng.rand(len(ts)) < 0.1
+    pyramid = TimescalePyramid()
+    # uneven chunks, empty ones included
+    for chunk in np.array_split(np.arange(len(ts)), np.sort(rng.randint(0, len(ts), 40))):
+        pyramid.update(ts[chunk], lost[chunk])
+    end = int(time_buckets(ts[-1:], pyramid.bucket_us)[0]) + 1
+    for resolution in pyramid.resolutions + [0.5]:
+        times, counts = pyramid.level(resolution)
+        expected = naive_level(ts, lost, resolution)
+        assert counts.dtype == np.int64
+        np.testing.assert_array_equal(counts, expected)
+        np.testing.assert_allclose(times, np.arange(1, len(expected) + 1) * resolution)
+    assert pyramid.end == end
+
+def test_merge_adds_up_levels():
+    rng = np.random.RandomState(1)
+    short = np.sort(rng.rand(500)) * 2
+    long = np.sort(rng.rand(500)) * 20
+    a = TimescalePyramid()
+    a.update(short)
+    b = TimescalePyramid()
+    b.update(long)
+    a.merge(b)
+    both = np.concatenate((short, long))
+    for resolution in a.resolutions:
+        np.testing.assert_array_equal(a.level(resolution)[1],
+            naive_level(both, np.ones(len(both)), resolution))
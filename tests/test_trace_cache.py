@@ -0,0 +1,47 @@
+import os
+
+import numpy as np
+
+import trace_cache
+from captures import compress, conversation, write_pcap
+from pcap_reader import FIELDS, read_trace
+from trace_cache import entry_dir, file_hash, load_or_decode, load_trace, save_trace
+
+
+def write_dump(tmpdir):
+    client, _ = conversation(segments=100)
+    path = os.path.join(str(tmpdir), "client.pcap")
+    write_pcap(path, client)
+    return compress(path)
+
+def test_cache_round_trip(tmpdir):
+    dump = write_dump(tmpdir)
+    cache_dir = str(tmpdir.join("traces"))
+    assert load_trace(cache_dir, dump) is None
+    decoded = load_or_decode(cache_dir, dump)
+    cached = load_trace(cache_dir, dump)
+    expected = read_trace(dump)
+    for field in FIELDS:
+        assert isinstance(cached[field], np.memmap)
+        np.testing.assert_array_equal(decoded[field], expected[field])
+        np.testing.assert_array_equal(cached[field], expected[field])
+        assert cached[field].dtype == expected[field].dtype
+
+def test_empty_trace_round_trip(tmpdir):
+    dump = str(tmpdir.join("empty.pcap.zst"))
+    with open(dump, "wb") as f:
+        f.write(b"not a capture")
+    cache_dir = str(tmpdir.join("traces"))
+    save_trace(cache_dir, dump, {f: np.zeros(0, dtype=np.uint32) for f in FIELDS})
+    assert all(len(c) == 0 for c in load_trace(cache_dir, dump).values())
+
+def test_stale_cache_is_not_loaded(tmpdir, monkeypatch):
+    dump = write_dump(tmpdir)
+    cache_dir = str(tmpdir.join("traces"))
+    load_or_decode(cache_dir, dump)
+    monkeypatch.setattr(trace_cache, "CACHE_VERSION", trace_cache.CACHE_VERSION + 1)
+    assert load_trace(cache_dir, dump) is None
+    monkeypatch.undo()
+    # a partly written entry has no meta.json
+    os.remove(os.path.join(entry_dir(cache_dir, file_hash(dump)), "meta.json"))
+    assert load_trace(cache_dir, dump) is None
@@ -0,0 +1,30 @@
+import numpy as np
+
+from trials import average_hist, stack_trials, trial_stats
+
+
+def test_stack_trials_pads_shorter_trials():
+    stacked = stack_trials([[1, 2, 3], [4], []], fill=-1)
+    np.testing.assert_array_equal(stacked, [[1, 2, 3], [4, -1, -1], [-1, -1, -1]])
+
+def test_average_hist_counts_missing_values_as_zero():
+    assert average_hist([{1: 4, 2: 2}, {1: 2, 5: 4}]) == {1: 3.0, 2: 1.0, 5: 2.0}
+    assert average_hist([]) == {}
+
+def test_trial_stats():
+    rng = np.random.RandomState(0)
+    stacked = rng.normal(10, 2, size=(30, 4))
+    stats = trial_stats(stacked)
+    np.testing.assert_allclose(stats.mean, stacked.mean(axis=0))
+    np.testing.assert_allclose(stats.median, np.median(stacked, axis=0))
+    assert (stats.low <= stats.median).all() and (stats.median <= stats.high).all()
+    assert (stats.ci_low < stats.mean).all() and (stats.mean < stats.ci_high).all()
+    # the confidence interval of the mean is narrower than the spread of the trials
+    assert ((stats.ci_high - stats.ci_low) < (stats.high - stats.low)).all()
+    # seeded, so graphs come out the same every run
+    np.testing.assert_array_equal(trial_stats(stacked).ci_low, stats.ci_low)
+
+def test_trial_stats_of_identical_trials_has_no_spread():
+    stats = trial_stats(np.tile([1.0, 5.0], (5, 1)))
+    for column in stats:
+        np.testing.assert_allclose(column, [1.0, 5.0])
@@ -0,0 +1,28 @@
+import numpy as np
+
+from windowed import WindowedPercentiles, nearest_rank
+
+
+def test_windows_match_naive_percentiles():
+    rng = np.random.RandomState(0)
+    times = np.sort(rng.rand(5000)) * 10
+    # nothing in the 4th second
+    times = times[(times < 3) | (times >= 4)]
+    values = rng.exponential(0.02, len(times))
+    windowed = WindowedPercentiles(1.0, [50, 95, 99])
+    for chunk in np.array_split(np.arange(len(times)), 17):
+        windowed.update(times[chunk], values[chunk])
+    starts, rows, counts = windowed.result()
+    np.testing.assert_allclose(starts, np.arange(10))
+    for window in range(10):
+        in_window = values[np.floor(times).astype(np.int64) == window]
+        assert counts[window] == len(in_window)
+        if len(in_window) == 0:
+            assert np.isnan(rows[window]).all()
+        else:
+            np.testing.assert_array_equal(rows[window],
+                nearest_rank(np.sort(in_window), [50, 95, 99]))
+
+def test_nearest_rank():
+    values = np.arange(1, 101, dtype=np.float64)
+    np.testing.assert_array_equal(nearest_rank(values, [1, 50, 99, 100]), [1, 50, 99, 100])